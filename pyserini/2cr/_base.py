@@ -17,6 +17,8 @@
 import os
 import subprocess
 
+from pyserini.eval.evaluator import evaluate_trec_eval_args
+
 fail_str = '\033[91m[FAIL]\033[0m'
 ok_str = '[OK]'
 okish_str = '\033[94m[OKish]\033[0m'
@@ -37,7 +39,12 @@ def run_eval_and_return_metric(metric, eval_key, defs, runfile, display_command=
     if display_command:
         print(f'\n```bash\n{eval_cmd}\n```\n')
 
-    eval_stdout, eval_stderr = run_command(eval_cmd)
+    # Evaluate in-process when possible, rather than starting a Python interpreter and a JVM for each metric.
+    results = evaluate_trec_eval_args(defs.split() + [eval_key, runfile])
+    if results is not None:
+        eval_stdout = '\n'.join(results[0] + results[1])
+    else:
+        eval_stdout, eval_stderr = run_command(eval_cmd)
 
     for line in eval_stdout.split('\n'):
         parts = line.split('\t')
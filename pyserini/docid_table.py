@@ -0,0 +1,146 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Memory-mapped, lazily-decoded docid tables for dense indexes.
+
+A dense index stores its docids in a plain-text ``docid`` file, one docid per line, in the same order as the vectors.
+Next to it, ``docid.offsets.npy`` holds the byte offset at which each line starts (plus the file size), so that both
+files can be memory-mapped and ``table[i]`` decodes a single line on demand instead of materializing millions of
+Python strings up front. Indexes without the offsets file are still readable: the offsets are then computed with a
+single vectorized scan of the mapped ``docid`` file.
+"""
+
+import mmap
+import os
+from collections.abc import Sequence
+from typing import Iterable, List
+
+import numpy as np
+
+DOCID_OFFSETS_SUFFIX = '.offsets.npy'
+
+
+def compute_docid_offsets(data) -> np.ndarray:
+    """Compute the start offset of each line in ``data`` (a buffer of newline-separated docids), followed by the
+    end of the buffer."""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == ord('\n')).astype(np.int64)
+    starts = np.concatenate(([0], newlines + 1))
+    if len(buffer) == 0 or buffer[-1] == ord('\n'):
+        # No partial line after the last newline.
+        starts = starts[:-1]
+    return np.concatenate((starts, [len(buffer)])).astype(np.int64)
+
+
+def write_docid_offsets(docid_path: str) -> str:
+    """Write the offsets file for the plain-text docid file at ``docid_path``.
+
+    Parameters
+    ----------
+    docid_path : str
+        Path to a ``docid`` file with one docid per line.
+
+    Returns
+    -------
+    str
+        Path of the written offsets file.
+    """
+    with open(docid_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            offsets = compute_docid_offsets(b'')
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                offsets = compute_docid_offsets(data)
+
+    offsets_path = docid_path + DOCID_OFFSETS_SUFFIX
+    tmp_path = f'{offsets_path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, offsets)
+    os.replace(tmp_path, offsets_path)
+    return offsets_path
+
+
+def write_docids(docid_path: str, docids: Iterable[str]):
+    """Write ``docids`` to a plain-text docid file along with its offsets file."""
+    with open(docid_path, 'w') as f:
+        for docid in docids:
+            f.write(f'{docid}\n')
+    write_docid_offsets(docid_path)
+
+
+class DocidTable(Sequence):
+    """Read-only, memory-mapped view over a ``docid`` file. Docids are decoded lazily on access.
+
+    Parameters
+    ----------
+    docid_path : str
+        Path to a ``docid`` file with one docid per line.
+    """
+
+    def __init__(self, docid_path: str):
+        self.docid_path = docid_path
+        with open(docid_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b''
+        self._offsets = self._load_offsets(size)
+
+    def _load_offsets(self, size: int) -> np.ndarray:
+        offsets_path = self.docid_path + DOCID_OFFSETS_SUFFIX
+        if os.path.exists(offsets_path):
+            offsets = np.load(offsets_path, mmap_mode='r')
+            # Ignore a stale offsets file, e.g., if the docid file was rewritten without it.
+            if len(offsets) > 0 and offsets[-1] == size:
+                return offsets
+        return compute_docid_offsets(self._data)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _get(self, idx: int) -> str:
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return self._data[start:end].decode('utf-8').rstrip()
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._get(i) for i in range(*idx.indices(len(self)))]
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('docid index out of range')
+        return self._get(idx)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def take(self, indexes) -> List[str]:
+        """Decode the docids at ``indexes``, an iterable of ints or an integer array."""
+        indexes = np.asarray(indexes, dtype=np.int64).ravel()
+        if len(indexes) > 0 and not (-len(self) <= indexes.min() and indexes.max() < len(self)):
+            raise IndexError('docid index out of range')
+        indexes = indexes % max(len(self), 1)
+        # Gather all offsets with two vectorized lookups instead of two memmap scalar lookups per docid.
+        starts = np.asarray(self._offsets[indexes]).tolist()
+        ends = np.asarray(self._offsets[indexes + 1]).tolist()
+        data = self._data
+        return [data[start:end].decode('utf-8').rstrip() for start, end in zip(starts, ends)]
+
+    def close(self):
+        """Unmap the docid file."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
@@ -17,7 +17,9 @@
 import traceback
 
 # This has to be first, otherwise we'll get circular import errors
-from ._base import QueryEncoder, DocumentEncoder, JsonlCollectionIterator, JsonlRepresentationWriter
+from ._base import QueryEncoder, DocumentEncoder, JsonlCollectionIterator, JsonlRepresentationWriter, NumpyRepresentationWriter, \
+    EncodingPipeline
+from ._query_cache import QueryEmbeddingCache, query_encoder_identity
 
 # Then import these...
 from ._aggretriever import AggretrieverDocumentEncoder, AggretrieverQueryEncoder
@@ -20,7 +20,7 @@ import sys
 from pyserini.encode import AutoDocumentEncoder
 from pyserini.encode import document_encoder_class_map, MMEB_IMPORT_ERROR
 from pyserini.encode import OPENAI_API_RETRY_DELAY
-from pyserini.encode import JsonlRepresentationWriter, JsonlCollectionIterator
+from pyserini.encode import JsonlRepresentationWriter, NumpyRepresentationWriter, JsonlCollectionIterator, EncodingPipeline
 from pyserini.util import resolve_device
 
 
@@ -106,10 +106,19 @@ if __name__ == '__main__':
     input_parser.add_argument('--delimiter', help='delimiter for the fields', default='\n', required=False)
     input_parser.add_argument('--shard-id', type=int, help='shard-id 0-based', default=0, required=False)
     input_parser.add_argument('--shard-num', type=int, help='number of shards', default=1, required=False)
+    input_parser.add_argument('--streaming', action='store_true', default=False,
+                              help='read the corpus lazily with constant memory; shards are split by byte ranges',
+                              required=False)
 
     output_parser = commands.add_parser('output')
     output_parser.add_argument('--embeddings', type=str, help='directory to store encoded corpus', required=True)
     output_parser.add_argument('--to-faiss', action='store_true', default=False)
+    output_parser.add_argument('--to-npy', action='store_true', default=False,
+                               help='store embeddings as sharded .npy files with a separate docid file')
+    output_parser.add_argument('--npy-dtype', type=str, default='float32', choices=['float32', 'float16'],
+                               help='storage type of the vectors with --to-npy')
+    output_parser.add_argument('--npy-shard-size', type=int, default=1000000,
+                               help='maximum number of vectors per .npy shard')
 
     encoder_parser = commands.add_parser('encoder')
     encoder_parser.add_argument('--encoder', type=str, help='encoder name or path', required=True)
@@ -131,6 +140,13 @@ if __name__ == '__main__':
     encoder_parser.add_argument('--use-openai', help='use OpenAI text-embedding-ada-002 to retreive embeddings', action='store_true', default=False)
     encoder_parser.add_argument('--rate-limit', type=int, help='rate limit of the requests per minute for OpenAI embeddings', default=3500, required=False)
     encoder_parser.add_argument('--explicit-truncate', action='store_true', default=False, required=False)
+    encoder_parser.add_argument('--pipeline', action='store_true', default=False,
+                                help='overlap reading and tokenization, encoding, and writing in separate threads',
+                                required=False)
+    encoder_parser.add_argument('--pipeline-workers', type=int, default=1,
+                                help='number of tokenization threads in pipeline mode', required=False)
+    encoder_parser.add_argument('--pipeline-queue-size', type=int, default=4,
+                                help='maximum number of batches queued between pipeline stages', required=False)
 
     args = parse_args(parser, commands)
     delimiter = args.input.delimiter.replace("\\n", "\n")  # argparse would add \ prior to the passed '\n\n'
@@ -139,28 +155,40 @@ if __name__ == '__main__':
     if args.output.to_faiss:
         from pyserini.encode.optional import FaissRepresentationWriter
         embedding_writer = FaissRepresentationWriter(args.output.embeddings, dimension=args.encoder.dimension)
+    elif args.output.to_npy:
+        embedding_writer = NumpyRepresentationWriter(args.output.embeddings, dtype=args.output.npy_dtype,
+                                                     shard_size=args.output.npy_shard_size)
     else:
         embedding_writer = JsonlRepresentationWriter(args.output.embeddings)
-    collection_iterator = JsonlCollectionIterator(args.input.corpus, args.input.fields, args.input.docid_field, delimiter)
+    collection_iterator = JsonlCollectionIterator(args.input.corpus, args.input.fields, args.input.docid_field, delimiter,
+                                                  streaming=args.input.streaming)
 
     if args.encoder.use_openai:
         batch_size = int(args.encoder.rate_limit / (60 / OPENAI_API_RETRY_DELAY))
     else:
         batch_size = args.encoder.batch_size
     
+    def encode_kwargs(batch_info):
+        kwargs = {
+            'fp16': args.encoder.fp16,
+            'max_length': args.encoder.max_length,
+            'add_sep': args.encoder.add_sep,
+        }
+        # Prepare input_kwargs for the encoder
+        if not args.encoder.multimodal:
+            kwargs['texts'] = batch_info['text'] # pyserini text encoders takes 'texts' as default input
+        for field_name in args.encoder.fields:
+            kwargs[f'{field_name}s'] = batch_info[field_name]
+        return kwargs
+
     with embedding_writer:
-        for batch_info in collection_iterator(batch_size, args.input.shard_id, args.input.shard_num):
-            kwargs = {
-                'fp16': args.encoder.fp16,
-                'max_length': args.encoder.max_length,
-                'add_sep': args.encoder.add_sep,
-            }
-            # Prepare input_kwargs for the encoder
-            if not args.encoder.multimodal:
-                kwargs['texts'] = batch_info['text'] # pyserini text encoders takes 'texts' as default input
-            for field_name in args.encoder.fields:
-                kwargs[f'{field_name}s'] = batch_info[field_name] 
-            
-            embeddings = encoder.encode(**kwargs)
-            batch_info['vector'] = embeddings
-            embedding_writer.write(batch_info, args.input.fields)
+        batches = collection_iterator(batch_size, args.input.shard_id, args.input.shard_num)
+        if args.encoder.pipeline:
+            pipeline = EncodingPipeline(encoder, embedding_writer, num_workers=args.encoder.pipeline_workers,
+                                        queue_size=args.encoder.pipeline_queue_size)
+            pipeline.run(batches, encode_kwargs, args.input.fields)
+        else:
+            for batch_info in batches:
+                embeddings = encoder.encode(**encode_kwargs(batch_info))
+                batch_info['vector'] = embeddings
+                embedding_writer.write(batch_info, args.input.fields)
@@ -129,22 +129,25 @@ class AnceQueryEncoder(QueryEncoder):
         if (not self.has_model) and (not self.has_encoded_queries):
             raise Exception('Neither query encoder model nor encoded queries provided. Please provide at least one.')
 
+    @torch.inference_mode()
     def encode(self, query: str):
         if self.has_model:
-            inputs = self.tokenizer(
-                [query],
-                max_length=64,
-                padding='longest',
-                truncation=True,
-                add_special_tokens=True,
-                return_tensors='pt'
-            )
-            inputs.to(self.device)
-            embeddings = self.model(inputs["input_ids"]).detach().cpu().numpy()
-            return embeddings.flatten()
+            return self._encode_batch([query]).flatten()
         else:
             return super().encode(query)
 
+    def _encode_batch(self, queries: List[str]):
+        inputs = self.tokenizer(
+            queries,
+            max_length=64,
+            padding='longest',
+            truncation=True,
+            add_special_tokens=True,
+            return_tensors='pt'
+        )
+        inputs.to(self.device)
+        return self.model(inputs["input_ids"]).detach().cpu().numpy()
+
     def prf_encode(self, query: str):
         if self.has_model:
             inputs = self.tokenizer(
@@ -15,6 +15,7 @@
 #
 
 import numpy as np
+import torch
 from sklearn.preprocessing import normalize
 from transformers import AutoModel
 
@@ -33,6 +34,9 @@ class AutoDocumentEncoder(DocumentEncoder):
         self.prefix = prefix
 
     def encode(self, texts, titles=None, max_length=256, add_sep=False, **kwargs):
+        return self.encode_tokenized(self.tokenize(texts=texts, titles=titles, max_length=max_length, add_sep=add_sep))
+
+    def tokenize(self, texts, titles=None, max_length=256, add_sep=False, **kwargs):
         if self.prefix is not None:
             texts = [f'{self.prefix} {text}' for text in texts]
         shared_tokenizer_kwargs = dict(
@@ -54,13 +58,16 @@ class AutoDocumentEncoder(DocumentEncoder):
             else:
                 input_kwargs["text"] = texts
 
-        inputs = self.tokenizer(**input_kwargs, **shared_tokenizer_kwargs)
+        return self.tokenizer(**input_kwargs, **shared_tokenizer_kwargs)
+
+    def encode_tokenized(self, inputs):
         inputs.to(self.device)
-        outputs = self.model(**inputs)
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
         if self.pooling == "mean":
-            embeddings = self._mean_pooling(outputs[0], inputs['attention_mask']).detach().cpu().numpy()
+            embeddings = self._mean_pooling(outputs[0], inputs['attention_mask']).cpu().numpy()
         else:
-            embeddings = outputs[0][:, 0, :].detach().cpu().numpy()
+            embeddings = outputs[0][:, 0, :].cpu().numpy()
         if self.l2_norm:
             embeddings = normalize(embeddings, axis=1, norm='l2')
         return embeddings
@@ -82,21 +89,26 @@ class AutoQueryEncoder(QueryEncoder):
         if (not self.has_model) and (not self.has_encoded_queries):
             raise Exception('Neither query encoder model nor encoded queries provided. Please provide at least one.')
 
+    def _tokenize(self, queries, max_length: int = None):
+        if self.prefix:
+            queries = [f'{self.prefix} {query}' for query in queries]
+        tokenizer_kwargs = dict(
+            add_special_tokens=True,
+            return_tensors='pt',
+            padding='longest',
+            return_token_type_ids=False,
+            truncation=True,
+        )
+        if max_length is not None:
+            tokenizer_kwargs['max_length'] = max_length
+        inputs = self.tokenizer(queries, **tokenizer_kwargs)
+        inputs.to(self.device)
+        return inputs
+
+    @torch.inference_mode()
     def encode(self, query: str, max_length: int = None):
         if self.has_model:
-            if self.prefix:
-                query = f'{self.prefix} {query}'
-            tokenizer_kwargs = dict(
-                add_special_tokens=True,
-                return_tensors='pt',
-                padding='longest',
-                return_token_type_ids=False,
-                truncation=True,
-            )
-            if max_length is not None:
-                tokenizer_kwargs['max_length'] = max_length
-            inputs = self.tokenizer(query, **tokenizer_kwargs)
-            inputs.to(self.device)
+            inputs = self._tokenize([query], max_length)
             outputs = self.model(**inputs)[0].detach().cpu().numpy()
             if self.pooling == "mean":
                 embeddings = np.average(outputs, axis=-2)
@@ -107,3 +119,16 @@ class AutoQueryEncoder(QueryEncoder):
             return embeddings.flatten()
         else:
             return super().encode(query)
+
+    def _encode_batch(self, queries, max_length: int = None):
+        inputs = self._tokenize(queries, max_length)
+        outputs = self.model(**inputs)[0].cpu().numpy()
+        if self.pooling == "mean":
+            # Average over the real tokens only, as encode does for a single unpadded query.
+            mask = inputs['attention_mask'].cpu().numpy()[:, :, None].astype(outputs.dtype)
+            embeddings = (outputs * mask).sum(axis=-2) / mask.sum(axis=-2)
+        else:
+            embeddings = outputs[:, 0, :]
+        if self.l2_norm:
+            embeddings = normalize(embeddings, norm='l2')
+        return embeddings
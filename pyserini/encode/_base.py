@@ -16,7 +16,11 @@
 
 import json
 import os
+import queue
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 import numpy as np
 import pandas as pd
@@ -25,6 +29,7 @@ from tqdm import tqdm
 from transformers import AutoTokenizer, BertTokenizer, RobertaTokenizer
 from transformers.utils import cached_file
 
+from pyserini.docid_table import write_docid_offsets
 from pyserini.util import download_encoded_queries
 
 
@@ -76,6 +81,19 @@ class DocumentEncoder:
     def encode(self, texts, **kwargs):
         pass
 
+    def tokenize(self, **kwargs):
+        """Prepare the model inputs for a batch, taking the same keyword arguments as ``encode``.
+
+        Encoders that override this together with ``encode_tokenized`` let ``EncodingPipeline`` run tokenization in
+        worker threads while the model encodes the previous batch. By default the arguments are passed through
+        unchanged and all the work happens in ``encode_tokenized``.
+        """
+        return kwargs
+
+    def encode_tokenized(self, inputs):
+        """Encode a batch prepared by ``tokenize``."""
+        return self.encode(**inputs)
+
     @staticmethod
     def _mean_pooling(last_hidden_state, attention_mask):
         token_embeddings = last_hidden_state
@@ -86,9 +104,13 @@ class DocumentEncoder:
 
 
 class QueryEncoder:
+    # Default number of queries per forward pass in encode_batch.
+    batch_size = 32
+
     def __init__(self, encoded_queries_dir: str = None):
         self.has_model = False
         self.has_encoded_queries = False
+        self.encoded_queries_dir = encoded_queries_dir
         if encoded_queries_dir:
             self.embeddings = self._load_embeddings(encoded_queries_dir)
             self.has_encoded_queries = True
@@ -96,6 +118,47 @@ class QueryEncoder:
     def encode(self, query: str):
         return self.embeddings[query]
 
+    def encode_batch(self, queries: List[str], batch_size: int = None, **kwargs) -> List:
+        """Encode a list of queries, returning their encodings in the same order as ``encode`` would.
+
+        Encoders with a model that implement ``_encode_batch`` run it on padded mini-batches of ``batch_size``
+        queries (default: ``self.batch_size``) under ``torch.inference_mode``. Queries are sorted by length first, so
+        that queries of similar length share a mini-batch and little compute is spent on padding. Other encoders,
+        and pre-encoded queries, fall back to calling ``encode`` once per query.
+
+        Parameters
+        ----------
+        queries : List[str]
+            Query texts.
+        batch_size : int
+            Number of queries per forward pass.
+
+        Returns
+        -------
+        List
+            Encoding of each query: embedding rows for dense encoders, token weight dicts for sparse ones.
+        """
+        batched = type(self)._encode_batch is not QueryEncoder._encode_batch and getattr(self, 'has_model', True)
+        if not batched or not all(isinstance(query, str) for query in queries):
+            return [self.encode(**query) if isinstance(query, dict) else self.encode(query, **kwargs)
+                    for query in queries]
+
+        batch_size = max(1, int(batch_size or self.batch_size))
+        order = sorted(range(len(queries)), key=lambda i: len(queries[i]))
+        encoded = [None] * len(queries)
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                chunk = order[start:start + batch_size]
+                for i, encoding in zip(chunk, self._encode_batch([queries[i] for i in chunk], **kwargs)):
+                    encoded[i] = encoding
+        if encoded and isinstance(encoded[0], np.ndarray):
+            return np.stack(encoded)
+        return encoded
+
+    def _encode_batch(self, queries: List[str], **kwargs):
+        """Encode one padded mini-batch of queries with the model; overridden by encoders that support batching."""
+        raise NotImplementedError
+
     @classmethod
     def load_encoded_queries(cls, encoded_queries: str, verbose: bool = True):
         """Build a query encoder from encoded queries; download them if necessary.
@@ -134,7 +197,15 @@ class QueryEncoder:
 
 
 class JsonlCollectionIterator:
-    def __init__(self, collection_path: str, fields=None, docid_field=None, delimiter="\n"):
+    """Iterate over a jsonl corpus in batches.
+
+    By default, the whole corpus is parsed into memory up front and shards are assigned by document count. With
+    ``streaming=True``, files are read lazily and batches are yielded as lines are parsed, so memory stays constant
+    in the size of the corpus; each shard then covers a contiguous byte range of the (concatenated) corpus files and
+    only reads its own slice. Note that the two modes assign documents to shards differently.
+    """
+
+    def __init__(self, collection_path: str, fields=None, docid_field=None, delimiter="\n", streaming=False):
         # Assume multimodal input files are located in the same directory as the collection file
         if os.path.isdir(collection_path):
             self.collection_dir = collection_path
@@ -146,8 +217,22 @@ class JsonlCollectionIterator:
             self.fields = ['text']
         self.docid_field = docid_field
         self.delimiter = delimiter
-        self.all_info = self._load(collection_path)
-        self.size = len(self.all_info['id'])
+        self.streaming = streaming
+        self.filenames = self._get_filenames(collection_path)
+
+        # Added condition since some MBEIR datasets have missing fields
+        self._strict = not any("mbeir" in filename for filename in self.filenames)
+
+        # In Bright datasets, stripping trailing spaces drops the cosine similarity score of Pyserini's embeddings vs Diver embeddings to 0.87;
+        # we keep the trailing spaces in Bright datasets to maintain the original document contents.
+        self._strip_trailing_space = not any("bright" in filename for filename in self.filenames)
+
+        if streaming:
+            self.all_info = None
+            self.size = None
+        else:
+            self.all_info = self._load(collection_path)
+            self.size = len(self.all_info['id'])
         self.batch_size = 1
         self.shard_id = 0
         self.shard_num = 1
@@ -159,6 +244,9 @@ class JsonlCollectionIterator:
         return self
 
     def __iter__(self):
+        if self.streaming:
+            yield from self._iter_streaming()
+            return
         total_len = self.size
         shard_size = int(total_len / self.shard_num)
         start_idx = self.shard_id * shard_size
@@ -171,6 +259,42 @@ class JsonlCollectionIterator:
                 to_yield[key] = self.all_info[key][idx: min(idx + self.batch_size, end_idx)]
             yield to_yield
 
+    def _iter_streaming(self):
+        sizes = [os.path.getsize(filename) for filename in self.filenames]
+        total_size = sum(sizes)
+        shard_start = total_size * self.shard_id // self.shard_num
+        shard_end = total_size * (self.shard_id + 1) // self.shard_num
+
+        batch = self._empty_info()
+        file_start = 0
+        with tqdm(total=shard_end - shard_start, unit='B', unit_scale=True) as progress:
+            for filename, size in zip(self.filenames, sizes):
+                # Byte range of this file that falls into the shard; a line belongs to the shard holding its first byte.
+                lo = max(shard_start, file_start) - file_start
+                hi = min(shard_end, file_start + size) - file_start
+                file_start += size
+                if lo >= hi:
+                    continue
+
+                with open(filename, 'rb') as f:
+                    if lo > 0:
+                        # Skip the tail of a line that started in the previous shard.
+                        f.seek(lo - 1)
+                        f.readline()
+                    pos = f.tell()
+                    while pos < hi:
+                        line = f.readline()
+                        if not line:
+                            break
+                        self._append_info(batch, line, filename, f'byte offset {pos}')
+                        pos += len(line)
+                        progress.update(len(line))
+                        if len(batch['id']) == self.batch_size:
+                            yield batch
+                            batch = self._empty_info()
+        if batch['id']:
+            yield batch
+
     def _parse_fields_from_info(self, info, strict=True, strip_trailing_space=True):
         """
         :params info: dict, containing all fields as speicifed in self.fields either under 
@@ -203,51 +327,51 @@ class JsonlCollectionIterator:
         else:
             return [field for field in contents.split(self.delimiter)]
 
-    def _load(self, collection_path):
+    @staticmethod
+    def _get_filenames(collection_path):
         filenames = []
         if os.path.isfile(collection_path):
             filenames.append(collection_path)
         else:
             for filename in os.listdir(collection_path):
                 filenames.append(os.path.join(collection_path, filename))
+        return filenames
 
-        # Added condition since some MBEIR datasets have missing fields
-        strict = True
-        if any("mbeir" in filename for filename in filenames):
-            strict = False
+    def _empty_info(self):
+        info = {field: [] for field in self.fields}
+        info['id'] = []
+        return info
 
-        # In Bright datasets, stripping trailing spaces drops the cosine similarity score of Pyserini's embeddings vs Diver embeddings to 0.87;
-        # we keep the trailing spaces in Bright datasets to maintain the original document contents.
-        strip_trailing_space = True
-        if any("bright" in filename for filename in filenames):
-            strip_trailing_space = False
+    def _append_info(self, all_info, line, filename, location):
+        info = json.loads(line)
+        if self.docid_field:
+            _id = info.get(self.docid_field, None)
+        else:
+            _id = info.get('id', info.get('_id', info.get('docid', None)))
+        if _id is None:
+            raise ValueError(f"Cannot find f'`{self.docid_field if self.docid_field else '`id` or `_id` or `docid'}`' from {filename}.")
+        all_info['id'].append(str(_id))
+        fields_info = self._parse_fields_from_info(info, strict=self._strict,
+                                                   strip_trailing_space=self._strip_trailing_space)
+        if len(fields_info) != len(self.fields):
+            raise ValueError(
+                f"{len(fields_info)} fields are found at {location} in file {filename}." \
+                f"{len(self.fields)} fields expected." \
+                f"Line content: {info['contents']}"
+            )
+        for i in range(len(fields_info)):
+            if 'path' in self.fields[i]:
+                _info = fields_info[i]
+                if _info is not None and not _info.startswith(("http://", "https://")):
+                    fields_info[i] = os.path.join(self.collection_dir, fields_info[i])
+            all_info[self.fields[i]].append(fields_info[i])
 
-        all_info = {field: [] for field in self.fields}
-        all_info['id'] = []
-        for filename in filenames:
+    def _load(self, collection_path):
+        all_info = self._empty_info()
+        for filename in self.filenames:
             with open(filename) as f:
                 for line_i, line in tqdm(enumerate(f)):
-                    info = json.loads(line)
-                    if self.docid_field:
-                        _id = info.get(self.docid_field, None)
-                    else:
-                        _id = info.get('id', info.get('_id', info.get('docid', None)))
-                    if _id is None:
-                        raise ValueError(f"Cannot find f'`{self.docid_field if self.docid_field else '`id` or `_id` or `docid'}`' from {filename}.")
-                    all_info['id'].append(str(_id))
-                    fields_info = self._parse_fields_from_info(info, strict=strict, strip_trailing_space=strip_trailing_space)
-                    if len(fields_info) != len(self.fields):
-                        raise ValueError(
-                            f"{len(fields_info)} fields are found at Line#{line_i} in file {filename}." \
-                            f"{len(self.fields)} fields expected." \
-                            f"Line content: {info['contents']}"
-                        )
-                    for i in range(len(fields_info)):
-                        if 'path' in self.fields[i]:
-                            _info = fields_info[i]
-                            if _info is not None and not _info.startswith(("http://", "https://")):
-                                fields_info[i] = os.path.join(self.collection_dir, fields_info[i])
-                        all_info[self.fields[i]].append(fields_info[i])
+                    self._append_info(all_info, line, filename, f'Line#{line_i}')
         return all_info
 
 
@@ -284,7 +408,201 @@ class JsonlRepresentationWriter(RepresentationWriter):
             self.file.write(json.dumps({'id': batch_info['id'][i],
                                         'contents': contents,
                                         'vector': vector}) + '\n')
-            
+
+
+class NumpyRepresentationWriter(RepresentationWriter):
+    """Write dense representations as sharded ``.npy`` files next to a plain-text ``docid`` file.
+
+    Vectors are appended in their binary form to ``embeddings-00000.npy``, ``embeddings-00001.npy``, etc., with at
+    most ``shard_size`` rows per shard, so no float-to-text conversion is needed and the shards can be memory-mapped
+    with ``np.load(path, mmap_mode='r')``, e.g., by ``pyserini.index.faiss``. Document contents are not stored; use
+    ``JsonlRepresentationWriter`` for human-readable output.
+
+    Parameters
+    ----------
+    dir_path : str
+        Output directory.
+    dtype : str
+        Storage type of the vectors, ``float32`` or ``float16``.
+    shard_size : int
+        Maximum number of vectors per shard.
+    """
+
+    # Fixed size of the .npy header, which is written once the number of rows in a shard is known.
+    HEADER_SIZE = 128
+    SHARD_PATTERN = 'embeddings-{:05d}.npy'
+
+    def __init__(self, dir_path, dtype='float32', shard_size=1000000):
+        self.dir_path = dir_path
+        self.id_file_name = 'docid'
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float16, np.float32):
+            raise ValueError(f'Unsupported dtype {dtype}, expected float32 or float16.')
+        self.shard_size = shard_size
+        self.id_file = None
+        self.shard_file = None
+        self.shard_id = -1
+        self.shard_rows = 0
+        self.dimension = None
+
+    def __enter__(self):
+        if not os.path.exists(self.dir_path):
+            os.makedirs(self.dir_path)
+        self.id_file = open(os.path.join(self.dir_path, self.id_file_name), 'w')
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._close_shard()
+        self.id_file.close()
+        write_docid_offsets(os.path.join(self.dir_path, self.id_file_name))
+
+    def _open_shard(self):
+        self.shard_id += 1
+        self.shard_rows = 0
+        self.shard_file = open(os.path.join(self.dir_path, self.SHARD_PATTERN.format(self.shard_id)), 'wb')
+        self.shard_file.write(b'\x00' * self.HEADER_SIZE)
+
+    def _close_shard(self):
+        if self.shard_file is None:
+            return
+        header = repr({'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+                       'shape': (self.shard_rows, self.dimension)}).encode('latin1')
+        prefix = np.lib.format.magic(1, 0)
+        # Magic string, 2-byte header length, then the header dict padded with spaces and terminated by a newline.
+        padding = self.HEADER_SIZE - len(prefix) - 2 - len(header) - 1
+        self.shard_file.seek(0)
+        self.shard_file.write(prefix + (len(header) + padding + 1).to_bytes(2, 'little') + header + b' ' * padding + b'\n')
+        self.shard_file.close()
+        self.shard_file = None
+
+    def write(self, batch_info, fields=None):
+        vectors = np.asarray(batch_info['vector'], dtype=self.dtype)
+        if vectors.ndim != 2:
+            raise ValueError('NumpyRepresentationWriter only supports dense vectors.')
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(f'Expected vectors of dimension {self.dimension}, got {vectors.shape[1]}.')
+
+        for id_ in batch_info['id']:
+            self.id_file.write(f'{id_}\n')
+        start = 0
+        while start < len(vectors):
+            if self.shard_file is None or self.shard_rows == self.shard_size:
+                self._close_shard()
+                self._open_shard()
+            end = min(len(vectors), start + self.shard_size - self.shard_rows)
+            self.shard_file.write(np.ascontiguousarray(vectors[start:end]).tobytes())
+            self.shard_rows += end - start
+            start = end
+
+
+class EncodingPipeline:
+    """Overlap batch preparation, encoding, and writing of document representations.
+
+    A reader thread pulls batches from the collection iterator and hands them to a pool of workers that call
+    ``encoder.tokenize``; the calling thread runs ``encoder.encode_tokenized`` on the prepared batches in order; and a
+    writer thread drains the encoded batches into ``writer``. Both queues are bounded, so at most about
+    ``2 * queue_size + num_workers`` batches are held in memory at any time. The output is identical to encoding the
+    batches one after another.
+
+    Parameters
+    ----------
+    encoder : DocumentEncoder
+        Document encoder.
+    writer : RepresentationWriter
+        Opened representation writer.
+    num_workers : int
+        Number of tokenization worker threads.
+    queue_size : int
+        Maximum number of batches waiting in each queue.
+    """
+
+    _DONE = object()
+
+    def __init__(self, encoder: DocumentEncoder, writer: RepresentationWriter, num_workers: int = 1,
+                 queue_size: int = 4):
+        self.encoder = encoder
+        self.writer = writer
+        self.num_workers = max(1, num_workers)
+        self.queue_size = max(1, queue_size)
+
+    def run(self, batches, encode_kwargs, fields=None):
+        """Encode and write all batches.
+
+        Parameters
+        ----------
+        batches : iterable
+            Batches of document info, e.g., from ``JsonlCollectionIterator``.
+        encode_kwargs : callable
+            Maps the document info of a batch to the keyword arguments of ``encoder.encode``.
+        fields : List[str]
+            Fields passed on to ``writer.write``.
+        """
+        stop = threading.Event()
+        prepared = queue.Queue(maxsize=self.queue_size)
+        encoded = queue.Queue(maxsize=self.queue_size)
+        errors = []
+
+        def put(q, item):
+            # Give up once the pipeline is shutting down, so that no thread blocks forever on a full queue.
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def read(pool):
+            try:
+                for batch_info in batches:
+                    if stop.is_set():
+                        return
+                    put(prepared, (batch_info, pool.submit(lambda b: self.encoder.tokenize(**encode_kwargs(b)),
+                                                           batch_info)))
+            except BaseException as e:
+                errors.append(e)
+            put(prepared, self._DONE)
+
+        def write():
+            while True:
+                batch_info = encoded.get()
+                if batch_info is self._DONE:
+                    return
+                try:
+                    self.writer.write(batch_info, fields)
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+                    return
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            reader = threading.Thread(target=read, args=(pool,), daemon=True)
+            writer = threading.Thread(target=write, daemon=True)
+            reader.start()
+            writer.start()
+            try:
+                while not stop.is_set():
+                    try:
+                        item = prepared.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is self._DONE:
+                        break
+                    batch_info, future = item
+                    batch_info['vector'] = self.encoder.encode_tokenized(future.result())
+                    put(encoded, batch_info)
+            except BaseException:
+                stop.set()
+                raise
+            finally:
+                reader.join()
+                if writer.is_alive():
+                    encoded.put(self._DONE)
+                writer.join()
+        if errors:
+            raise errors[0]
+
+
 def load_head_weights(model, model_name, weight_map):
     """
     Load head weights from checkpoint for transformers 5.x compatibility.
@@ -28,6 +28,7 @@ class BprQueryEncoder(QueryEncoder):
                  encoded_queries_dir: str = None, device: str = 'cpu', **kwargs):
         self.has_model = False
         self.has_encoded_queries = False
+        self.encoded_queries_dir = encoded_queries_dir
 
         if encoded_queries_dir:
             self.embeddings = self._load_embeddings(encoded_queries_dir)
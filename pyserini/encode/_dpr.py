@@ -296,6 +296,7 @@ class DprQueryEncoder(QueryEncoder):
         if (not self.has_model) and (not self.has_encoded_queries):
             raise Exception('Neither query encoder model nor encoded queries provided. Please provide at least one')
 
+    @torch.inference_mode()
     def encode(self, query: str):
         if self.has_model:
             input_ids = self.tokenizer(query, return_tensors='pt')
@@ -304,3 +305,8 @@ class DprQueryEncoder(QueryEncoder):
             return embeddings.flatten()
         else:
             return super().encode(query)
+
+    def _encode_batch(self, queries):
+        inputs = self.tokenizer(queries, padding='longest', return_tensors='pt')
+        inputs.to(self.device)
+        return self.model(inputs["input_ids"], attention_mask=inputs["attention_mask"]).pooler_output.cpu().numpy()
@@ -0,0 +1,196 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text for use as a cache key by collapsing runs of whitespace."""
+    return ' '.join(query.split())
+
+
+# Encoder settings that change the encodings of a given model, and so are part of its identity.
+_ENCODER_SETTINGS = ('pooling', 'l2_norm', 'normalize', 'prefix', 'query_prefix', 'instruction_config')
+
+
+def query_encoder_identity(query_encoder) -> str:
+    """Identity of a query encoder, used to keep the cached embeddings of different encoders apart.
+
+    Encoders with a model are identified by their class, model, and the settings that change their encodings (pooling,
+    normalization, prefix, and max length). Pre-encoded encoders are identified by their encoded queries directory, or
+    failing that by the encoder object itself, so that no two of them share cache entries.
+    """
+    if isinstance(query_encoder, str):
+        return query_encoder
+    name = type(query_encoder).__name__
+    model = getattr(query_encoder, 'model', None)
+    tokenizer = getattr(query_encoder, 'tokenizer', None)
+    model_name = model if isinstance(model, str) else getattr(model, 'name_or_path', None)
+    if model_name is None:
+        model_name = getattr(tokenizer, 'name_or_path', None)
+    if model_name is None:
+        encoded_queries_dir = getattr(query_encoder, 'encoded_queries_dir', None)
+        if encoded_queries_dir:
+            return f'{name}:{os.path.abspath(encoded_queries_dir)}'
+        if getattr(query_encoder, 'has_encoded_queries', False):
+            return f'{name}@{id(query_encoder):x}'
+        return name
+    settings = [f'{key}={getattr(query_encoder, key)!r}' for key in _ENCODER_SETTINGS
+                if getattr(query_encoder, key, None) is not None]
+    max_length = getattr(query_encoder, 'max_length', getattr(tokenizer, 'model_max_length', None))
+    if max_length is not None:
+        settings.append(f'max_length={max_length!r}')
+    return ':'.join([name, str(model_name)] + settings)
+
+
+class QueryEmbeddingCache:
+    """Thread-safe, bounded LRU cache of query encodings, keyed on encoder identity and normalized query text.
+
+    Values are either dense embeddings (``np.ndarray``) or sparse encodings (``Dict[str, float]``) and must be treated
+    as read-only by callers. If ``path`` is given, the cache is loaded from that directory when it exists and written
+    back by ``save``; dense embeddings are stored as one ``.npy`` matrix per dimension and memory-mapped on load.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum number of cached encodings.
+    path : str
+        Optional directory to persist the cache to.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, max_size: int = 10000, path: Optional[str] = None):
+        self.max_size = max(1, int(max_size))
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(os.path.join(path, self.INDEX_FILE)):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, encoder_id: str, query: str):
+        """Return the cached encoding of ``query``, or ``None``."""
+        key = (encoder_id, normalize_query(query))
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, encoder_id: str, query: str, value):
+        key = (encoder_id, normalize_query(query))
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_encode(self, encoder_id: str, query: str, encode: Callable):
+        """Return the cached encoding of ``query``, calling ``encode(query)`` and caching its result on a miss."""
+        value = self.get(encoder_id, query)
+        if value is None:
+            # Encode outside the lock; concurrent misses on the same query just encode it twice.
+            value = encode(query)
+            self.put(encoder_id, query, value)
+        return value
+
+    def get_or_encode_batch(self, encoder_id: str, queries: List[str], encode_batch: Callable) -> List:
+        """Batch version of ``get_or_encode``: ``encode_batch`` is called once, with the queries that missed."""
+        values = [self.get(encoder_id, query) for query in queries]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            encoded = encode_batch([queries[i] for i in missing])
+            for i, value in zip(missing, encoded):
+                values[i] = value
+                self.put(encoder_id, queries[i], value)
+        return values
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'max_size': self.max_size}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self, path: Optional[str] = None):
+        """Write the cache to ``path`` (default: the path given at construction)."""
+        path = path or self.path
+        if path is None:
+            raise ValueError('No path to save the query embedding cache to.')
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            entries = list(self._entries.items())
+
+        index = []
+        groups: Dict[Tuple[int, str], List[np.ndarray]] = {}
+        files: Dict[Tuple[int, str], str] = {}
+        for (encoder_id, query), value in entries:
+            if isinstance(value, dict):
+                index.append({'encoder': encoder_id, 'query': query, 'sparse': value})
+                continue
+            vector = np.asarray(value)
+            key = (vector.size, vector.dtype.str)
+            if key not in groups:
+                groups[key] = []
+                files[key] = f'vectors-{len(files)}.npy'
+            index.append({'encoder': encoder_id, 'query': query, 'shape': list(vector.shape), 'file': files[key],
+                          'row': len(groups[key])})
+            groups[key].append(vector.reshape(-1))
+        # Replace files instead of overwriting them in place, since loaded entries may still map the old ones.
+        for key, vectors in groups.items():
+            tmp_path = os.path.join(path, f'{files[key]}.tmp{os.getpid()}')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.stack(vectors))
+            os.replace(tmp_path, os.path.join(path, files[key]))
+
+        tmp_path = os.path.join(path, f'{self.INDEX_FILE}.tmp{os.getpid()}')
+        with open(tmp_path, 'w') as f:
+            # Sparse weights may be numpy scalars.
+            json.dump(index, f, default=lambda o: o.item())
+        os.replace(tmp_path, os.path.join(path, self.INDEX_FILE))
+
+    def load(self, path: str):
+        """Load a cache written by ``save``, memory-mapping the dense embeddings."""
+        with open(os.path.join(path, self.INDEX_FILE)) as f:
+            index = json.load(f)
+        matrices = {}
+        with self._lock:
+            for entry in index[-self.max_size:]:
+                if 'sparse' in entry:
+                    value = entry['sparse']
+                else:
+                    if entry['file'] not in matrices:
+                        matrices[entry['file']] = np.load(os.path.join(path, entry['file']), mmap_mode='r')
+                    value = matrices[entry['file']][entry['row']].reshape(entry['shape'])
+                self._entries[(entry['encoder'], entry['query'])] = value
@@ -112,13 +112,17 @@ class SpladeQueryEncoder(QueryEncoder, SpladeEncoder):
         self.model.to(self.device)
         self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name or model_name_or_path, clean_up_tokenization_spaces=True)
 
+    @torch.inference_mode()
     def encode(self, text, max_length=256, **kwargs) -> Dict[str, float]:
-        inputs = self.tokenizer([text], max_length=max_length, padding='longest', truncation=True, add_special_tokens=True,
+        return self._encode_batch([text], max_length)[0]
+
+    def _encode_batch(self, texts: List[str], max_length=256, **kwargs) -> List[Dict[str, float]]:
+        inputs = self.tokenizer(texts, max_length=max_length, padding='longest', truncation=True, add_special_tokens=True,
                                 return_tensors='pt').to(self.device)
         input_ids = inputs['input_ids']
         input_attention = inputs['attention_mask']
-        batch_logits = self.model(input_ids)['logits']
+        batch_logits = self.model(input_ids, attention_mask=input_attention)['logits']
         batch_aggregated_logits, _ = torch.max(torch.log(1 + torch.relu(batch_logits)) * input_attention.unsqueeze(-1), dim=1)
         batch_aggregated_logits = batch_aggregated_logits.cpu().detach().numpy()
         raw_weights = self._output_to_weight_dicts(batch_aggregated_logits)
-        return self._get_encoded_query_token_wight_dicts(raw_weights)[0]
+        return self._get_encoded_query_token_wight_dicts(raw_weights)
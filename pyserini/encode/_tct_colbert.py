@@ -120,19 +120,25 @@ class TctColBertQueryEncoder(QueryEncoder):
         if (not self.has_model) and (not self.has_encoded_queries):
             raise Exception('Neither query encoder model nor encoded queries provided. Please provide at least one.')
 
+    @torch.inference_mode()
     def encode(self, query: str):
         if self.has_model:
-            max_length = 36  # hardcode for now
-            inputs = self.tokenizer(
-                '[CLS] [Q] ' + query + '[MASK]' * max_length,
-                max_length=max_length,
-                truncation=True,
-                add_special_tokens=False,
-                return_tensors='pt'
-            )
-            inputs.to(self.device)
-            outputs = self.model(**inputs)
-            embeddings = outputs.last_hidden_state.detach().cpu().numpy()
-            return np.average(embeddings[:, 4:, :], axis=-2).flatten()
+            return self._encode_batch([query]).flatten()
         else:
             return super().encode(query)
+
+    def _encode_batch(self, queries):
+        max_length = 36  # hardcode for now
+        # Every query is padded with [MASK] tokens and truncated to exactly max_length tokens, so batches need no
+        # further padding.
+        inputs = self.tokenizer(
+            ['[CLS] [Q] ' + query + '[MASK]' * max_length for query in queries],
+            max_length=max_length,
+            truncation=True,
+            add_special_tokens=False,
+            return_tensors='pt'
+        )
+        inputs.to(self.device)
+        outputs = self.model(**inputs)
+        embeddings = outputs.last_hidden_state.detach().cpu().numpy()
+        return np.average(embeddings[:, 4:, :], axis=-2)
@@ -163,15 +163,20 @@ class UniCoilQueryEncoder(QueryEncoder):
         self.weight_range = 5
         self.quant_range = 256
 
+    @torch.inference_mode()
     def encode(self, text, **kwargs):
+        return self._encode_batch([text])[0]
+
+    def _encode_batch(self, texts, **kwargs):
         max_length = 128  # hardcode for now
-        input_ids = self.tokenizer([text], max_length=max_length, padding='longest',
+        input_ids = self.tokenizer(texts, max_length=max_length, padding='longest',
                                    truncation=True, add_special_tokens=True,
                                    return_tensors='pt').to(self.device)["input_ids"]
+        # The model masks out [PAD] tokens itself, and _output_to_weight_dicts stops at the first one.
         batch_weights = self.model(input_ids).cpu().detach().numpy()
         batch_token_ids = input_ids.cpu().detach().numpy()
         raw_weights = self._output_to_weight_dicts(batch_token_ids, batch_weights)
-        return self._get_encoded_query_token_wight_dicts(raw_weights)[0]
+        return self._get_encoded_query_token_wight_dicts(raw_weights)
 
     def _output_to_weight_dicts(self, batch_token_ids, batch_weights):
         to_return = []
@@ -19,6 +19,7 @@ import os
 import faiss
 import numpy as np
 
+from pyserini.docid_table import write_docid_offsets
 from pyserini.encode._base import RepresentationWriter
 
 
@@ -38,6 +39,7 @@ class FaissRepresentationWriter(RepresentationWriter):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.id_file.close()
+        write_docid_offsets(os.path.join(self.dir_path, self.id_file_name))
         faiss.write_index(self.index, os.path.join(self.dir_path, self.index_name))
 
     def write(self, batch_info, fields=None):
@@ -0,0 +1,477 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+In-process evaluation of runs with the common measures of ``trec_eval``.
+
+Qrels are parsed once and cached, runs are read into arrays, and every measure is computed for all topics at once with
+NumPy, over a (topic, rank) matrix of relevance grades. Results are identical to ``trec_eval``'s, including its tie
+breaking, its handling of ``-c``, ``-M`` and ``-l``, and the order in which it sums values, so that
+:func:`pyserini.eval.trec_eval.trec_eval` uses this evaluator whenever it supports all the options it is given, and only
+falls back to the ``trec_eval`` binary otherwise.
+
+Example::
+
+    evaluator = TrecEvaluator('dl19-passage')
+    evaluator.evaluate('run.dl19.txt', ['map', 'ndcg_cut.10', 'recall.1000'], relevance_level=2)
+"""
+
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+
+# Measures in the order trec_eval prints them, with the default cutoffs of those that take cutoffs.
+_DEFAULT_CUTOFFS = [5, 10, 15, 20, 30, 100, 200, 500, 1000]
+MEASURES = OrderedDict([
+    ('num_q', None),
+    ('num_ret', None),
+    ('num_rel', None),
+    ('num_rel_ret', None),
+    ('map', None),
+    ('recip_rank', None),
+    ('P', _DEFAULT_CUTOFFS),
+    ('recall', _DEFAULT_CUTOFFS),
+    ('ndcg_cut', _DEFAULT_CUTOFFS),
+    ('success', [1, 5, 10]),
+])
+
+# Fraction of the top k results of each topic, in run order, that are judged; computed by Pyserini, not trec_eval.
+JUDGED = 'judged'
+
+
+def parse_measures(specs: Sequence[str]) -> Dict[str, Optional[List[int]]]:
+    """Parse ``trec_eval`` measure specifications, e.g., ``map``, ``ndcg_cut.10`` or ``recall.100,1000``.
+
+    Like ``trec_eval``, the cutoffs of a measure are those of its first specification with cutoffs, sorted.
+
+    Returns
+    -------
+    Dict[str, Optional[List[int]]]
+        Cutoffs of each measure, or ``None`` for measures without cutoffs.
+    """
+    measures = {}
+    defaults = set()
+    for spec in specs:
+        name, _, params = spec.partition('.')
+        if name not in MEASURES and name != JUDGED:
+            raise ValueError(f'Unsupported measure {spec}.')
+        if MEASURES.get(name) is None and name != JUDGED:
+            if params:
+                raise ValueError(f'Measure {name} takes no cutoffs.')
+            measures[name] = None
+        elif params:
+            measures.setdefault(name, sorted(set(int(cutoff) for cutoff in params.split(','))))
+        elif name == JUDGED:
+            raise ValueError(f'Measure {JUDGED} requires cutoffs.')
+        else:
+            defaults.add(name)
+    for name in defaults:
+        measures.setdefault(name, list(MEASURES[name]))
+    return measures
+
+
+def _read_columns(path: str, columns: List[str], column_types: Dict[str, pa.DataType]) -> pd.DataFrame:
+    """Read a whitespace-separated file, with pyarrow if its columns are separated by single spaces or tabs."""
+    for delimiter in [' ', '\t']:
+        try:
+            return pa_csv.read_csv(path, read_options=pa_csv.ReadOptions(column_names=columns),
+                                   parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+                                   convert_options=pa_csv.ConvertOptions(column_types=column_types)).to_pandas()
+        except pa.ArrowInvalid:
+            pass
+    dtypes = {column: 'str' for column, column_type in column_types.items() if pa.types.is_dictionary(column_type)}
+    df = pd.read_csv(path, sep=r'\s+', header=None, names=columns, dtype=dtypes, float_precision='round_trip')
+    return df.astype({column: 'category' for column in dtypes})
+
+
+@lru_cache(maxsize=16)
+def _load_qrels(path: str, mtime: int, size: int) -> pd.DataFrame:
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    qrels = _read_columns(path, ['topic', 'iteration', 'docid', 'relevance'],
+                          {'topic': dictionary, 'iteration': pa.string(), 'docid': dictionary,
+                           'relevance': pa.int64()})
+    return qrels[['topic', 'docid', 'relevance']]
+
+
+def load_qrels(qrels: str) -> pd.DataFrame:
+    """Load qrels, given their path or the name of a Pyserini qrels file, caching them for later calls.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns ``topic`` (categorical), ``docid`` and ``relevance``.
+    """
+    if not os.path.exists(qrels):
+        from pyserini.search import get_qrels_file
+        qrels = get_qrels_file(qrels)
+    stat = os.stat(qrels)
+    return _load_qrels(os.path.abspath(qrels), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=1)
+def _load_run(path: str, mtime: int, size: int) -> pd.DataFrame:
+    with open(path) as f:
+        first_line = f.readline()
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    if 'Q0' not in first_line:
+        # MS MARCO format: topic, docid, rank; trec_eval gets 1/rank as the scores.
+        run = _read_columns(path, ['topic', 'docid', 'rank'], {'topic': dictionary, 'docid': dictionary})
+        run['score'] = 1 / run['rank']
+    else:
+        run = _read_columns(path, ['topic', 'q0', 'docid', 'rank', 'score', 'tag'],
+                            {'topic': dictionary, 'q0': dictionary, 'docid': dictionary, 'rank': pa.string(),
+                             'score': pa.float64(), 'tag': dictionary})
+    return run[['topic', 'docid', 'score']]
+
+
+def load_run(run: str) -> pd.DataFrame:
+    """Load a run in TREC or MS MARCO format, caching the last run loaded.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns ``topic`` and ``docid`` (categorical), and ``score``, in the order of the file.
+    """
+    stat = os.stat(run)
+    return _load_run(os.path.abspath(run), stat.st_mtime_ns, stat.st_size)
+
+
+def _codes(values: pd.Series, index: pd.Index) -> np.ndarray:
+    """Position of each of ``values`` in ``index``, or -1."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        positions = index.get_indexer(values.cat.categories)
+        return np.append(positions, -1)[values.cat.codes.to_numpy()]
+    return index.get_indexer(values)
+
+
+def _sequential_sum(values: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Sum ``values`` one after the other, like trec_eval does, rather than pairwise like ``np.sum``."""
+    if values.shape[axis] == 0:
+        return np.zeros(np.delete(values.shape, axis))
+    return np.take(np.cumsum(values, axis=axis), -1, axis=axis)
+
+
+class TrecEvaluator:
+    """Evaluator of runs against fixed qrels.
+
+    Parameters
+    ----------
+    qrels : str
+        Path to qrels, or name of a Pyserini qrels file.
+    """
+
+    def __init__(self, qrels: str):
+        self.qrels = load_qrels(qrels)
+        if len(self.qrels) == 0:
+            raise ValueError('Qrels are empty.')
+        topics = self.qrels['topic'].cat.categories.astype(str)
+        # trec_eval compares topics and docids as byte strings, i.e., in code point order.
+        self.topics = pd.Index(sorted(topics))
+        self.docids = pd.Index(np.sort(self.qrels['docid'].cat.categories.to_numpy(dtype=object)))
+        self.qrels_topics = _codes(self.qrels['topic'], self.topics)
+        self.qrels_docids = _codes(self.qrels['docid'], self.docids)
+        self.qrels_keys = pd.Index(self.qrels_topics * len(self.docids) + self.qrels_docids)
+        if not self.qrels_keys.is_unique:
+            raise ValueError('Qrels contain duplicate docs.')
+        self.relevance = self.qrels['relevance'].to_numpy(dtype=np.int64)
+
+    def _relevance(self, run: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Topic of each result, as a position in ``self.topics`` or -1, and its relevance, or -1 if unjudged."""
+        topics = _codes(run['topic'].astype('category'), self.topics)
+        docids = _codes(run['docid'].astype('category'), self.docids)
+        positions = self.qrels_keys.get_indexer(np.where(docids >= 0, topics * len(self.docids) + docids, -1))
+        positions[(topics < 0) | (docids < 0)] = -1
+        return topics, np.where(positions >= 0, self.relevance[np.maximum(positions, 0)], -1), positions >= 0
+
+    def evaluate(self, run: str, measures: Sequence[str], relevance_level: int = 1, complete: bool = False,
+                 max_hits: Optional[int] = None, remove_unjudged: bool = False, per_query: bool = False):
+        """Evaluate a run.
+
+        Parameters
+        ----------
+        run : str
+            Path to the run, in TREC or MS MARCO format.
+        measures : Sequence[str]
+            ``trec_eval`` measures, e.g., ``map``, ``ndcg_cut.10`` or ``recall.100,1000``, and ``judged.k``.
+        relevance_level : int
+            Minimum relevance grade of relevant documents, i.e., ``trec_eval -l``.
+        complete : bool
+            Average over all topics of the qrels, with 0 for topics not in the run, i.e., ``trec_eval -c``.
+        max_hits : Optional[int]
+            Number of results of each topic to evaluate, i.e., ``trec_eval -M``.
+        remove_unjudged : bool
+            Whether to drop unjudged results first.
+        per_query : bool
+            Whether to return the values for each topic as well.
+
+        Returns
+        -------
+        Dict
+            Value of each measure, named like ``trec_eval`` names it, e.g., ``ndcg_cut_10``; with ``per_query``, a
+            dictionary from topic to value for each measure, with the average under ``all``.
+        """
+        results = self._evaluate(load_run(run), parse_measures(measures), relevance_level, complete, max_hits,
+                                 remove_unjudged)
+        if per_query:
+            return {name: {**per_topic, 'all': value} for name, per_topic, value in results}
+        return {name: value for name, _, value in results}
+
+    def trec_eval_lines(self, run: str, measures: Sequence[str], relevance_level: int = 1, complete: bool = False,
+                        max_hits: Optional[int] = None, remove_unjudged: bool = False,
+                        per_query: bool = False) -> Tuple[List[str], List[str]]:
+        """Evaluate a run like :meth:`evaluate`, and format the results like ``trec_eval`` prints them.
+
+        Returns
+        -------
+        Tuple[List[str], List[str]]
+            Lines of ``trec_eval`` measures, and lines of ``judged.k``.
+        """
+        results = self._evaluate(load_run(run), parse_measures(measures), relevance_level, complete, max_hits,
+                                 remove_unjudged)
+        lines = []
+        judged_lines = []
+        trec_eval_results = [result for result in results if not result[0].startswith(f'{JUDGED}_')]
+        if per_query:
+            topics = sorted(set(topic for _, per_topic, _ in trec_eval_results for topic in per_topic))
+            for topic in topics:
+                for name, per_topic, _ in trec_eval_results:
+                    if topic in per_topic:
+                        lines.append(self._format(name, topic, per_topic[topic]))
+        for name, _, value in results:
+            if name.startswith(f'{JUDGED}_'):
+                judged_lines.append(f'{name:22}\tall\t{value:.4f}')
+            else:
+                lines.append(self._format(name, 'all', value))
+        return lines, judged_lines
+
+    @staticmethod
+    def _format(name: str, topic: str, value) -> str:
+        if isinstance(value, (int, np.integer)):
+            return f'{name:22}\t{topic}\t{value}'
+        return f'{name:22}\t{topic}\t{value:6.4f}'
+
+    def _evaluate(self, run: pd.DataFrame, measures: Dict[str, Optional[List[int]]], relevance_level: int,
+                  complete: bool, max_hits: Optional[int], remove_unjudged: bool):
+        if len(run) == 0:
+            raise ValueError('Run is empty.')
+        topics, relevance, judged = self._relevance(run)
+        if remove_unjudged:
+            run = run[judged]
+            topics, relevance, judged = topics[judged], relevance[judged], judged[judged]
+
+        results = []
+        if any(name != JUDGED for name in measures):
+            results = self._evaluate_trec_eval(run, topics, relevance, measures, relevance_level, complete, max_hits)
+        if JUDGED in measures:
+            # The first k results of each topic in the order of the run, over all topics, even those without qrels.
+            positions = run.groupby(run['topic'].astype(str), sort=False, observed=True).cumcount().to_numpy()
+            for cutoff in measures[JUDGED]:
+                top = positions < cutoff
+                value = judged[top].sum() / top.sum() if top.any() else 0.0
+                results.append((f'{JUDGED}_{cutoff}', {}, float(value)))
+        return results
+
+    def _evaluate_trec_eval(self, run: pd.DataFrame, topics: np.ndarray, relevance: np.ndarray,
+                            measures: Dict[str, Optional[List[int]]], relevance_level: int, complete: bool,
+                            max_hits: Optional[int]):
+        # trec_eval only evaluates topics with qrels.
+        keep = topics >= 0
+        if not keep.any():
+            raise ValueError('No topics with both results and qrels.')
+        topics, relevance = topics[keep], relevance[keep]
+        scores = run['score'].to_numpy(dtype=np.float64)[keep]
+        # Docids by their position in code point order, sorting the distinct docids only.
+        run_docids = run['docid'].astype('category')
+        categories = run_docids.cat.categories.to_numpy(dtype=object)
+        category_positions = np.empty(len(categories), dtype=np.int64)
+        category_positions[np.argsort(categories)] = np.arange(len(categories))
+        docids = category_positions[run_docids.cat.codes.to_numpy()[keep]]
+
+        # Rank by score, breaking ties by docid in reverse order, like trec_eval. Runs usually list the results of each
+        # topic together by decreasing score, so the stable sorts by topic and by tie group are nearly free.
+        order = np.argsort(topics, kind='stable')
+        sorted_topics, sorted_scores = topics[order], scores[order]
+        same_topic = sorted_topics[1:] == sorted_topics[:-1]
+        if not np.all(~same_topic | (sorted_scores[1:] <= sorted_scores[:-1])):
+            by_score = np.argsort(-sorted_scores, kind='stable')
+            by_score = by_score[np.argsort(sorted_topics[by_score], kind='stable')]
+            order, sorted_topics, sorted_scores = order[by_score], sorted_topics[by_score], sorted_scores[by_score]
+            same_topic = sorted_topics[1:] == sorted_topics[:-1]
+        ties = np.cumsum(np.append(True, ~same_topic | (sorted_scores[1:] != sorted_scores[:-1])))
+        order = order[np.argsort(ties * len(categories) - docids[order], kind='stable')]
+        topics, relevance, docids = topics[order], relevance[order], docids[order]
+
+        num_topics = len(self.topics)
+        starts = np.searchsorted(topics, np.arange(num_topics))
+        counts = np.diff(np.append(starts, len(topics)))
+        ranks = np.arange(len(topics)) - starts[topics]
+        if max_hits is not None:
+            top = ranks < max_hits
+            topics, relevance, docids, ranks = topics[top], relevance[top], docids[top], ranks[top]
+            counts = np.minimum(counts, max_hits)
+        keys = pd.Index(topics * len(categories) + docids)
+        if not keys.is_unique:
+            raise ValueError('Run contains duplicate docs.')
+
+        # Evaluated topics: the topics of the run, or all topics of the qrels with complete.
+        evaluated = np.flatnonzero(counts > 0)
+        if len(evaluated) == 0:
+            raise ValueError('No topics with both results and qrels.')
+        # trec_eval fails to calculate any measure if the first evaluated topic only has negative judgments.
+        if self.relevance[self.qrels_topics == evaluated[0]].max() < 0:
+            raise ValueError(f'trec_eval cannot evaluate topic {self.topics[evaluated[0]]}.')
+        num_q = num_topics if complete else len(evaluated)
+        row_of_topic = np.full(num_topics, -1)
+        row_of_topic[evaluated] = np.arange(len(evaluated))
+        depth = int(counts.max()) if len(counts) else 0
+
+        # Relevance grade at each rank of each evaluated topic, with -1 for unjudged docs and past the results.
+        grades = np.full((len(evaluated), depth), -1, dtype=np.int64)
+        grades[row_of_topic[topics], ranks] = relevance
+        relevant = grades >= relevance_level
+        relevant_so_far = np.cumsum(relevant, axis=1)
+        rank_numbers = np.arange(1, depth + 1)
+
+        qrels_rows = row_of_topic[self.qrels_topics]
+        num_rel_of_topic = np.bincount(self.qrels_topics[self.relevance >= relevance_level], minlength=num_topics)
+        num_rel = num_rel_of_topic[evaluated]
+
+        def per_topic_values(values):
+            return {self.topics[topic]: value for topic, value in zip(evaluated, values.tolist())}
+
+        def average(values):
+            # Topics without results add 0 with complete.
+            return float(_sequential_sum(values) / num_q) if num_q else 0.0
+
+        results = []
+        for name in MEASURES:
+            if name not in measures:
+                continue
+            if name == 'num_q':
+                results.append((name, {}, num_q))
+            elif name == 'num_ret':
+                values = counts[evaluated]
+                results.append((name, per_topic_values(values), int(values.sum())))
+            elif name == 'num_rel':
+                # With complete, trec_eval counts the docs with positive grades of all topics, whatever the relevance
+                # level.
+                total = (self.relevance > 0).sum() if complete else num_rel.sum()
+                results.append((name, per_topic_values(num_rel), int(total)))
+            elif name == 'num_rel_ret':
+                values = relevant.sum(axis=1)
+                results.append((name, per_topic_values(values), int(values.sum())))
+            elif name == 'map':
+                precisions = np.where(relevant, relevant_so_far / rank_numbers, 0.0)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    values = np.where(num_rel > 0, _sequential_sum(precisions) / num_rel, 0.0)
+                results.append((name, per_topic_values(values), average(values)))
+            elif name == 'recip_rank':
+                first = np.argmax(relevant, axis=1) if depth else np.zeros(len(evaluated), dtype=np.int64)
+                values = np.where(relevant.any(axis=1), 1 / (first + 1), 0.0)
+                results.append((name, per_topic_values(values), average(values)))
+            elif name in ['P', 'recall', 'success']:
+                for cutoff in measures[name]:
+                    found = relevant_so_far[:, min(cutoff, depth) - 1] if depth else np.zeros(len(evaluated))
+                    if name == 'P':
+                        values = found / cutoff
+                    elif name == 'recall':
+                        with np.errstate(divide='ignore', invalid='ignore'):
+                            values = np.where(num_rel > 0, found / num_rel, 0.0)
+                    else:
+                        values = (found > 0).astype(np.float64)
+                    results.append((f'{name}_{cutoff}', per_topic_values(values), average(values)))
+            elif name == 'ndcg_cut':
+                max_cutoff = max(measures[name])
+                # Gains are the relevance grades, ignoring the relevance level; negative grades gain nothing.
+                gains = np.maximum(grades[:, :max_cutoff], 0).astype(np.float64)
+                dcg = np.cumsum(gains / np.log2(np.arange(gains.shape[1]) + 2.0), axis=1)
+
+                # Ideal gains: the positive grades of the qrels of each topic, from highest to lowest.
+                positive = (self.relevance > 0) & (qrels_rows >= 0)
+                ideal_rows, ideal_grades = qrels_rows[positive], self.relevance[positive]
+                ideal_order = np.lexsort((-ideal_grades, ideal_rows))
+                ideal_rows, ideal_grades = ideal_rows[ideal_order], ideal_grades[ideal_order]
+                ideal_ranks = np.arange(len(ideal_rows)) - np.searchsorted(ideal_rows, ideal_rows)
+                in_cutoff = ideal_ranks < max_cutoff
+                ideal_depth = min(max_cutoff, int(ideal_ranks.max()) + 1 if len(ideal_ranks) else 0)
+                ideal_gains = np.zeros((len(evaluated), ideal_depth))
+                ideal_gains[ideal_rows[in_cutoff], ideal_ranks[in_cutoff]] = ideal_grades[in_cutoff]
+                ideal_dcg = np.cumsum(ideal_gains / np.log2(np.arange(ideal_depth) + 2.0), axis=1)
+
+                for cutoff in measures[name]:
+                    values = dcg[:, min(cutoff, dcg.shape[1]) - 1] if dcg.shape[1] else np.zeros(len(evaluated))
+                    ideal = ideal_dcg[:, min(cutoff, ideal_depth) - 1] if ideal_depth else np.zeros(len(evaluated))
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        values = np.where(ideal > 0, values / ideal, values)
+                    results.append((f'{name}_{cutoff}', per_topic_values(values), average(values)))
+        return results
+
+
+def evaluate_trec_eval_args(args: Sequence[str]) -> Optional[Tuple[List[str], List[str]]]:
+    """Evaluate a run given ``trec_eval`` arguments, e.g., ``-c -M 100 -m map qrels run``, plus Pyserini's
+    ``-m judged.k`` and ``-remove-unjudged``.
+
+    Returns
+    -------
+    Optional[Tuple[List[str], List[str]]]
+        Lines of ``trec_eval`` measures and lines of ``judged.k``, as in :meth:`TrecEvaluator.trec_eval_lines`; or
+        ``None`` if the arguments include options or measures this evaluator does not support, missing files, or a run
+        or qrels that ``trec_eval`` rejects, e.g., with duplicate docs, so that the caller can fall back to
+        ``trec_eval`` itself.
+    """
+    args = list(args)
+    remove_unjudged = '-remove-unjudged' in args
+    if remove_unjudged:
+        args.remove('-remove-unjudged')
+    if len(args) < 2:
+        return None
+    qrels, run = args[-2], args[-1]
+    options = dict(relevance_level=1, complete=False, max_hits=None, remove_unjudged=remove_unjudged, per_query=False)
+    measures = []
+    i = 0
+    try:
+        while i < len(args) - 2:
+            arg = args[i]
+            if arg == '-c':
+                options['complete'] = True
+            elif arg == '-q':
+                options['per_query'] = True
+            elif arg in ['-m', '-M', '-l'] and i + 1 < len(args) - 2:
+                i += 1
+                if arg == '-m':
+                    measures.append(args[i])
+                elif arg == '-M':
+                    options['max_hits'] = int(args[i])
+                else:
+                    options['relevance_level'] = int(args[i])
+            else:
+                return None
+            i += 1
+        # Without measures, trec_eval computes its default set.
+        if not measures:
+            return None
+        parse_measures(measures)
+        if not os.path.exists(run):
+            return None
+        return TrecEvaluator(qrels).trec_eval_lines(run, measures, **options)
+    except (ValueError, FileNotFoundError):
+        return None
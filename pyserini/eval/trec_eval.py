@@ -57,15 +57,16 @@ import jnius
 # Now we can load qrels; this will trigger another attempt to reload the JVM, which won't happen because
 # the JVM has already loaded.
 from pyserini.search import get_qrels_file
+from pyserini.eval.evaluator import evaluate_trec_eval_args
 
 
-def trec_eval(
-    args, query_id=None, return_per_query_results=False
-) -> float | dict[Any, float]:
-    cmd_prefix = ['java', '-cp', jar_path, 'trec_eval']
+def _run_trec_eval(args) -> tuple[str, list[str], bool]:
+    """Run the ``trec_eval`` binary, computing ``judged.k`` and handling ``-remove-unjudged`` in Python.
 
-    if return_per_query_results or query_id:
-        assert '-q' in args, 'The "-q" is required for returning per query results.'
+    Returns the output of ``trec_eval``, the lines of ``judged.k``, and whether any measures other than ``judged.k``
+    were requested.
+    """
+    cmd_prefix = ['java', '-cp', jar_path, 'trec_eval']
 
     # Option to discard non-judged hits in run file
     judged_docs_only = ''
@@ -146,6 +147,29 @@ def trec_eval(
         print(stderr.decode("utf-8"), file=sys.stderr)
 
     output = stdout.decode("utf-8").rstrip()
+
+    if temp_file:
+        os.remove(temp_file)
+
+    return output, judged_result, non_judge_k_metrics
+
+
+def trec_eval(
+    args, query_id=None, return_per_query_results=False
+) -> float | dict[Any, float]:
+    if return_per_query_results or query_id:
+        assert '-q' in args, 'The "-q" is required for returning per query results.'
+
+    # Evaluate in-process whenever the evaluator supports all the options and measures, which avoids starting a JVM
+    # and reparsing the qrels on every call; otherwise, shell out to trec_eval.
+    results = evaluate_trec_eval_args(args[1:])
+    if results is not None:
+        lines, judged_result = results
+        output = '\n'.join(lines)
+        non_judge_k_metrics = bool(lines)
+    else:
+        output, judged_result, non_judge_k_metrics = _run_trec_eval(args)
+
     # Print trec_eval's stdout only when it contains metrics the user actually asked for.
     # Notes:
     # - 'judged.k' is a pseudo-metric computed in Python. We strip it (and its '-m') before
@@ -165,9 +189,6 @@ def trec_eval(
     for judged in judged_result:
         print(judged)
 
-    if temp_file:
-        os.remove(temp_file)
-
     if judged_result:
         results = output.split("\n") + judged_result if non_judge_k_metrics else judged_result
     else:
@@ -32,19 +32,21 @@ parser.add_argument('--alpha', type=float, default=0.5, required=False, help='Al
 parser.add_argument('--depth', type=int, default=1000, required=False, help='Pool depth per topic.')
 parser.add_argument('--k', type=int, default=1000, required=False, help='Number of documents to output per topic.')
 parser.add_argument('--resort', action='store_true', help='We resort the Trec run files or not')
+parser.add_argument('--threads', type=int, default=1, required=False, help='Number of threads to merge the runs with.')
 args = parser.parse_args()
 
 trec_runs = [TrecRun(filepath=path,resort=args.resort) for path in args.runs]
 
 fused_run = None
 if args.method == FusionMethod.RRF:
-    fused_run = reciprocal_rank_fusion(trec_runs, rrf_k=args.rrf_k, depth=args.depth, k=args.k)
+    fused_run = reciprocal_rank_fusion(trec_runs, rrf_k=args.rrf_k, depth=args.depth, k=args.k,
+                                       threads=args.threads)
 elif args.method == FusionMethod.INTERPOLATION:
-    fused_run = interpolation(trec_runs, alpha=args.alpha, depth=args.depth, k=args.k)
+    fused_run = interpolation(trec_runs, alpha=args.alpha, depth=args.depth, k=args.k, threads=args.threads)
 elif args.method == FusionMethod.AVERAGE:
-    fused_run = average(trec_runs, depth=args.depth, k=args.k)
+    fused_run = average(trec_runs, depth=args.depth, k=args.k, threads=args.threads)
 elif args.method == FusionMethod.NORMALIZE:
-    fused_run = normalize(trec_runs, depth=args.depth, k=args.k)
+    fused_run = normalize(trec_runs, depth=args.depth, k=args.k, threads=args.threads)
 else:
     raise NotImplementedError(f'Fusion method {args.method} not implemented.')
 
@@ -27,7 +27,8 @@ class FusionMethod(Enum):
     NORMALIZE = 'normalize'
 
 
-def reciprocal_rank_fusion(runs: List[TrecRun], rrf_k: int = 60, depth: int = None, k: int = None):
+def reciprocal_rank_fusion(runs: List[TrecRun], rrf_k: int = 60, depth: int = None, k: int = None,
+                           threads: int = 1):
     """Perform reciprocal rank fusion on a list of ``TrecRun`` objects. Implementation follows Cormack et al.
     (SIGIR 2009) paper titled "Reciprocal Rank Fusion Outperforms Condorcet and Individual Rank Learning Methods."
 
@@ -44,6 +45,8 @@ def reciprocal_rank_fusion(runs: List[TrecRun], rrf_k: int = 60, depth: int = No
     k : int
         Length of final results list.  Set to ``None`` by default, which indicates that the union of all input documents
         are ranked.
+    threads : int
+        Number of threads to merge the runs with.
 
     Returns
     -------
@@ -51,12 +54,13 @@ def reciprocal_rank_fusion(runs: List[TrecRun], rrf_k: int = 60, depth: int = No
         Output ``TrecRun`` that combines input runs via reciprocal rank fusion.
     """
 
-    # TODO: Add option to *not* clone runs, thus making the method destructive, but also more efficient.
-    rrf_runs = [run.clone().rescore(method=RescoreMethod.RRF, rrf_k=rrf_k) for run in runs]
-    return TrecRun.merge(rrf_runs, AggregationMethod.SUM, depth=depth, k=k)
+    # The runs are rescored into separate arrays, leaving them unchanged without cloning them.
+    scores = [run.get_rescored_scores(method=RescoreMethod.RRF, rrf_k=rrf_k) for run in runs]
+    return TrecRun.merge(runs, AggregationMethod.SUM, depth=depth, k=k, scores=scores, threads=threads)
 
 
-def interpolation(runs: List[TrecRun], alpha: int = 0.5, depth: int = None, k: int = None):
+def interpolation(runs: List[TrecRun], alpha: int = 0.5, depth: int = None, k: int = None,
+                  threads: int = 1):
     """Perform fusion by interpolation on a list of exactly two ``TrecRun`` objects.
     new_score = first_run_score * alpha + (1 - alpha) * second_run_score.
 
@@ -72,6 +76,8 @@ def interpolation(runs: List[TrecRun], alpha: int = 0.5, depth: int = None, k: i
     k : int
         Length of final results list.  Set to ``None`` by default, which indicates that the union of all input documents
         are ranked.
+    threads : int
+        Number of threads to merge the runs with.
 
     Returns
     -------
@@ -82,14 +88,13 @@ def interpolation(runs: List[TrecRun], alpha: int = 0.5, depth: int = None, k: i
     if len(runs) != 2:
         raise Exception('Interpolation must be performed on exactly two runs.')
 
-    scaled_runs = []
-    scaled_runs.append(runs[0].clone().rescore(method=RescoreMethod.SCALE, scale=alpha))
-    scaled_runs.append(runs[1].clone().rescore(method=RescoreMethod.SCALE, scale=(1-alpha)))
+    scores = [runs[0].get_rescored_scores(method=RescoreMethod.SCALE, scale=alpha),
+              runs[1].get_rescored_scores(method=RescoreMethod.SCALE, scale=(1-alpha))]
 
-    return TrecRun.merge(scaled_runs, AggregationMethod.SUM, depth=depth, k=k)
+    return TrecRun.merge(runs, AggregationMethod.SUM, depth=depth, k=k, scores=scores, threads=threads)
 
 
-def average(runs: List[TrecRun], depth: int = None, k: int = None):
+def average(runs: List[TrecRun], depth: int = None, k: int = None, threads: int = 1):
     """Perform fusion by averaging on a list of ``TrecRun`` objects.
 
     Parameters
@@ -102,6 +107,8 @@ def average(runs: List[TrecRun], depth: int = None, k: int = None):
     k : int
         Length of final results list.  Set to ``None`` by default, which indicates that the union of all input documents
         are ranked.
+    threads : int
+        Number of threads to merge the runs with.
 
     Returns
     -------
@@ -109,11 +116,11 @@ def average(runs: List[TrecRun], depth: int = None, k: int = None):
         Output ``TrecRun`` that combines input runs via averaging.
     """
 
-    scaled_runs = [run.clone().rescore(method=RescoreMethod.SCALE, scale=(1/len(runs))) for run in runs]
-    return TrecRun.merge(scaled_runs, AggregationMethod.SUM, depth=depth, k=k)
+    scores = [run.get_rescored_scores(method=RescoreMethod.SCALE, scale=(1/len(runs))) for run in runs]
+    return TrecRun.merge(runs, AggregationMethod.SUM, depth=depth, k=k, scores=scores, threads=threads)
 
 
-def normalize(runs: List[TrecRun], depth: int = None, k: int = None):
+def normalize(runs: List[TrecRun], depth: int = None, k: int = None, threads: int = 1):
     """Perform fusion by normalization on a list of ``TrecRun`` objects. Scores in each run are normalized
     to the range [0, 1] using min-max normalization before merging.
 
@@ -127,6 +134,8 @@ def normalize(runs: List[TrecRun], depth: int = None, k: int = None):
     k : int
         Length of final results list.  Set to ``None`` by default, which indicates that the union of all input documents
         are ranked.
+    threads : int
+        Number of threads to merge the runs with.
 
     Returns
     -------
@@ -134,5 +143,5 @@ def normalize(runs: List[TrecRun], depth: int = None, k: int = None):
         Output ``TrecRun`` that combines input runs via normalization.
     """
 
-    normalized_runs = [run.clone().rescore(method=RescoreMethod.NORMALIZE) for run in runs]
-    return TrecRun.merge(normalized_runs, AggregationMethod.SUM, depth=depth, k=k)
+    scores = [run.get_rescored_scores(method=RescoreMethod.NORMALIZE) for run in runs]
+    return TrecRun.merge(runs, AggregationMethod.SUM, depth=depth, k=k, scores=scores, threads=threads)
@@ -22,21 +22,175 @@ import shutil
 import faiss
 import numpy as np
 from tqdm import tqdm
+from pyserini.docid_table import write_docid_offsets
 from pyserini.util import resolve_device
 
+CHECKPOINT_INDEX = 'index.checkpoint'
+CHECKPOINT_STATE = 'checkpoint.json'
+JSONL_VECTORS = 'vectors.tmp'
+
+
+class IndexVectors:
+    """Array-like view over the vectors of a flat Faiss index; rows are reconstructed on demand."""
+
+    def __init__(self, index):
+        self.index = index
+        self.shape = (index.ntotal, index.d)
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self))
+            return self.index.reconstruct_n(start, max(0, stop - start))
+        return self.index.reconstruct_batch(np.asarray(key, dtype='int64'))
+
+
+def read_flat_index(path):
+    # Map the vectors of a flat index instead of loading them, if this version of Faiss supports it.
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', None)
+    if flags is not None:
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def convert_jsonl(input_dir, filenames, vectors_path, docid_path):
+    """Stream jsonl embeddings into a raw float32 file and a docid file, and memory-map the result."""
+    dim = None
+    with open(vectors_path, 'wb') as f_vectors, open(docid_path, 'w') as f_out:
+        for filename in tqdm(filenames):
+            path = os.path.join(input_dir, filename)
+            with open(path) as f_in:
+                for line in f_in:
+                    info = json.loads(line)
+                    vector = np.asarray(info['vector'], dtype='float32')
+                    dim = len(vector) if dim is None else dim
+                    f_out.write(f'{info["id"]}\n')
+                    f_vectors.write(vector.tobytes())
+    if dim is None:
+        return np.zeros((0, 0), dtype='float32')
+    return np.memmap(vectors_path, dtype='float32', mode='r').reshape(-1, dim)
+
+
+def load_shards(input_dir, output_dir):
+    """Write the docids of ``input_dir`` to ``output_dir`` and return its vectors as a list of array-like shards."""
+    input_files = sorted(os.listdir(input_dir))
+    npy_files = [filename for filename in input_files if filename.endswith('.npy') and filename != 'docid.offsets.npy']
+    docid_path = os.path.join(output_dir, 'docid')
+    if 'index' in input_files:
+        shutil.copy(os.path.join(input_dir, 'docid'), docid_path)
+        shards = [IndexVectors(read_flat_index(os.path.join(input_dir, 'index')))]
+    elif npy_files:
+        # Binary shards written by NumpyRepresentationWriter are memory-mapped rather than loaded.
+        shutil.copy(os.path.join(input_dir, 'docid'), docid_path)
+        shards = [np.load(os.path.join(input_dir, filename), mmap_mode='r') for filename in npy_files]
+    else:
+        shards = [convert_jsonl(input_dir, input_files, os.path.join(output_dir, JSONL_VECTORS), docid_path)]
+    write_docid_offsets(docid_path)
+    return shards
+
+
+def sample_vectors(shards, size, seed):
+    """Gather ``size`` vectors drawn uniformly at random (without replacement) across ``shards``, in index order."""
+    offsets = np.cumsum([0] + [len(shard) for shard in shards])
+    if size is None or size >= offsets[-1]:
+        ids = np.arange(offsets[-1])
+    else:
+        ids = np.sort(np.random.default_rng(seed).choice(offsets[-1], size=size, replace=False))
+    samples = []
+    for i, shard in enumerate(shards):
+        lo, hi = np.searchsorted(ids, offsets[i:i + 2])
+        if hi > lo:
+            samples.append(np.asarray(shard[ids[lo:hi] - offsets[i]], dtype='float32'))
+    return np.concatenate(samples)
+
+
+def build_index(args):
+    metric = faiss.METRIC_L2 if args.metric == 'l2' else faiss.METRIC_INNER_PRODUCT
+    if args.ivf:
+        quantizer = faiss.IndexFlatL2(args.dim) if args.metric == 'l2' else faiss.IndexFlatIP(args.dim)
+        if args.pq:
+            index = faiss.IndexIVFPQ(quantizer, args.dim, args.nlist, args.pq_m, args.pq_nbits, metric)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, args.dim, args.nlist, metric)
+        index.nprobe = args.nprobe
+    elif args.hnsw and args.pq:
+        index = faiss.IndexHNSWPQ(args.dim, args.pq_m, args.M)
+        index.hnsw.efConstruction = args.efC
+        index.metric_type = faiss.METRIC_INNER_PRODUCT
+    elif args.hnsw:
+        index = faiss.IndexHNSWFlat(args.dim, args.M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = args.efC
+    elif args.pq:
+        index = faiss.IndexPQ(args.dim, args.pq_m, args.pq_nbits, faiss.METRIC_INNER_PRODUCT)
+    elif args.metric == "inner":
+        index = faiss.IndexFlatIP(args.dim)
+    elif args.metric == "l2":
+        index = faiss.IndexFlatL2(args.dim)
+    index.verbose = True
+    return index
+
+
+def checkpoint_config(args):
+    return {key: getattr(args, key) for key in
+            ['input', 'dim', 'hnsw', 'M', 'efC', 'pq', 'pq_m', 'pq_nbits', 'ivf', 'nlist', 'metric', 'train_sample',
+             'seed']}
+
+
+def save_checkpoint(index, args, faiss_device):
+    """Atomically save the partially-built index, so that an interrupted build can continue with ``--resume``."""
+    if faiss_device.startswith('cuda'):
+        index = faiss.index_gpu_to_cpu(index)
+    index_path = os.path.join(args.output, CHECKPOINT_INDEX)
+    faiss.write_index(index, index_path + '.tmp')
+    os.replace(index_path + '.tmp', index_path)
+    with open(os.path.join(args.output, CHECKPOINT_STATE), 'w') as f:
+        json.dump({'config': checkpoint_config(args), 'ntotal': index.ntotal}, f)
+
+
+def load_checkpoint(args):
+    state_path = os.path.join(args.output, CHECKPOINT_STATE)
+    index_path = os.path.join(args.output, CHECKPOINT_INDEX)
+    if not (os.path.exists(state_path) and os.path.exists(index_path)):
+        return None
+    with open(state_path) as f:
+        state = json.load(f)
+    if state['config'] != checkpoint_config(args):
+        raise ValueError(f'Checkpoint in {args.output} was created with different arguments: {state["config"]}')
+    return faiss.read_index(index_path)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--input', type=str, help='path to embeddings directory', required=True)
     parser.add_argument('--output', type=str, help='path to output index dir', required=True)
     parser.add_argument('--dim', type=int, default=768, required=False)
-    parser.add_argument('--hnsw', action="store_true", required=False)
+    index_type = parser.add_mutually_exclusive_group()
+    index_type.add_argument('--hnsw', action="store_true", required=False)
     parser.add_argument('--M', type=int, default=256, required=False)
     parser.add_argument('--efC', type=int, default=256, required=False)
     parser.add_argument('--pq', action="store_true", required=False)
     parser.add_argument('--pq-m', type=int, default=192, required=False)
     parser.add_argument('--pq-nbits', type=int, default=8, required=False)
+    index_type.add_argument('--ivf', action="store_true", required=False,
+                            help='build an IVF index (IVF-PQ with --pq, IVF-Flat otherwise)')
+    parser.add_argument('--nlist', type=int, default=4096, required=False, help='number of IVF lists')
+    parser.add_argument('--nprobe', type=int, default=1, required=False, help='default number of IVF lists to probe')
     parser.add_argument('--threads', type=int, default=12, required=False)
     parser.add_argument('--metric', type=str, default="inner", required=False)
+    parser.add_argument('--add-batch-size', type=int, default=100000, required=False,
+                        help='number of vectors converted to float32 and added to the index at a time')
+    parser.add_argument('--train-sample', type=int, default=None, required=False,
+                        help='train on this many randomly sampled vectors instead of all of them')
+    parser.add_argument('--seed', type=int, default=42, required=False, help='seed for the training sample')
+    parser.add_argument('--checkpoint-every', type=int, default=0, required=False,
+                        help='checkpoint the partial index every N batches of --add-batch-size vectors')
+    parser.add_argument('--resume', action="store_true", required=False,
+                        help='continue an interrupted build from its last checkpoint')
     parser.add_argument('--device', type=str, default='cpu', required=False, help='Device to run faiss, cpu or cuda:0, cuda:1, ...')
     args = parser.parse_args()
     faiss_device = resolve_device(args.device, backend='faiss')
@@ -46,52 +200,45 @@ if __name__ == '__main__':
     if not os.path.exists(args.output):
         os.mkdir(args.output)
 
-    if 'index' in os.listdir(args.input):
-        shutil.copy(os.path.join(args.input, 'docid'), os.path.join(args.output, 'docid'))
-        bf_index = faiss.read_index(os.path.join(args.input, 'index'))
-        vectors = bf_index.reconstruct_n(0, bf_index.ntotal)
+    shards = load_shards(args.input, args.output)
+    num_vectors = sum(len(shard) for shard in shards)
+    print(f"Vector Shape: {(num_vectors,) + shards[0].shape[1:]}")
+
+    index = load_checkpoint(args) if args.resume else None
+    if index is not None:
+        print(f"Resuming from checkpoint with {index.ntotal} indexed vectors")
     else:
-        vectors = []
-        with open(os.path.join(args.output, 'docid'), 'w') as f_out:
-            for filename in tqdm(os.listdir(args.input)):
-                path = os.path.join(args.input, filename)
-                with open(path) as f_in:
-                    for line in f_in:
-                        info = json.loads(line)
-                        docid = info['id']
-                        vector = info['vector']
-                        f_out.write(f'{docid}\n')
-                        vectors.append(vector)
-    vectors = np.array(vectors, dtype='float32')
-    print(f"Vector Shape: {vectors.shape}")
-
-    if args.hnsw and args.pq:
-        index = faiss.IndexHNSWPQ(args.dim, args.pq_m, args.M)
-        index.hnsw.efConstruction = args.efC
-        index.metric_type = faiss.METRIC_INNER_PRODUCT
-    elif args.hnsw:
-        index = faiss.IndexHNSWFlat(args.dim, args.M, faiss.METRIC_INNER_PRODUCT)
-        index.hnsw.efConstruction = args.efC
-    elif args.pq:
-        index = faiss.IndexPQ(args.dim, args.pq_m, args.pq_nbits, faiss.METRIC_INNER_PRODUCT)
-    elif args.metric == "inner":
-        index = faiss.IndexFlatIP(args.dim)
-    elif args.metric == "l2":
-        index = faiss.IndexFlatL2(args.dim)
-    index.verbose = True
+        index = build_index(args)
 
     if faiss_device.startswith('cuda'):
         device_id = int(faiss_device.split(':', 1)[1])
         res = faiss.StandardGpuResources()
         index = faiss.index_cpu_to_gpu(res, device_id, index)
 
-    if args.pq:
-        index.train(vectors)
+    if not index.is_trained:
+        index.train(sample_vectors(shards, args.train_sample, args.seed))
+        if args.checkpoint_every > 0:
+            save_checkpoint(index, args, faiss_device)
 
-    index.add(vectors)
+    num_batches = 0
+    offset = 0
+    with tqdm(total=num_vectors, initial=index.ntotal, unit='vec') as progress:
+        for shard in shards:
+            # Skip whatever was already added before the checkpoint.
+            for start in range(max(0, index.ntotal - offset), len(shard), args.add_batch_size):
+                batch = np.ascontiguousarray(shard[start:start + args.add_batch_size], dtype='float32')
+                index.add(batch)
+                progress.update(len(batch))
+                num_batches += 1
+                if args.checkpoint_every > 0 and num_batches % args.checkpoint_every == 0:
+                    save_checkpoint(index, args, faiss_device)
+            offset += len(shard)
     print(f"Number of indexed vectors: {index.ntotal}")
 
     if faiss_device.startswith('cuda'):
         index = faiss.index_gpu_to_cpu(index)
 
     faiss.write_index(index, os.path.join(args.output, 'index'))
+    for filename in [CHECKPOINT_INDEX, CHECKPOINT_STATE, JSONL_VECTORS]:
+        if os.path.exists(os.path.join(args.output, filename)):
+            os.remove(os.path.join(args.output, filename))
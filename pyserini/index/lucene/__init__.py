@@ -16,3 +16,4 @@
 
 from ._base import Document, Generator, IndexTerm, Posting, LuceneIndexReader
 from ._indexer import LuceneIndexer, JacksonObjectMapper, JacksonJsonNode
+from ._idf_table import IdfTable, index_fingerprint, write_idf_table
@@ -376,10 +376,9 @@ class LuceneIndexReader:
                 raise e
         if doc_vector_map is None:
             return None
-        doc_vector_dict = {}
-        for term in doc_vector_map.keySet().toArray():
-            doc_vector_dict[term] = doc_vector_map.get(term)
-        return doc_vector_dict
+        # Two bulk conversions instead of one JVM call per term; the key and value views of the (unmodified) Java map
+        # iterate in the same order.
+        return dict(zip(doc_vector_map.keySet().toArray(), doc_vector_map.values().toArray()))
 
     def get_term_positions(self, docid: str) -> Optional[Dict[str, int]]:
         """Return the term position mapping of the document with ``docid``. Note that the term in the document is
@@ -0,0 +1,277 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Memory-mapped IDF tables for Lucene indexes.
+
+The IDF and document frequency of every term of an index are computed once, by walking the index's terms, and stored
+next to the index as a sidecar: ``idf.terms.npy`` holds the sorted terms as concatenated UTF-8 bytes and
+``idf.offsets.npy`` the byte offset at which each term starts (plus the total size), the same layout as docid tables
+(see :mod:`pyserini.docid_table`); ``idf.values.npy`` and ``idf.dfs.npy`` hold the matching IDF values and document
+frequencies, and ``idf.json`` the fingerprint of the index commit the table was computed for. Searchers and vectorizers
+memory-map the arrays, so opening an index costs no per-term work and processes on one host share the pages, and look
+terms up with a vectorized binary search.
+"""
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from pyserini.pyclass import autoclass, JPaths
+from ._base import LuceneIndexReader
+
+logger = logging.getLogger(__name__)
+
+JFSDirectory = autoclass('org.apache.lucene.store.FSDirectory')
+JSegmentInfos = autoclass('org.apache.lucene.index.SegmentInfos')
+
+IDF_TERMS_FILE = 'idf.terms.npy'
+IDF_OFFSETS_FILE = 'idf.offsets.npy'
+IDF_VALUES_FILE = 'idf.values.npy'
+IDF_DFS_FILE = 'idf.dfs.npy'
+IDF_META_FILE = 'idf.json'
+# Fixed-width term array of tables written before terms were stored with offsets.
+_LEGACY_IDF_TOKENS_FILE = 'idf.tokens.npy'
+
+
+def index_fingerprint(index_dir: str, stats: Optional[Dict[str, int]] = None) -> Dict[str, object]:
+    """Identify the current commit of the index at ``index_dir``.
+
+    Lucene only deletes its own files, so an index rebuilt in place keeps the sidecar of the previous build; the
+    fingerprint tells them apart even if the number of documents did not change.
+
+    Parameters
+    ----------
+    index_dir : str
+        Path to the Lucene index.
+    stats : Optional[Dict[str, int]]
+        Statistics of the index as returned by ``LuceneIndexReader.stats()``, if already at hand.
+
+    Returns
+    -------
+    Dict[str, object]
+        Segments file name and id of the latest commit, and the number of documents, total terms and unique terms.
+    """
+    if stats is None:
+        stats = LuceneIndexReader(index_dir).stats()
+    directory = JFSDirectory.open(JPaths.get(index_dir))
+    try:
+        segment_infos = JSegmentInfos.readLatestCommit(directory)
+        segments_file = segment_infos.getSegmentsFileName()
+        commit_id = bytes(segment_infos.getId()).hex()
+    finally:
+        directory.close()
+    return {'segments_file': segments_file, 'commit_id': commit_id, 'documents': int(stats['documents']),
+            'total_terms': int(stats['total_terms']), 'unique_terms': int(stats['unique_terms'])}
+
+
+def compute_idf_table(index_dir: str):
+    """Compute the sorted term bytes and offsets, IDF and document frequency arrays of the index at ``index_dir``, and
+    its number of documents."""
+    index_reader = LuceneIndexReader(index_dir)
+    tokens = []
+    dfs = []
+    for term in index_reader.terms():
+        dfs.append(term.df)
+        tokens.append(term.term.encode('utf-8'))
+    documents = index_reader.stats()['documents']
+    # Lucene returns terms in byte order already; sorting is then linear.
+    order = sorted(range(len(tokens)), key=tokens.__getitem__)
+    tokens = [tokens[i] for i in order]
+    dfs = np.array(dfs, dtype=np.int64)[np.array(order, dtype=np.int64)]
+    idfs = np.log(documents / dfs)
+    data = np.frombuffer(b''.join(tokens), dtype=np.uint8)
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum([len(token) for token in tokens], out=offsets[1:])
+    return data, offsets, idfs, dfs, documents
+
+
+def write_idf_table(index_dir: str, path: Optional[str] = None) -> int:
+    """Compute the IDF table of the index at ``index_dir`` and write it to ``path`` (default: ``index_dir``).
+
+    Returns
+    -------
+    int
+        Number of terms in the table.
+    """
+    path = path or index_dir
+    fingerprint = index_fingerprint(index_dir)
+    data, offsets, idfs, dfs, _ = compute_idf_table(index_dir)
+    for file_name, array in [(IDF_TERMS_FILE, data), (IDF_OFFSETS_FILE, offsets), (IDF_VALUES_FILE, idfs),
+                             (IDF_DFS_FILE, dfs)]:
+        tmp_path = os.path.join(path, f'{file_name}.tmp{os.getpid()}')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(path, file_name))
+    # The metadata goes last: a table is only picked up once it is complete.
+    tmp_path = os.path.join(path, f'{IDF_META_FILE}.tmp{os.getpid()}')
+    with open(tmp_path, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'terms': len(offsets) - 1}, f)
+    os.replace(tmp_path, os.path.join(path, IDF_META_FILE))
+    legacy_path = os.path.join(path, _LEGACY_IDF_TOKENS_FILE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    return len(offsets) - 1
+
+
+class IdfTable:
+    """Read-only mapping from term to IDF, backed by sorted, concatenated term bytes and their offsets.
+
+    Supports ``term in table``, ``table[term]`` and ``table.get(term)`` like the ``dict`` it replaces, and filters
+    whole batches of encoded queries with a single vectorized lookup.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Sorted UTF-8 encoded terms, concatenated into one byte array.
+    offsets : np.ndarray
+        Byte offset at which each term starts in ``data``, followed by the size of ``data``.
+    idfs : np.ndarray
+        IDF of each term.
+    dfs : np.ndarray
+        Document frequency of each term.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray, idfs: np.ndarray, dfs: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+        self.idfs = idfs
+        self.dfs = dfs
+
+    @classmethod
+    def from_index(cls, index_dir: str, stats: Optional[Dict[str, int]] = None, write: bool = True):
+        """Load the IDF table of the index at ``index_dir``, computing it first if the sidecar is missing or was
+        computed for another commit of the index.
+
+        Parameters
+        ----------
+        index_dir : str
+            Path to the Lucene index.
+        stats : Optional[Dict[str, int]]
+            Statistics of the index as returned by ``LuceneIndexReader.stats()``, if already at hand.
+        write : bool
+            Whether to write a newly computed table to the index directory. Failures to write, e.g., for read-only
+            indexes, are logged and the table is kept in memory.
+        """
+        fingerprint = index_fingerprint(index_dir, stats)
+        meta_path = os.path.join(index_dir, IDF_META_FILE)
+        # Tables written before fingerprints were stored are recomputed.
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('fingerprint') == fingerprint:
+                return cls(*(np.load(os.path.join(index_dir, file_name), mmap_mode='r')
+                             for file_name in [IDF_TERMS_FILE, IDF_OFFSETS_FILE, IDF_VALUES_FILE, IDF_DFS_FILE]))
+
+        if write:
+            try:
+                write_idf_table(index_dir)
+                return cls.from_index(index_dir, stats, write=False)
+            except OSError as e:
+                logger.warning(f'Unable to write the IDF table of {index_dir}: {e}')
+        data, offsets, idfs, dfs, _ = compute_idf_table(index_dir)
+        return cls(data, offsets, idfs, dfs)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def terms(self, positions: Optional[np.ndarray] = None) -> List[str]:
+        """Decode the terms at ``positions`` (default: all terms, in order)."""
+        offsets = np.asarray(self.offsets)
+        if positions is None:
+            starts, ends = offsets[:-1], offsets[1:]
+        else:
+            positions = np.asarray(positions, dtype=np.int64)
+            starts, ends = offsets[positions], offsets[positions + 1]
+        data = np.asarray(self.data).tobytes()
+        return [data[start:end].decode('utf-8') for start, end in zip(starts.tolist(), ends.tolist())]
+
+    def _term_bytes(self, positions: np.ndarray, width: int) -> np.ndarray:
+        """Bytes of the terms at ``positions``, plus one, as rows of ``width`` values; zero past the end of a term."""
+        starts = np.asarray(self.offsets[positions])
+        lengths = np.asarray(self.offsets[positions + 1]) - starts
+        columns = np.arange(width)
+        inside = columns < lengths[:, None]
+        values = np.zeros((len(positions), width), dtype=np.int16)
+        values[inside] = np.asarray(self.data[(starts[:, None] + columns)[inside]]) + 1
+        return values
+
+    def positions(self, terms: List[str]) -> np.ndarray:
+        """Return the position of each of ``terms`` in the table, with -1 for terms that are not in the index."""
+        if len(terms) == 0 or len(self) == 0:
+            return np.full(len(terms), -1, dtype=np.int64)
+        # Search each distinct term once; document vectors of a batch share most of their terms.
+        distinct = {}
+        inverse = np.array([distinct.setdefault(term, len(distinct)) for term in terms], dtype=np.int64)
+        return self._positions([term.encode('utf-8') for term in distinct])[inverse]
+
+    def _positions(self, keys: List[bytes]) -> np.ndarray:
+        # Keys as rows of byte values plus one, zero-padded, so that a prefix sorts before the terms it starts; the
+        # extra column tells terms longer than every key apart from the key they start with.
+        key_lengths = np.array([len(key) for key in keys], dtype=np.int64)
+        width = int(key_lengths.max()) + 1
+        key_bytes = np.zeros((len(keys), width), dtype=np.int16)
+        key_bytes[np.arange(width) < key_lengths[:, None]] = np.frombuffer(b''.join(keys), dtype=np.uint8) + 1
+
+        # Binary search of all keys at once, over the keys whose range is not empty yet.
+        low = np.zeros(len(keys), dtype=np.int64)
+        high = np.full(len(keys), len(self), dtype=np.int64)
+        active = np.arange(len(keys))
+        while len(active) > 0:
+            middle = (low[active] + high[active]) // 2
+            term_bytes = self._term_bytes(middle, width)
+            differs = term_bytes != key_bytes[active]
+            first = differs.argmax(axis=1)
+            rows = np.arange(len(active))
+            less = differs[rows, first] & (term_bytes[rows, first] < key_bytes[active, first])
+            low[active] = np.where(less, middle + 1, low[active])
+            high[active] = np.where(less, high[active], middle)
+            active = active[low[active] < high[active]]
+
+        positions = np.minimum(low, len(self) - 1)
+        found = (self._term_bytes(positions, width) == key_bytes).all(axis=1)
+        return np.where(found, positions, -1)
+
+    def lookup(self, terms: List[str]) -> np.ndarray:
+        """Return the IDF of each of ``terms``, with ``nan`` for terms that are not in the index."""
+        positions = self.positions(terms)
+        idfs = np.full(len(positions), np.nan)
+        found = positions >= 0
+        idfs[found] = self.idfs[positions[found]]
+        return idfs
+
+    def filter(self, encoded_queries: List[Dict[str, float]], min_idf: float = 0) -> List[Dict[str, float]]:
+        """Keep the terms of each encoded query that are in the index with an IDF above ``min_idf``."""
+        terms = [term for encoded_query in encoded_queries for term in encoded_query]
+        keep = iter((self.lookup(terms) > min_idf).tolist())
+        return [{term: weight for term, weight in encoded_query.items() if next(keep)}
+                for encoded_query in encoded_queries]
+
+    def __contains__(self, term: str) -> bool:
+        return not np.isnan(self.lookup([term])[0])
+
+    def get(self, term: str, default=None):
+        idf = self.lookup([term])[0]
+        return default if np.isnan(idf) else idf
+
+    def __getitem__(self, term: str):
+        idf = self.get(term)
+        if idf is None:
+            raise KeyError(term)
+        return idf
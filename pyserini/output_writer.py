@@ -16,10 +16,15 @@
 
 import json
 import os
+import queue
+import threading
 from abc import ABC, abstractmethod
 from enum import Enum, unique
-from typing import List
+from typing import Callable, List, Sequence, Set
 
+import numpy as np
+
+from pyserini.pyclass import detach
 from pyserini.search.lucene import JScoredDoc
 
 
@@ -30,6 +35,15 @@ class OutputFormat(Enum):
     KILT = 'kilt'
 
 
+class ArrayHit:
+    """Minimal hit with a ``docid`` and a ``score``, used to pass array results to ``OutputWriter.write``."""
+    __slots__ = ('docid', 'score')
+
+    def __init__(self, docid: str, score: float):
+        self.docid = docid
+        self.score = score
+
+
 class OutputWriter(ABC):
 
     def __init__(self, file_path: str, mode: str = 'w',
@@ -54,6 +68,12 @@ class OutputWriter(ABC):
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self._file.close()
 
+    def flush(self) -> int:
+        """Flush the written results to disk, and return the size of the output file."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
     def hits_iterator(self, hits: List[JScoredDoc]):
         unique_docs = set()
         rank = 1
@@ -78,18 +98,55 @@ class OutputWriter(ABC):
     def write(self, topic: str, hits: List[JScoredDoc]):
         raise NotImplementedError()
 
+    def write_arrays(self, topics: List[str], scores: np.ndarray, indexes: np.ndarray, docids: Sequence[str]):
+        """Write the results of a batch of topics given as arrays, e.g., from ``FaissSearcher.batch_search_arrays``.
+
+        Parameters
+        ----------
+        topics : List[str]
+            Topic ids, one per row.
+        scores : np.ndarray
+            Scores of shape ``(len(topics), k)``, sorted in rank order within each row.
+        indexes : np.ndarray
+            Indexes into ``docids`` of the same shape; ``-1`` marks a missing hit.
+        docids : Sequence[str]
+            Docid lookup table, e.g., a ``DocidTable``.
+        """
+        for topic, row_scores, row_indexes in zip(topics, scores, indexes):
+            found = row_indexes != -1
+            row_indexes = row_indexes[found]
+            row_scores = row_scores[found].tolist()
+            if hasattr(docids, 'take'):
+                row_docids = docids.take(row_indexes)
+            else:
+                row_docids = [docids[idx] for idx in row_indexes.tolist()]
+            if self.use_max_passage:
+                self.write(topic, [ArrayHit(docid, score) for docid, score in zip(row_docids, row_scores)])
+            else:
+                self._write_row(topic, row_docids[:self.max_hits], row_scores[:self.max_hits])
+
+    def _write_row(self, topic: str, docids: List[str], scores: List[float]):
+        self.write(topic, [ArrayHit(docid, score) for docid, score in zip(docids, scores)])
+
 
 class TrecWriter(OutputWriter):
     def write(self, topic: str, hits: List[JScoredDoc]):
         for docid, rank, score, _ in self.hits_iterator(hits):
             self._file.write(f'{topic} Q0 {docid} {rank} {score:.6f} {self.tag}\n')
 
+    def _write_row(self, topic: str, docids: List[str], scores: List[float]):
+        self._file.write(''.join(f'{topic} Q0 {docid.strip()} {rank} {score:.6f} {self.tag}\n'
+                                 for rank, (docid, score) in enumerate(zip(docids, scores), start=1)))
+
 
 class MsMarcoWriter(OutputWriter):
     def write(self, topic: str, hits: List[JScoredDoc]):
         for docid, rank, score, _ in self.hits_iterator(hits):
             self._file.write(f'{topic}\t{docid}\t{rank}\n')
 
+    def _write_row(self, topic: str, docids: List[str], scores: List[float]):
+        self._file.write(''.join(f'{topic}\t{docid.strip()}\t{rank}\n' for rank, docid in enumerate(docids, start=1)))
+
 
 class KiltWriter(OutputWriter):
     def write(self, topic: str, hits: List[JScoredDoc]):
@@ -111,5 +168,149 @@ def get_output_writer(file_path: str, output_format: OutputFormat, *args, **kwar
     return mapping[output_format](file_path, *args, **kwargs)
 
 
+class PipelinedWriter:
+    """Runs the post-processing and writing of search results on a writer thread, so that retrieval of the next batch
+    of topics overlaps with it.
+
+    Tasks run one at a time in submission order, so the output is the same as running them inline. At most
+    ``max_pending`` tasks wait in the queue: when the writer falls behind, ``submit`` blocks instead of buffering
+    results. An exception raised by a task is re-raised in the submitting thread by the next ``submit`` or on exit;
+    later tasks are skipped. With ``max_pending=0``, tasks run inline on the submitting thread.
+
+    Parameters
+    ----------
+    max_pending : int
+        Maximum number of tasks waiting for the writer thread; ``0`` disables the thread.
+    """
+
+    def __init__(self, max_pending: int = 2):
+        self.max_pending = max_pending
+        self._error = None
+        self._queue = None
+        self._thread = None
+
+    def __enter__(self):
+        if self.max_pending > 0:
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            self._thread = threading.Thread(target=self._run, name='PipelinedWriter', daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if exc_type is None:
+            self._raise_error()
+
+    def _run(self):
+        try:
+            while True:
+                task = self._queue.get()
+                if task is None:
+                    break
+                if self._error is None:
+                    fn, args = task
+                    try:
+                        fn(*args)
+                    except BaseException as e:
+                        self._error = e
+        finally:
+            # Hits are usually Java objects, and threads that used the JVM must detach from it before they exit.
+            detach()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, fn: Callable, *args):
+        """Run ``fn(*args)`` after all previously submitted tasks."""
+        if self._thread is None:
+            fn(*args)
+            return
+        self._raise_error()
+        self._queue.put((fn, args))
+
+
+class RunCheckpoint:
+    """Records the topics whose results have been written to a run file, so that an interrupted run can be resumed.
+
+    Every ``interval`` topics, the run file is flushed and a line with its size and the ids of the topics written since
+    the previous line is appended to ``<run file>.checkpoint``. Resuming truncates the run file to the last recorded
+    size, dropping the results written after it, and returns the ids of the topics to skip.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the run file.
+    interval : int
+        Number of topics between checkpoints.
+    """
+
+    SUFFIX = '.checkpoint'
+
+    def __init__(self, file_path: str, interval: int = 1000):
+        self.file_path = file_path
+        self.path = file_path + self.SUFFIX
+        self.interval = interval
+        self._pending = []
+
+    def start(self):
+        """Start a new run, discarding any previous checkpoint."""
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        open(self.path, 'w').close()
+
+    def resume(self) -> Set:
+        """Resume a run from the checkpoint, if any.
+
+        Returns
+        -------
+        Set
+            Ids of the topics whose results are in the (truncated) run file.
+        """
+        if not os.path.exists(self.path):
+            self.start()
+            return set()
+        finished = set()
+        offset = 0
+        checkpoint_size = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The run was interrupted while writing this line.
+                    break
+                finished.update(entry['topics'])
+                offset = entry['offset']
+                checkpoint_size += len(line)
+        with open(self.path, 'r+b') as f:
+            f.truncate(checkpoint_size)
+        if os.path.exists(self.file_path):
+            with open(self.file_path, 'r+b') as f:
+                f.truncate(offset)
+        return finished
+
+    def record(self, output_writer: OutputWriter, topics: List):
+        """Record that the results of ``topics`` have been written with ``output_writer``."""
+        self._pending.extend(topics)
+        if len(self._pending) >= self.interval:
+            self.flush(output_writer)
+
+    def flush(self, output_writer: OutputWriter):
+        """Checkpoint all the recorded topics."""
+        if not self._pending:
+            return
+        offset = output_writer.flush()
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'offset': offset, 'topics': self._pending}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+
+
 def tie_breaker(hits):
     return sorted(hits, key=lambda x: (-x.score, x.docid))
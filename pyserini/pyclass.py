@@ -18,7 +18,9 @@
 Module for hiding Python-Java calls via Pyjnius
 """
 
+import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from ._jvm import (
     configure_classpath,
@@ -39,7 +41,7 @@ except Exception as e:
         raise
 
 with suppress_jvm_startup_stderr():
-    from jnius import autoclass
+    from jnius import autoclass, detach
 
     # Base Java classes
     JString = autoclass('java.lang.String')
@@ -52,8 +54,47 @@ with suppress_jvm_startup_stderr():
     JHashMap = autoclass('java.util.HashMap')
 
 
+def detaching(fn):
+    """Wrap ``fn`` so that the thread running it detaches from the JVM once it returns.
+
+    Pyjnius requires threads that called into Java to detach before they exit, so functions that use the JVM and are
+    run on short-lived threads (e.g., in a thread pool) should be wrapped with this.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            detach()
+    return wrapper
+
+
+def thread_map(fn, items, threads: int = 1) -> list:
+    """Apply ``fn`` to each item on up to ``threads`` threads that use the JVM, returning the results in order.
+
+    Items are split into one contiguous chunk per thread, and each thread detaches from the JVM after its chunk. Calls
+    into Java release the GIL, so the JVM does the work concurrently.
+    """
+    items = list(items)
+    threads = max(1, min(int(threads), len(items)))
+    if threads == 1:
+        return [fn(item) for item in items]
+
+    @detaching
+    def run(chunk):
+        return [fn(item) for item in chunk]
+
+    size = -(-len(items) // threads)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        chunks = executor.map(run, [items[start:start + size] for start in range(0, len(items), size)])
+        return [result for chunk in chunks for result in chunk]
+
+
 __all__ = [
     'autoclass',
+    'detach',
+    'detaching',
+    'thread_map',
     'JString',
     'JFloat',
     'JInt',
@@ -72,7 +72,34 @@ class QueryIterator(ABC):
             yield id_, self.get_query(id_)
 
     def __len__(self):
-        return len(self.topics.keys())
+        return len(self.order)
+
+    def shard(self, shard_id: int, shard_num: int):
+        """Restrict the iterator to one of ``shard_num`` contiguous shards of the topics, split the same way as the
+        encoder splits a corpus: shards have equal size, except the last one, which also gets the remainder.
+
+        Parameters
+        ----------
+        shard_id : int
+            0-based id of the shard.
+        shard_num : int
+            Number of shards.
+        """
+        if not 0 <= shard_id < shard_num:
+            raise ValueError(f'Invalid shard id {shard_id} for {shard_num} shards.')
+        total_len = len(self.order)
+        shard_size = int(total_len / shard_num)
+        start_idx = shard_id * shard_size
+        end_idx = total_len if shard_id == shard_num - 1 else min(start_idx + shard_size, total_len)
+        self.order = self.order[start_idx:end_idx]
+        return self
+
+    def skip(self, ids):
+        """Remove the topics with the given ids, compared as strings, e.g., the ones an interrupted run has already
+        finished."""
+        ids = {str(id_) for id_ in ids}
+        self.order = [id_ for id_ in self.order if str(id_) not in ids]
+        return self
 
     @staticmethod
     def get_predefined_order(topics_path: str):
@@ -14,5 +14,5 @@
 # limitations under the License.
 #
 
-from ._searcher import FaissSearcher, BinaryDenseFaissSearcher, DenseSearchResult
+from ._searcher import FaissSearcher, BinaryDenseFaissSearcher, DenseSearchResult, DenseSearchArrays
 from ._prf import DenseVectorAveragePrf, DenseVectorRocchioPrf, DenseVectorAncePrf, PrfDenseSearchResult
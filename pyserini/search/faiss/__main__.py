@@ -24,7 +24,7 @@ from pyserini.encode import (AnceQueryEncoder, AutoQueryEncoder,
                              BprQueryEncoder, QueryEncoder,
                              query_encoder_class_map, MMEB_IMPORT_ERROR)
 from pyserini.encode.optional import PcaEncoder
-from pyserini.output_writer import OutputFormat, get_output_writer
+from pyserini.output_writer import OutputFormat, PipelinedWriter, RunCheckpoint, get_output_writer
 from pyserini.query_iterator import TopicsFormat, get_query_iterator
 from pyserini.search._base import get_bright_excluded_ids
 from pyserini.search.lucene import LuceneSearcher
@@ -244,6 +244,13 @@ def define_dsearch_args(parser):
         default="cpu",
         help="Device to run faiss, cpu or [cuda:0, cuda:1, ...]",
     )
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        default=False,
+        help="Memory-map the index instead of loading it into private memory, so that several processes on one "
+             "host share the OS page cache.",
+    )
 
 
 def init_query_encoder(
@@ -409,6 +416,53 @@ if __name__ == "__main__":
         default=1,
         help="maximum threads to use during search",
     )
+    parser.add_argument(
+        "--encode-batch-size",
+        type=int,
+        metavar="num",
+        required=False,
+        default=None,
+        help="number of queries per forward pass of the query encoder when searching in batches",
+    )
+    parser.add_argument(
+        "--pipeline-depth",
+        type=int,
+        metavar="num",
+        required=False,
+        default=0,
+        help="post-process and write results on a separate thread while the next batch is searched, with up to this "
+        "many batches queued; 0 writes them on the main thread",
+    )
+    parser.add_argument(
+        "--shard-id",
+        type=int,
+        metavar="num",
+        required=False,
+        default=0,
+        help="0-based id of the shard of the topics to search; merge the shard runs with pyserini.search.merge_runs",
+    )
+    parser.add_argument(
+        "--shard-num",
+        type=int,
+        metavar="num",
+        required=False,
+        default=1,
+        help="number of shards to split the topics into",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        metavar="num",
+        required=False,
+        default=0,
+        help="checkpoint the finished topics every this many topics; 0 disables checkpointing",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="resume an interrupted run from its checkpoint, skipping the finished topics",
+    )
     # This is used for UniIR encoder models
     parser.add_argument(
         "--fp16", 
@@ -432,9 +486,13 @@ if __name__ == "__main__":
     )
     define_dsearch_args(parser)
     args = parser.parse_args()
+    if args.resume and args.checkpoint_interval <= 0:
+        parser.error("--resume requires --checkpoint-interval.")
 
     query_iterator = get_query_iterator(args.topics, TopicsFormat(args.topics_format))
     topics = query_iterator.topics
+    if args.shard_num > 1:
+        query_iterator.shard(args.shard_id, args.shard_num)
 
     query_encoder = init_query_encoder(
         args.encoder,
@@ -452,6 +510,8 @@ if __name__ == "__main__":
         args.fp16,
         args.explicit_truncate
     )
+    if args.encode_batch_size and isinstance(query_encoder, QueryEncoder):
+        query_encoder.batch_size = args.encode_batch_size
     if args.pca_model:
         query_encoder = PcaEncoder(query_encoder, args.pca_model)
     kwargs = {}
@@ -461,7 +521,7 @@ if __name__ == "__main__":
             kwargs = dict(binary_k=args.binary_hits, rerank=args.rerank)
             searcher = BinaryDenseFaissSearcher(args.index, query_encoder)
         else:
-            searcher = FaissSearcher(args.index, query_encoder, normalize_distances=args.normalize_distances, faiss_device=args.faiss_device)
+            searcher = FaissSearcher(args.index, query_encoder, normalize_distances=args.normalize_distances, faiss_device=args.faiss_device, mmap=args.mmap)
     else:
         # create searcher from prebuilt index name
         if args.searcher.lower() == "bpr":
@@ -470,7 +530,7 @@ if __name__ == "__main__":
                 args.index, query_encoder
             )
         else:
-            searcher = FaissSearcher.from_prebuilt_index(args.index, query_encoder, normalize_distances=args.normalize_distances, faiss_device=args.faiss_device)
+            searcher = FaissSearcher.from_prebuilt_index(args.index, query_encoder, normalize_distances=args.normalize_distances, faiss_device=args.faiss_device, mmap=args.mmap)
 
     if args.ef_search:
         searcher.set_hnsw_ef_search(args.ef_search)
@@ -516,10 +576,22 @@ if __name__ == "__main__":
     print(f"Running {args.topics} topics, saving to {output_path}...")
     tag = "Faiss"
 
+    checkpoint = None
+    output_mode = "w"
+    if args.checkpoint_interval > 0:
+        checkpoint = RunCheckpoint(output_path, args.checkpoint_interval)
+        if args.resume:
+            finished_topics = checkpoint.resume()
+            query_iterator.skip(finished_topics)
+            output_mode = "a"
+            print(f"Resuming from {checkpoint.path}, skipping {len(finished_topics)} finished topics")
+        else:
+            checkpoint.start()
+
     output_writer = get_output_writer(
         output_path,
         OutputFormat(args.output_format),
-        "w",
+        output_mode,
         max_hits=args.hits,
         tag=tag,
         topics=topics,
@@ -530,11 +602,31 @@ if __name__ == "__main__":
 
     bright_queries = get_bright_excluded_ids(args.index)
 
-    with output_writer:
+    def write_results(results):
+        for topic, hits in results:
+            # For some test collections, a query is doc from the corpus (e.g., arguana in BEIR).
+            # We want to remove the query from the results.
+            if args.remove_query:
+                hits = [hit for hit in hits if hit.docid != topic]
+
+            if bright_queries:
+                excluded = bright_queries.get(str(topic), ())
+                hits = [hit for hit in hits if hit.docid.strip() not in excluded]
+
+            output_writer.write(topic, hits)
+        if checkpoint is not None:
+            checkpoint.record(output_writer, [topic for topic, _ in results])
+
+    def write_arrays(batch_topic_ids, *arrays):
+        output_writer.write_arrays(batch_topic_ids, *arrays)
+        if checkpoint is not None:
+            checkpoint.record(output_writer, batch_topic_ids)
+
+    with output_writer, PipelinedWriter(args.pipeline_depth) as pipeline:
         batch_topics = list()
         batch_topic_ids = list()
         for index, (topic_id, query_info) in enumerate(
-            tqdm(query_iterator, total=len(topics.keys()))
+            tqdm(query_iterator, total=len(query_iterator))
         ):
             if args.batch_size <= 1 and args.threads <= 1:
                 if PRF_FLAG:
@@ -554,9 +646,7 @@ if __name__ == "__main__":
             else:
                 batch_topic_ids.append(str(topic_id))
                 batch_topics.append(query_info)
-                if (index + 1) % args.batch_size == 0 or index == len(
-                    topics.keys()
-                ) - 1:
+                if (index + 1) % args.batch_size == 0 or index == len(query_iterator) - 1:
                     if PRF_FLAG:
                         q_embs, prf_candidates = searcher.batch_search(
                             batch_topics,
@@ -582,6 +672,14 @@ if __name__ == "__main__":
                             **kwargs,
                         )
                         results = [(id_, results[id_]) for id_ in batch_topic_ids]
+                    elif type(searcher) == FaissSearcher and not args.remove_query and not bright_queries:
+                        # Format the whole batch straight from the score and index matrices.
+                        pipeline.submit(
+                            write_arrays,
+                            list(batch_topic_ids),
+                            *searcher.batch_search_arrays(batch_topics, args.hits, threads=args.threads),
+                        )
+                        results = []
                     else:
                         results = searcher.batch_search(
                             batch_topics,
@@ -596,16 +694,9 @@ if __name__ == "__main__":
                 else:
                     continue
 
-            for topic, hits in results:
-                # For some test collections, a query is doc from the corpus (e.g., arguana in BEIR).
-                # We want to remove the query from the results.
-                if args.remove_query:
-                    hits = [hit for hit in hits if hit.docid != topic]
-
-                if bright_queries:
-                    excluded = bright_queries.get(str(topic), ())
-                    hits = [hit for hit in hits if hit.docid.strip() not in excluded]
-
-                output_writer.write(topic, hits)
+            # post-process and write, possibly on the writer thread
+            if results:
+                pipeline.submit(write_results, results)
 
-            results.clear()
+        if checkpoint is not None:
+            pipeline.submit(checkpoint.flush, output_writer)
@@ -19,10 +19,11 @@ This module provides Pyserini's dense search interface to FAISS index.
 The main entry point is the ``FaissSearcher`` class.
 """
 
+import copy
 import logging
 import os
 from dataclasses import dataclass
-from typing import Dict, List, Union, Optional, Tuple
+from typing import Dict, List, NamedTuple, Union, Optional, Sequence, Tuple
 
 # Work around duplicate OpenMP runtimes in the same Python process on macOS.
 os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "True")
@@ -30,13 +31,14 @@ os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "True")
 import faiss
 import numpy as np
 
-from pyserini.encode import QueryEncoder, AutoQueryEncoder
+from pyserini.encode import QueryEncoder, AutoQueryEncoder, QueryEmbeddingCache, query_encoder_identity
 from pyserini.encode import (
     AnceQueryEncoder,
     BprQueryEncoder,
     DprQueryEncoder,
     TctColBertQueryEncoder,
 )
+from pyserini.docid_table import DocidTable
 from pyserini.index import Document
 from pyserini.search.lucene import LuceneSearcher
 from pyserini.util import (
@@ -56,6 +58,30 @@ class DenseSearchResult:
     score: float
 
 
+class DenseSearchArrays(NamedTuple):
+    """Results of a batch of queries as the raw ``(n, k)`` score and index matrices returned by Faiss.
+
+    ``docids`` maps indexes to docids lazily, so no per-hit objects are created unless asked for; missing hits have
+    index ``-1``.
+    """
+    scores: np.ndarray
+    indexes: np.ndarray
+    docids: Sequence[str]
+
+    def row_docids(self, row: int) -> List[str]:
+        """Docids of the hits of query ``row``, in rank order."""
+        indexes = self.indexes[row]
+        indexes = indexes[indexes != -1]
+        if hasattr(self.docids, 'take'):
+            return self.docids.take(indexes)
+        return [self.docids[idx] for idx in indexes.tolist()]
+
+    def row_hits(self, row: int) -> List[DenseSearchResult]:
+        """Hits of query ``row`` as ``DenseSearchResult`` objects."""
+        scores = self.scores[row][self.indexes[row] != -1]
+        return [DenseSearchResult(docid, score) for docid, score in zip(self.row_docids(row), scores)]
+
+
 class FaissSearcher:
     """Simple Searcher for dense representation
 
@@ -63,6 +89,12 @@ class FaissSearcher:
     ----------
     index_dir : str
         Path to faiss index directory.
+    mmap : bool
+        Memory-map the index file instead of copying it into private memory, so that processes on the same host
+        share the OS page cache. Index components that cannot be mapped are loaded fully and listed in
+        ``mmap_fallbacks``.
+    query_cache : QueryEmbeddingCache
+        Optional cache of query embeddings, which may be shared with other searchers.
     """
 
     def __init__(
@@ -72,9 +104,15 @@ class FaissSearcher:
         prebuilt_index_name: Optional[str] = None,
         normalize_distances: bool = False,
         faiss_device: str = "cpu",
+        mmap: bool = False,
+        query_cache: Optional[QueryEmbeddingCache] = None,
     ):
         self.faiss_device = resolve_device(faiss_device, backend='faiss')
         self._faiss_gpu_resources = None
+        self.mmap = mmap
+        self.mmap_fallbacks = []
+        self.query_cache = query_cache
+        self.query_encoder_id = query_encoder_identity(query_encoder)
 
         if not isinstance(query_encoder, str):
             self.query_encoder = query_encoder
@@ -97,6 +135,8 @@ class FaissSearcher:
         query_encoder: QueryEncoder,
         normalize_distances: bool = False,
         faiss_device: str = "cpu",
+        mmap: bool = False,
+        query_cache: Optional[QueryEmbeddingCache] = None,
     ):
         """Build a searcher from a prebuilt index; download the index if necessary.
 
@@ -110,6 +150,10 @@ class FaissSearcher:
             Whether to normalize distances to unit interval [0, 1]. Default is False.
         faiss_device: str
             Device to run faiss, cpu or [cuda:0, cuda:1, ...]. Default is cpu.
+        mmap : bool
+            Whether to memory-map the index file. Default is False.
+        query_cache : QueryEmbeddingCache
+            Optional cache of query embeddings.
 
         Returns
         -------
@@ -131,7 +175,7 @@ class FaissSearcher:
             return None
 
         print(f'Initializing {prebuilt_index_name}...')
-        return cls(index_dir, query_encoder, prebuilt_index_name, normalize_distances, faiss_device)
+        return cls(index_dir, query_encoder, prebuilt_index_name, normalize_distances, faiss_device, mmap, query_cache)
 
     @staticmethod
     def list_prebuilt_indexes():
@@ -169,6 +213,7 @@ class FaissSearcher:
         threads: int = 1,
         remove_dups: bool = False,
         return_vector: bool = False,
+        ef_search: Optional[int] = None,
     ) -> Union[List[DenseSearchResult], Tuple[np.ndarray, List[PrfDenseSearchResult]]]:
         """Search the collection.
 
@@ -184,6 +229,8 @@ class FaissSearcher:
             Remove duplicate docids when writing final run output.
         return_vector : bool
             Return the results with vectors
+        ef_search : int
+            Size of the HNSW candidate list for this search only (HNSW indexes); defaults to the index's ``efSearch``.
         Returns
         -------
         Union[List[DenseSearchResult], Tuple[np.ndarray, List[PRFDenseSearchResult]]]
@@ -191,7 +238,7 @@ class FaissSearcher:
             Or returns the query vector with the list of PRF dense search results with vectors.
         """
         if isinstance(query, str):
-            emb_q = self.query_encoder.encode(query)
+            emb_q = self._encode_query(query)
             assert len(emb_q) == self.dimension
             emb_q = emb_q.reshape((1, len(emb_q)))
         elif isinstance(query, dict):
@@ -200,9 +247,10 @@ class FaissSearcher:
         else:
             emb_q = query
         emb_q_32 = emb_q.astype('float32')
+        params = self._search_params(ef_search)
         faiss.omp_set_num_threads(threads)
         if return_vector:
-            distances, indexes, vectors = self.index.search_and_reconstruct(emb_q_32, k)
+            distances, indexes, vectors = self.index.search_and_reconstruct(emb_q_32, k, params=params)
             vectors = vectors[0]
             distances = distances.flat
             indexes = indexes.flat
@@ -212,7 +260,7 @@ class FaissSearcher:
                 if idx != -1
             ]
         else:
-            distances, indexes = self.index.search(emb_q_32, k)
+            distances, indexes = self.index.search(emb_q_32, k, params=params)
             distances = distances.flat
             indexes = indexes.flat
             if self.normalize_distances:
@@ -238,6 +286,7 @@ class FaissSearcher:
         k: int = 10,
         threads: int = 1,
         return_vector: bool = False,
+        ef_search: Optional[int] = None,
     ) -> Union[
         Dict[str, List[DenseSearchResult]],
         Tuple[np.ndarray, Dict[str, List[PrfDenseSearchResult]]],
@@ -256,6 +305,8 @@ class FaissSearcher:
             Maximum number of threads to use.
         return_vector : bool
             Return the results with vectors
+        ef_search : int
+            Size of the HNSW candidate list for this search only (HNSW indexes); defaults to the index's ``efSearch``.
 
         Returns
         -------
@@ -264,33 +315,12 @@ class FaissSearcher:
             corresponding lists of search results as the values.
             Or returns a tuple with ndarray of query vectors and a dictionary of PRF Dense Search Results with vectors
         """
-        if isinstance(queries, np.ndarray):
-            q_embs = queries
-        else:
-
-            def _enc(q):
-                if isinstance(q, dict):
-                    return self.query_encoder.encode(**q)
-                assert isinstance(q, str)
-                return self.query_encoder.encode(q)
-
-            # if query_encoder has encode_batch method, use it
-            if hasattr(self.query_encoder, 'encode_batch'):
-                q_embs = self.query_encoder.encode_batch(queries)
-            else:
-                q_embs = [_enc(q) for q in queries]
-            if len(q_embs[0]) == self.dimension:
-                q_embs = np.array(q_embs)
-            else:
-                assert isinstance(q_embs[0], np.ndarray)
-                q_embs = [q_emb.reshape((1, self.dimension)) for q_emb in q_embs]
-                q_embs = np.vstack(q_embs)
-            n, m = q_embs.shape
-            assert m == self.dimension
+        q_embs = self._encode_queries(queries)
         q_embs_32 = q_embs.astype('float32')
+        params = self._search_params(ef_search)
         faiss.omp_set_num_threads(threads)
         if return_vector:
-            D, I, V = self.index.search_and_reconstruct(q_embs_32, k)
+            D, I, V = self.index.search_and_reconstruct(q_embs_32, k, params=params)
             return q_embs, {
                 key: [
                     PrfDenseSearchResult(self.docids[idx], score, vector)
@@ -300,7 +330,7 @@ class FaissSearcher:
                 for key, distances, indexes, vectors in zip(q_ids, D, I, V)
             }
         else:
-            D, I = self.index.search(q_embs_32, k)
+            D, I = self.index.search(q_embs_32, k, params=params)
             if self.normalize_distances:
                 D = self._normalize_to_unit_interval(D)
             return {
@@ -312,10 +342,110 @@ class FaissSearcher:
                 for key, distances, indexes in zip(q_ids, D, I)
             }
 
+    def _encode_query(self, query: str) -> np.ndarray:
+        if self.query_cache is None:
+            return self.query_encoder.encode(query)
+        return self.query_cache.get_or_encode(self.query_encoder_id, query, self.query_encoder.encode)
+
+    def _encode_queries(self, queries: Union[List[str], np.ndarray, List[Dict]]) -> np.ndarray:
+        if isinstance(queries, np.ndarray):
+            return queries
+
+        def _enc(q):
+            if isinstance(q, dict):
+                return self.query_encoder.encode(**q)
+            assert isinstance(q, str)
+            return self.query_encoder.encode(q)
+
+        # if query_encoder has encode_batch method, use it
+        if hasattr(self.query_encoder, 'encode_batch'):
+            encode_batch = self.query_encoder.encode_batch
+        else:
+            encode_batch = lambda qs: [_enc(q) for q in qs]
+        if self.query_cache is not None and all(isinstance(q, str) for q in queries):
+            q_embs = self.query_cache.get_or_encode_batch(self.query_encoder_id, queries, encode_batch)
+        else:
+            q_embs = encode_batch(queries)
+        if len(q_embs[0]) == self.dimension:
+            q_embs = np.array(q_embs)
+        else:
+            assert isinstance(q_embs[0], np.ndarray)
+            q_embs = [q_emb.reshape((1, self.dimension)) for q_emb in q_embs]
+            q_embs = np.vstack(q_embs)
+        n, m = q_embs.shape
+        assert m == self.dimension
+        return q_embs
+
+    def batch_search_arrays(
+        self,
+        queries: Union[List[str], np.ndarray, List[Dict]],
+        k: int = 10,
+        threads: int = 1,
+        ef_search: Optional[int] = None,
+    ) -> DenseSearchArrays:
+        """Search the collection for a batch of queries, returning the results as arrays.
+
+        Unlike ``batch_search``, this does not build a ``DenseSearchResult`` per hit, which dominates the cost of
+        large batches with large ``k``. The result can be passed straight to ``OutputWriter.write_arrays``.
+
+        Parameters
+        ----------
+        queries : Union[List[str], np.ndarray, List[Dict]]
+            List of query texts, list of query embeddings, or list of query dicts
+        k : int
+            Number of hits to return.
+        threads : int
+            Maximum number of threads to use.
+        ef_search : int
+            Size of the HNSW candidate list for this search only (HNSW indexes); defaults to the index's ``efSearch``.
+
+        Returns
+        -------
+        DenseSearchArrays
+            Scores and indexes of shape ``(len(queries), k)``, with a lazy view of the docids.
+        """
+        q_embs_32 = self._encode_queries(queries).astype('float32')
+        params = self._search_params(ef_search)
+        faiss.omp_set_num_threads(threads)
+        D, I = self.index.search(q_embs_32, k, params=params)
+        if self.normalize_distances:
+            D = self._normalize_to_unit_interval(D)
+        return DenseSearchArrays(D, I, self.docids)
+
+    def _search_params(self, ef_search: Optional[int]):
+        if ef_search is None:
+            return None
+        return self._hnsw_search_params(self.index, int(ef_search))
+
+    @staticmethod
+    def _hnsw_search_params(index, ef_search: int):
+        """Search parameters that set ``efSearch`` of the HNSW index in ``index``; ``None`` if there is none."""
+        index = faiss.downcast_index(index)
+        if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            return FaissSearcher._hnsw_search_params(index.index, ef_search)
+        if isinstance(index, faiss.IndexPreTransform):
+            index_params = FaissSearcher._hnsw_search_params(index.index, ef_search)
+            if index_params is None:
+                return None
+            params = faiss.SearchParametersPreTransform()
+            params.index_params = index_params
+            # The SWIG wrapper does not keep the nested parameters alive.
+            params.referenced_objects = [index_params]
+            return params
+        if isinstance(index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=ef_search)
+        return None
+
     def load_index(self, index_dir: str):
         index_path = os.path.join(index_dir, 'index')
         docid_path = os.path.join(index_dir, 'docid')
-        index = faiss.read_index(index_path)
+        if self.mmap and self.faiss_device == 'cpu':
+            index = self._read_index_mmap(index_path)
+        else:
+            if self.mmap:
+                logger.warning("Memory-mapping is only supported on cpu; loading the full index onto %s.",
+                               self.faiss_device)
+            index = faiss.read_index(index_path)
         if self.faiss_device != 'cpu':
             try:
                 self._faiss_gpu_resources = faiss.StandardGpuResources()
@@ -331,6 +461,39 @@ class FaissSearcher:
         docids = self.load_docids(docid_path)
         return index, docids
 
+    def _read_index_mmap(self, index_path: str):
+        # IO_FLAG_MMAP_IFC maps the codes of flat-code indexes (flat, PQ, SQ, HNSW storage, IVF lists) without
+        # copying them; older FAISS releases only support mapping the inverted lists of IVF indexes.
+        flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+        try:
+            index = faiss.read_index(index_path, flags)
+        except RuntimeError as e:
+            logger.warning("Failed to memory-map %s (%s); loading the full index.", index_path, e)
+            self.mmap_fallbacks = [os.path.basename(index_path)]
+            return faiss.read_index(index_path)
+
+        self.mmap_fallbacks = self._unmapped_components(index, ifc=hasattr(faiss, 'IO_FLAG_MMAP_IFC'))
+        if self.mmap_fallbacks:
+            logger.warning("Index components not memory-mapped (loaded fully): %s", ', '.join(self.mmap_fallbacks))
+        return index
+
+    @staticmethod
+    def _unmapped_components(index, ifc: bool = True) -> List[str]:
+        """List the components of ``index`` that a memory-mapped read still copies into private memory."""
+        index = faiss.downcast_index(index)
+        name = type(index).__name__
+        if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexPreTransform)):
+            return FaissSearcher._unmapped_components(index.index, ifc)
+        if isinstance(index, faiss.IndexHNSW):
+            # The HNSW graph itself is always read into memory; only the vector storage can be mapped.
+            return [f'{name} (graph)'] + FaissSearcher._unmapped_components(index.storage, ifc)
+        if isinstance(index, faiss.IndexIVF):
+            # Both flags map the inverted lists, which hold nearly all of the data.
+            return []
+        if isinstance(index, faiss.IndexFlatCodes) and ifc:
+            return []
+        return [name]
+
     def doc(self, docid: Union[str, int]) -> Optional[Document]:
         """Return the :class:`Document` corresponding to ``docid``. Since dense indexes don't store documents
         but sparse indexes do, route over to corresponding sparse index (according to prebuilt_index_info.py)
@@ -364,15 +527,37 @@ class FaissSearcher:
             return AutoQueryEncoder(encoder_dir=encoder)
 
     @staticmethod
-    def load_docids(docid_path: str) -> List[str]:
-        id_f = open(docid_path, 'r')
-        docids = [line.rstrip() for line in id_f.readlines()]
-        id_f.close()
-        return docids
+    def load_docids(docid_path: str) -> DocidTable:
+        return DocidTable(docid_path)
 
     def set_hnsw_ef_search(self, ef_search: int):
         self.index.hnsw.efSearch = ef_search
 
+    def with_query_encoder(self, query_encoder: Union[QueryEncoder, str],
+                           query_encoder_id: Optional[str] = None) -> 'FaissSearcher':
+        """Return a searcher that encodes queries with ``query_encoder`` and shares this searcher's index, so that
+        switching encoders does not reload the index.
+
+        Parameters
+        ----------
+        query_encoder : Union[QueryEncoder, str]
+            Query encoder, which may be shared with other searchers, or the name of one to load.
+        query_encoder_id : str
+            Identity of the encoder in the query embedding cache; defaults to ``query_encoder_identity``.
+
+        Returns
+        -------
+        FaissSearcher
+            Searcher over the same index.
+        """
+        searcher = copy.copy(self)
+        if isinstance(query_encoder, str):
+            searcher.query_encoder = self._init_encoder_from_str(query_encoder)
+        else:
+            searcher.query_encoder = query_encoder
+        searcher.query_encoder_id = query_encoder_id or query_encoder_identity(query_encoder)
+        return searcher
+
 
 class BinaryDenseFaissSearcher(FaissSearcher):
     """Simple Searcher for binary-dense representation
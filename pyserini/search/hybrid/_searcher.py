@@ -18,8 +18,12 @@
 This module provides Pyserini's hybrid searcher by Dense + Sparse
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 
+import numpy as np
+
+from pyserini.pyclass import detaching
 from pyserini.search.faiss import FaissSearcher, DenseSearchResult
 from pyserini.search.lucene import LuceneSearcher
 
@@ -38,45 +42,75 @@ class HybridSearcher:
         self.sparse_searcher = sparse_searcher
 
     def search(self, query: str, k0: int = 10, k: int = 10, alpha: float = 0.1, normalization: bool = False, weight_on_dense: bool = False) -> List[DenseSearchResult]:
-        dense_hits = self.dense_searcher.search(query, k0)
-        sparse_hits = self.sparse_searcher.search(query, k0)
+        dense_hits, sparse_hits = self._run_legs(lambda searcher: searcher.search(query, k0))
         return self._hybrid_results(dense_hits, sparse_hits, alpha, k, normalization, weight_on_dense)
 
     def batch_search(self, queries: List[str], q_ids: List[str], k0: int = 10, k: int = 10, threads: int = 1,
             alpha: float = 0.1, normalization: bool = False, weight_on_dense: bool = False) \
             -> Dict[str, List[DenseSearchResult]]:
-        dense_result = self.dense_searcher.batch_search(queries, q_ids, k0, threads)
-        sparse_result = self.sparse_searcher.batch_search(queries, q_ids, k0, threads)
+        dense_result, sparse_result = self._run_legs(
+            lambda searcher: searcher.batch_search(queries, q_ids, k0, threads))
         hybrid_result = {
             key: self._hybrid_results(dense_result[key], sparse_result[key], alpha, k, normalization, weight_on_dense)
             for key in dense_result
         }
         return hybrid_result
 
+    def _run_legs(self, search):
+        """Run ``search`` on the dense and sparse searchers concurrently; Faiss releases the GIL and Lucene searches
+        run in the JVM, so the two legs overlap. The dense leg may itself be a Lucene searcher, so its thread detaches
+        from the JVM when done."""
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            dense_future = executor.submit(detaching(search), self.dense_searcher)
+            sparse_result = search(self.sparse_searcher)
+            return dense_future.result(), sparse_result
+
     @staticmethod
     def _hybrid_results(dense_results, sparse_results, alpha, k, normalization=False, weight_on_dense=False):
-        dense_hits = {hit.docid: hit.score for hit in dense_results}
-        sparse_hits = {hit.docid: hit.score for hit in sparse_results}
-        hybrid_result = []
-        min_dense_score = min(dense_hits.values()) if len(dense_hits) > 0 else 0
-        max_dense_score = max(dense_hits.values()) if len(dense_hits) > 0 else 1
-        min_sparse_score = min(sparse_hits.values()) if len(sparse_hits) > 0 else 0
-        max_sparse_score = max(sparse_hits.values()) if len(sparse_hits) > 0 else 1
-        for doc in set(dense_hits.keys()) | set(sparse_hits.keys()):
-            if doc not in dense_hits:
-                sparse_score = sparse_hits[doc]
-                dense_score = min_dense_score
-            elif doc not in sparse_hits:
-                sparse_score = min_sparse_score
-                dense_score = dense_hits[doc]
-            else:
-                sparse_score = sparse_hits[doc]
-                dense_score = dense_hits[doc]
-            if normalization:
-                sparse_score = (sparse_score - (min_sparse_score + max_sparse_score) / 2) \
+        dense_docids = [hit.docid for hit in dense_results]
+        sparse_docids = [hit.docid for hit in sparse_results]
+        all_docids = dense_docids + sparse_docids
+        if not all_docids:
+            return []
+        # Scores keep their own dtype (float32 from Faiss, float64 from Lucene); the casts below reproduce the
+        # precision of the equivalent scalar arithmetic on numpy and Python scalars.
+        dense_scores = np.array([hit.score for hit in dense_results]) if dense_docids else np.zeros(0)
+        sparse_scores = np.array([hit.score for hit in sparse_results], dtype=np.float64)
+        min_dense_score = dense_scores.min() if len(dense_scores) > 0 else 0
+        max_dense_score = dense_scores.max() if len(dense_scores) > 0 else 1
+        min_sparse_score = sparse_scores.min() if len(sparse_scores) > 0 else 0
+        max_sparse_score = sparse_scores.max() if len(sparse_scores) > 0 else 1
+
+        # Union of both legs; docs missing from one leg get that leg's min score.
+        docids, first, inverse = np.unique(np.array(all_docids), return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        union_dense = np.full(len(docids), min_dense_score, dtype=dense_scores.dtype)
+        union_dense[inverse[:len(dense_docids)]] = dense_scores
+        union_sparse = np.full(len(docids), min_sparse_score, dtype=np.float64)
+        union_sparse[inverse[len(dense_docids):]] = sparse_scores
+
+        if normalization:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                union_sparse = (union_sparse - (min_sparse_score + max_sparse_score) / 2) \
                                / (max_sparse_score - min_sparse_score)
-                dense_score = (dense_score - (min_dense_score + max_dense_score) / 2) \
+                union_dense = (union_dense - (min_dense_score + max_dense_score) / 2) \
                               / (max_dense_score - min_dense_score)
-            score = alpha * sparse_score + dense_score if not weight_on_dense else sparse_score + alpha * dense_score
-            hybrid_result.append(DenseSearchResult(doc, score))
-        return sorted(hybrid_result, key=lambda x: x.score, reverse=True)[:k]
+        dtype = union_dense.dtype
+        if not weight_on_dense:
+            scores = (alpha * union_sparse).astype(dtype) + union_dense
+        else:
+            scores = union_sparse.astype(dtype) + dtype.type(alpha) * union_dense
+
+        # Partial selection of the top k: only docs scoring at least the k-th best score get sorted. All ties on that
+        # score are kept so that ties are broken deterministically, by first appearance with dense hits first.
+        candidates = np.arange(len(scores))
+        if 0 < k < len(scores):
+            kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+            if not np.isnan(kth_score):
+                candidates = np.flatnonzero(scores >= kth_score)
+        order = candidates[np.lexsort((first[candidates], -scores[candidates]))][:k]
+        top_scores = scores[order]
+        if top_scores.dtype == np.float64:
+            # Python floats, as the scalar arithmetic would give.
+            top_scores = top_scores.tolist()
+        return [DenseSearchResult(docid, score) for docid, score in zip(docids[order].tolist(), top_scores)]
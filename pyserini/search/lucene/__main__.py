@@ -16,19 +16,20 @@
 
 import argparse
 import os
+from collections import deque
 
 from tqdm import tqdm
 from transformers import AutoTokenizer
 
 from pyserini.analysis import JDefaultEnglishAnalyzer, JWhiteSpaceAnalyzer
-from pyserini.output_writer import OutputFormat, get_output_writer
+from pyserini.output_writer import OutputFormat, PipelinedWriter, RunCheckpoint, get_output_writer
 from pyserini.query_iterator import get_query_iterator, TopicsFormat
 from pyserini.search._base import get_bright_excluded_ids
 from pyserini.search.lucene import JDisjunctionMaxQueryGenerator, JQuerySideBm25QueryGenerator
 from ._hnsw_searcher import LuceneHnswDenseSearcher, LuceneFlatDenseSearcher
 from ._impact_searcher import LuceneImpactSearcher, SlimSearcher
 from ._searcher import LuceneSearcher
-from .reranker import ClassifierType, PseudoRelevanceClassifierReranker
+from .reranker import ClassifierType, PseudoRelevanceClassifierReranker, PseudoRelevanceClassifierRerankerPool
 
 
 def set_bm25_parameters(searcher, index, k1=None, b=None):
@@ -88,6 +89,9 @@ def define_search_args(parser):
     parser.add_argument('--encoder', type=str, default=None, help="encoder name")
     parser.add_argument('--onnx-encoder', type=str, default=None, help="onnx encoder name")
     parser.add_argument('--min-idf', type=int, default=0, help="minimum idf")
+    parser.add_argument('--encode-batch-size', type=int, default=None,
+                        help="Encode impact queries in batches of this size, overlapping encoding of each batch with "
+                             "retrieval of the previous one.")
 
     parser.add_argument('--bm25', action='store_true', default=True, help="Use BM25 (default).")
     parser.add_argument('--bm25qs', action='store_true', help="Use BM25 also on query side.")
@@ -114,6 +118,9 @@ def define_search_args(parser):
                         help='Number of negative labels in pseudo relevance feedback.')
     parser.add_argument('--prcl.alpha', dest='alpha', type=float, default=0.5,
                         help='Alpha value for interpolation in pseudo relevance feedback.')
+    parser.add_argument('--prcl.processes', dest='prcl_processes', type=int, default=1,
+                        help='Number of worker processes to rerank topics in; the output is the same as reranking '
+                             'them one by one.')
 
     parser.add_argument('--fields', metavar="key=value", nargs='+',
                         help='Fields to search with assigned float weights.')
@@ -144,6 +151,18 @@ def define_search_args(parser):
                         default=1, help="Specify batch size to search the collection concurrently.")
     parser.add_argument('--threads', type=int, metavar='num', required=False,
                         default=1, help="Maximum number of threads to use.")
+    parser.add_argument('--pipeline-depth', type=int, metavar='num', required=False, default=0,
+                        help="Post-process and write results on a separate thread while the next batch is retrieved, "
+                             "with up to this many batches queued; 0 writes them on the main thread.")
+    parser.add_argument('--shard-id', type=int, metavar='num', required=False, default=0,
+                        help="0-based id of the shard of the topics to search; merge the shard runs with "
+                             "pyserini.search.merge_runs.")
+    parser.add_argument('--shard-num', type=int, metavar='num', required=False, default=1,
+                        help="Number of shards to split the topics into.")
+    parser.add_argument('--checkpoint-interval', type=int, metavar='num', required=False, default=0,
+                        help="Checkpoint the finished topics every this many topics; 0 disables checkpointing.")
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help="Resume an interrupted run from its checkpoint, skipping the finished topics.")
     parser.add_argument('--tokenizer', type=str, help='tokenizer used to preprocess topics')
     parser.add_argument('--remove-duplicates', action='store_true', default=False, help="Remove duplicate docs.")
 
@@ -157,8 +176,13 @@ if __name__ == "__main__":
     define_search_args(parser)
     args = parser.parse_args()
 
+    if args.resume and args.checkpoint_interval <= 0:
+        parser.error('--resume requires --checkpoint-interval.')
+
     query_iterator = get_query_iterator(args.topics, TopicsFormat(args.topics_format))
     topics = query_iterator.topics
+    if args.shard_num > 1:
+        query_iterator.shard(args.shard_id, args.shard_num)
 
     if args.dense:
         # Note that it's not actually necessary to check if it's a prebuilt index or an index location;
@@ -288,9 +312,15 @@ if __name__ == "__main__":
 
     # get re-ranker
     use_prcl = args.prcl and len(args.prcl) > 0 and args.alpha > 0
+    rerank_pool = None
     if use_prcl is True:
-        ranker = PseudoRelevanceClassifierReranker(
-            searcher.index_dir, args.vectorizer, args.prcl, r=args.r, n=args.n, alpha=args.alpha)
+        if args.prcl_processes > 1:
+            rerank_pool = PseudoRelevanceClassifierRerankerPool(
+                searcher.index_dir, args.vectorizer, args.prcl, r=args.r, n=args.n, alpha=args.alpha,
+                processes=args.prcl_processes)
+        else:
+            ranker = PseudoRelevanceClassifierReranker(
+                searcher.index_dir, args.vectorizer, args.prcl, r=args.r, n=args.n, alpha=args.alpha)
 
     # build output path
     output_path = args.output
@@ -316,8 +346,22 @@ if __name__ == "__main__":
 
     print(f'Running {args.topics} topics, saving to {output_path}...')
     tag = output_path[:-4] if args.output is None else 'Anserini'
+    if args.output is None and args.shard_num > 1:
+        output_path = f'{output_path[:-4]}.shard{args.shard_id}.txt'
+
+    checkpoint = None
+    output_mode = 'w'
+    if args.checkpoint_interval > 0:
+        checkpoint = RunCheckpoint(output_path, args.checkpoint_interval)
+        if args.resume:
+            finished_topics = checkpoint.resume()
+            query_iterator.skip(finished_topics)
+            output_mode = 'a'
+            print(f'Resuming from {checkpoint.path}, skipping {len(finished_topics)} finished topics')
+        else:
+            checkpoint.start()
 
-    output_writer = get_output_writer(output_path, OutputFormat(args.output_format), 'w',
+    output_writer = get_output_writer(output_path, OutputFormat(args.output_format), output_mode,
                                       max_hits=args.hits, tag=tag, topics=topics,
                                       use_max_passage=args.max_passage,
                                       max_passage_delimiter=args.max_passage_delimiter,
@@ -325,10 +369,56 @@ if __name__ == "__main__":
 
     bright_queries = get_bright_excluded_ids(args.index)
 
-    with output_writer:
+    def apply_rerank(hits, reranked):
+        scores, docids = reranked
+        docid_score_map = dict(zip(docids, scores))
+        for hit in hits:
+            hit.score = docid_score_map[hit.docid.strip()]
+
+    def write_hits(topic, hits):
+        if args.remove_duplicates:
+            seen_docids = set()
+            dedup_hits = []
+            for hit in hits:
+                if hit.docid.strip() in seen_docids:
+                    continue
+                seen_docids.add(hit.docid.strip())
+                dedup_hits.append(hit)
+            hits = dedup_hits
+
+        # For some test collections, a query is doc from the corpus (e.g., arguana in BEIR).
+        # We want to remove the query from the results.
+        if args.remove_query:
+            hits = [hit for hit in hits if hit.docid != topic]
+
+        if bright_queries:
+            excluded = bright_queries.get(str(topic), ())
+            hits = [hit for hit in hits if hit.docid.strip() not in excluded]
+
+        # write results
+        output_writer.write(topic, hits)
+
+    def write_results(results):
+        for topic, hits in results:
+            write_hits(topic, hits)
+        if checkpoint is not None:
+            checkpoint.record(output_writer, [topic for topic, _ in results])
+
+    # Topics being reranked by the pool, with their hits, in topic order; bounded so that retrieval does not run
+    # arbitrarily far ahead of the writer.
+    pending_topics = deque()
+    max_pending_topics = 4 * args.prcl_processes
+
+    def pop_pending_topic():
+        topic, hits, future = pending_topics.popleft()
+        if future is not None:
+            apply_rerank(hits, future.result())
+        return topic, hits
+
+    with output_writer, PipelinedWriter(args.pipeline_depth) as pipeline:
         batch_topics = list()
         batch_topic_ids = list()
-        for index, (topic_id, text) in enumerate(tqdm(query_iterator, total=len(topics.keys()))):
+        for index, (topic_id, text) in enumerate(tqdm(query_iterator, total=len(query_iterator))):
             if args.tokenizer is not None:
                 toks = tokenizer.tokenize(text)
                 text = ' '
@@ -346,14 +436,19 @@ if __name__ == "__main__":
             else:
                 batch_topic_ids.append(str(topic_id))
                 batch_topics.append(text)
-                if (index + 1) % args.batch_size == 0 or index == len(topics.keys()) - 1:
+                if (index + 1) % args.batch_size == 0 or index == len(query_iterator) - 1:
                     if args.dense:
                         # Both LuceneHnswDenseSearcher and LuceneFlatDenseSearcher are called the same way,
                         # so we don't need to differentiate.
                         results = searcher.batch_search(batch_topics, batch_topic_ids, args.hits, args.threads)
                     elif args.impact:
-                        results = searcher.batch_search(
-                            batch_topics, batch_topic_ids, args.hits, args.threads, fields=fields)
+                        if args.encode_batch_size and not isinstance(searcher, SlimSearcher):
+                            results = searcher.batch_search(
+                                batch_topics, batch_topic_ids, args.hits, args.threads, fields=fields,
+                                encode_batch_size=args.encode_batch_size)
+                        else:
+                            results = searcher.batch_search(
+                                batch_topics, batch_topic_ids, args.hits, args.threads, fields=fields)
                     else:
                         results = searcher.batch_search(
                             batch_topics, batch_topic_ids, args.hits, args.threads,
@@ -364,36 +459,33 @@ if __name__ == "__main__":
                 else:
                     continue
 
+            ready_results = []
             for topic, hits in results:
                 # do rerank
+                future = None
                 if use_prcl and len(hits) > (args.r + args.n):
                     docids = [hit.docid.strip() for hit in hits]
                     scores = [hit.score for hit in hits]
-                    scores, docids = ranker.rerank(docids, scores)
-                    docid_score_map = dict(zip(docids, scores))
-                    for hit in hits:
-                        hit.score = docid_score_map[hit.docid.strip()]
-                        
-                if args.remove_duplicates:
-                    seen_docids = set()
-                    dedup_hits = []
-                    for hit in hits:
-                        if hit.docid.strip() in seen_docids:
-                            continue
-                        seen_docids.add(hit.docid.strip())
-                        dedup_hits.append(hit)
-                    hits = dedup_hits
-
-                # For some test collections, a query is doc from the corpus (e.g., arguana in BEIR).
-                # We want to remove the query from the results.
-                if args.remove_query:
-                    hits = [hit for hit in hits if hit.docid != topic]
-
-                if bright_queries:
-                    excluded = bright_queries.get(str(topic), ())
-                    hits = [hit for hit in hits if hit.docid.strip() not in excluded]
-
-                # write results
-                output_writer.write(topic, hits)
-
-            results.clear()
+                    if rerank_pool is None:
+                        apply_rerank(hits, ranker.rerank(docids, scores))
+                    else:
+                        future = rerank_pool.submit(docids, scores)
+
+                if rerank_pool is None:
+                    ready_results.append((topic, hits))
+                    continue
+
+                pending_topics.append((topic, hits, future))
+                while pending_topics and (len(pending_topics) > max_pending_topics or pending_topics[0][2] is None
+                                          or pending_topics[0][2].done()):
+                    ready_results.append(pop_pending_topic())
+
+            # post-process and write, possibly on the writer thread
+            pipeline.submit(write_results, ready_results)
+
+        pipeline.submit(write_results, [pop_pending_topic() for _ in range(len(pending_topics))])
+        if checkpoint is not None:
+            pipeline.submit(checkpoint.flush, output_writer)
+
+    if rerank_pool is not None:
+        rerank_pool.shutdown()
@@ -15,9 +15,9 @@
 #
 
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from pyserini.pyclass import autoclass, JArrayList
+from pyserini.pyclass import autoclass, JArrayList, JInt
 from pyserini.util import download_prebuilt_index
 
 logger = logging.getLogger(__name__)
@@ -30,6 +30,8 @@ JFlatDenseSearcher = autoclass('io.anserini.search.FlatDenseSearcher')
 JFlatDenseSearcherArgs = autoclass('io.anserini.search.FlatDenseSearcher$Args')
 
 JScoredDoc = autoclass('io.anserini.search.ScoredDoc')
+JIndexConstants = autoclass('io.anserini.index.Constants')
+JKnnFloatVectorQuery = autoclass('org.apache.lucene.search.KnnFloatVectorQuery')
 
 
 class LuceneHnswDenseSearcher:
@@ -43,6 +45,7 @@ class LuceneHnswDenseSearcher:
 
     def __init__(self, index_dir: str, ef_search=100, encoder=None, prebuilt_index_name=None, verbose=False):
         self.index_dir = index_dir
+        self.ef_search = ef_search
 
         args = JHnswDenseSearcherArgs()
         args.index = index_dir
@@ -87,7 +90,7 @@ class LuceneHnswDenseSearcher:
 
         return cls(index_dir, ef_search=ef_search, encoder=encoder, prebuilt_index_name=prebuilt_index_name, verbose=verbose)
 
-    def search(self, q: str, k: int = 10) -> List[JScoredDoc]:
+    def search(self, q: str, k: int = 10, ef_search: Optional[int] = None) -> List[JScoredDoc]:
         """Search the collection.
 
         Parameters
@@ -96,14 +99,28 @@ class LuceneHnswDenseSearcher:
             Query string.
         k : int
             Number of hits to return.
+        ef_search : int
+            Size of the HNSW candidate list for this search only; defaults to the searcher's ``ef_search``. The
+            index and encoder are shared by searches with different values.
 
         Returns
         -------
         List[JScoredDoc]
             List of search results.
         """
-
-        return self.searcher.search(q, k)
+        if ef_search is None or ef_search == self.ef_search:
+            return self.searcher.search(q, k)
+
+        # As HnswDenseSearcher.search, but with the vector query built for this ef_search. Anserini has no public
+        # per-search efSearch, so this uses its private encoder and generator fields and protected getIndexSearcher
+        # (JNI skips Java access checks); TestLuceneHnswDenseSearcherEfSearch checks it against the bundled jar.
+        if self.searcher.encoder is not None:
+            query = JKnnFloatVectorQuery(JIndexConstants.VECTOR, self.searcher.encoder.encode(q), int(ef_search))
+        else:
+            query = self.searcher.generator.buildQuery(JIndexConstants.VECTOR, q, JInt(int(ef_search)))
+        top_docs = self.searcher.getIndexSearcher().search(query, int(k), JHnswDenseSearcher.BREAK_SCORE_TIES_BY_DOCID,
+                                                           True)
+        return self.searcher.processLuceneTopDocs(None, top_docs)
 
     def batch_search(self, queries: List[str], qids: List[str], k: int = 10, threads: int = 4) -> Dict[str, List[JScoredDoc]]:
         """Search the collection concurrently for multiple queries, using multiple threads.
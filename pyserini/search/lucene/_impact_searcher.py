@@ -19,20 +19,21 @@ This module provides Pyserini's Python search interface to Anserini. The main en
 class, which wraps the Java class with the same name in Anserini.
 """
 
+import copy
 import logging
 import os
 import pickle
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Union
 
 import numpy as np
 import scipy
-from tqdm import tqdm
 
 from pyserini.encode import QueryEncoder, CachedDataQueryEncoder, SlimQueryEncoder, SpladeQueryEncoder, \
-    TokFreqQueryEncoder, UniCoilQueryEncoder
-from pyserini.index.lucene import Document, LuceneIndexReader
-from pyserini.pyclass import autoclass, JFloat, JInt, JArrayList, JHashMap
+    TokFreqQueryEncoder, UniCoilQueryEncoder, QueryEmbeddingCache, query_encoder_identity
+from pyserini.index.lucene import Document, IdfTable
+from pyserini.pyclass import autoclass, detaching, JFloat, JInt, JArrayList, JHashMap
 from pyserini.search.lucene import JScoredDoc
 from pyserini.util import download_prebuilt_index, download_encoded_corpus
 
@@ -59,14 +60,17 @@ class LuceneImpactSearcher:
         Path to Lucene index directory.
     query_encoder: QueryEncoder or str
         QueryEncoder to encode query text
+    query_cache : QueryEmbeddingCache
+        Optional cache of encoded queries (pytorch encoders only), which may be shared with other searchers.
     """
 
-    def __init__(self, index_dir: str, query_encoder: Union[QueryEncoder, str], min_idf=0, encoder_type: str = 'pytorch', prebuilt_index_name=None):
+    def __init__(self, index_dir: str, query_encoder: Union[QueryEncoder, str], min_idf=0, encoder_type: str = 'pytorch', prebuilt_index_name=None,
+                 query_cache: Optional[QueryEmbeddingCache] = None):
         self.index_dir = index_dir
-        self.idf = self._compute_idf(index_dir)
         self.min_idf = min_idf
         self.object = JSimpleImpactSearcher(index_dir)
         self.num_docs = self.object.get_total_num_docs()
+        self.idf = IdfTable.from_index(index_dir)
         self.encoder_type = encoder_type
         self.query_encoder = query_encoder
         self.prebuilt_index_name = prebuilt_index_name
@@ -82,9 +86,12 @@ class LuceneImpactSearcher:
                 self.query_encoder = query_encoder
         else:
             raise ValueError(f'Invalid encoder type: {encoder_type}')
+        self.query_cache = query_cache
+        self.query_encoder_id = query_encoder_identity(query_encoder if query_encoder is not None else self.query_encoder)
 
     @classmethod
-    def from_prebuilt_index(cls, prebuilt_index_name: str, query_encoder: Union[QueryEncoder, str], min_idf=0, encoder_type: str = 'pytorch'):
+    def from_prebuilt_index(cls, prebuilt_index_name: str, query_encoder: Union[QueryEncoder, str], min_idf=0, encoder_type: str = 'pytorch',
+                            query_cache: Optional[QueryEmbeddingCache] = None):
         """Build a searcher from a prebuilt index; download the index if necessary.
 
         Parameters
@@ -97,6 +104,8 @@ class LuceneImpactSearcher:
             Minimum idf for query tokens
         encoder_type : str
             Encoder type, either 'pytorch' or 'onnx'
+        query_cache : QueryEmbeddingCache
+            Optional cache of encoded queries.
 
         Returns
         -------
@@ -112,16 +121,32 @@ class LuceneImpactSearcher:
             return None
 
         print(f'Initializing {prebuilt_index_name}...')
-        return cls(index_dir, query_encoder, min_idf, encoder_type, prebuilt_index_name=prebuilt_index_name)
+        return cls(index_dir, query_encoder, min_idf, encoder_type, prebuilt_index_name=prebuilt_index_name,
+                   query_cache=query_cache)
 
     def encode(self, query):
         if self.encoder_type == 'onnx':
             encoded_query = self.object.encode_with_onnx(query)
         elif self.encoder_type == 'pytorch':
-            encoded_query = self.query_encoder.encode(query)
+            if self.query_cache is not None:
+                encoded_query = self.query_cache.get_or_encode(self.query_encoder_id, query, self.query_encoder.encode)
+            else:
+                encoded_query = self.query_encoder.encode(query)
         else: raise ValueError(f'Invalid query encoder type: {type(self.query_encoder)} for encode')
         return encoded_query
 
+    def encode_batch(self, queries: List[str]) -> List[Dict[str, float]]:
+        """Encode a batch of queries with the pytorch query encoder, in mini-batches if the encoder supports it."""
+        if self.encoder_type != 'pytorch':
+            raise ValueError(f'Invalid query encoder type: {type(self.query_encoder)} for encode_batch')
+        if hasattr(self.query_encoder, 'encode_batch'):
+            encode_batch = self.query_encoder.encode_batch
+        else:
+            encode_batch = lambda qs: [self.query_encoder.encode(q) for q in qs]
+        if self.query_cache is not None:
+            return self.query_cache.get_or_encode_batch(self.query_encoder_id, queries, encode_batch)
+        return encode_batch(queries)
+
     @staticmethod
     def list_prebuilt_indexes():
         """Display information about available prebuilt indexes."""
@@ -150,11 +175,7 @@ class LuceneImpactSearcher:
             jfields.put(field, JFloat(boost))
 
         if self.encoder_type == 'pytorch':
-            jquery = JHashMap()
-            encoded_query = self.encode(q)
-            for (token, weight) in encoded_query.items():
-                if token in self.idf and self.idf[token] > self.min_idf:
-                    jquery.put(token, JInt(weight))
+            jquery = self._to_jquery(self.idf.filter([self.encode(q)], self.min_idf)[0])
         else:
             jquery = q
 
@@ -166,7 +187,8 @@ class LuceneImpactSearcher:
         return hits
 
     def batch_search(self, queries: List[str], qids: List[str],
-                     k: int = 10, threads: int = 1, fields=dict()) -> Dict[str, List[JScoredDoc]]:
+                     k: int = 10, threads: int = 1, fields=dict(),
+                     encode_batch_size: Optional[int] = None) -> Dict[str, List[JScoredDoc]]:
         """Search the collection concurrently for multiple queries, using multiple threads.
 
         Parameters
@@ -181,6 +203,10 @@ class LuceneImpactSearcher:
             Maximum number of threads to use.
         fields : dict
             Optional map of fields to search with associated boosts.
+        encode_batch_size : Optional[int]
+            If set, queries are encoded in batches of this size and each batch is searched as soon as it is encoded,
+            so that encoding the next batch overlaps with retrieval of the previous one. By default, all queries are
+            encoded before searching. Only applies to the pytorch encoder type.
 
         Returns
         -------
@@ -188,28 +214,58 @@ class LuceneImpactSearcher:
             Dictionary holding the search results, with the query ids as keys and the corresponding lists of search
             results as the values.
         """
+        if self.encoder_type != 'pytorch':
+            return self._batch_search_jqueries(queries, qids, k, threads, fields)
+        if not encode_batch_size or encode_batch_size >= len(queries):
+            jqueries = [self._to_jquery(encoded_query)
+                        for encoded_query in self.idf.filter(self.encode_batch(queries), self.min_idf)]
+            return self._batch_search_jqueries(jqueries, qids, k, threads, fields)
+
+        # Java searches release the GIL, so the previous batch is retrieved while the next one is encoded. Pyjnius
+        # binds Java methods through descriptors shared by all instances of a class, so the Java arguments are built
+        # here rather than on the worker, which only runs the search and then detaches from the JVM.
+        results = {}
+        search = detaching(self._batch_search_jlists)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = None
+            for start in range(0, len(queries), encode_batch_size):
+                end = start + encode_batch_size
+                encoded_queries = self.idf.filter(self.encode_batch(queries[start:end]), self.min_idf)
+                jqueries = [self._to_jquery(encoded_query) for encoded_query in encoded_queries]
+                jlists = self._to_jlists(jqueries, qids[start:end], fields)
+                if future is not None:
+                    results.update(future.result())
+                future = executor.submit(search, *jlists, k, threads)
+            results.update(future.result())
+        return results
+
+    @staticmethod
+    def _to_jquery(encoded_query: Dict[str, float]):
+        """Convert an encoded query, already filtered with ``self.idf.filter``, to a Java map."""
+        jquery = JHashMap()
+        for (token, weight) in encoded_query.items():
+            jquery.put(token, JInt(weight))
+        return jquery
+
+    @staticmethod
+    def _to_jlists(jqueries, qids, fields):
         query_lst = JArrayList()
         qid_lst = JArrayList()
-        for q in queries:
-            jquery = JHashMap()
-            if self.encoder_type == 'pytorch':
-                encoded_query = self.encode(q)
-                for (token, weight) in encoded_query.items():
-                    if token in self.idf and self.idf[token] > self.min_idf:
-                        jquery.put(token, JInt(weight))
-            else:
-                jquery = q
+        for jquery in jqueries:
             query_lst.add(jquery)
-
         for qid in qids:
-            jqid = qid
-            qid_lst.add(jqid)
+            qid_lst.add(qid)
 
         jfields = JHashMap()
         for (field, boost) in fields.items():
             jfields.put(field, JFloat(boost))
+        return query_lst, qid_lst, jfields
 
-        if not fields:
+    def _batch_search_jqueries(self, jqueries, qids, k, threads, fields) -> Dict[str, List[JScoredDoc]]:
+        return self._batch_search_jlists(*self._to_jlists(jqueries, qids, fields), k, threads)
+
+    def _batch_search_jlists(self, query_lst, qid_lst, jfields, k, threads) -> Dict[str, List[JScoredDoc]]:
+        if jfields.isEmpty():
             if self.encoder_type == 'onnx':
                 results = self.object.batch_search_queries(query_lst, qid_lst, int(k), int(threads))
             else:
@@ -369,6 +425,35 @@ class LuceneImpactSearcher:
         """Close the searcher."""
         self.object.close()
 
+    def with_query_encoder(self, query_encoder: Union[QueryEncoder, str],
+                           query_encoder_id: Optional[str] = None) -> 'LuceneImpactSearcher':
+        """Return a searcher that encodes queries with ``query_encoder`` and shares this searcher's index (and its
+        Anserini searcher), so that switching encoders does not reopen the index. Only for pytorch encoders.
+
+        Parameters
+        ----------
+        query_encoder : Union[QueryEncoder, str]
+            Query encoder, which may be shared with other searchers, or the name of one to load.
+        query_encoder_id : str
+            Identity of the encoder in the query embedding cache; defaults to ``query_encoder_identity``.
+
+        Returns
+        -------
+        LuceneImpactSearcher
+            Searcher over the same index.
+        """
+        if self.encoder_type != 'pytorch':
+            raise ValueError(f'Invalid encoder type: {self.encoder_type} for with_query_encoder')
+        searcher = copy.copy(self)
+        if isinstance(query_encoder, str):
+            searcher.query_encoder = self._init_query_encoder_from_str(query_encoder)
+            if searcher.query_encoder is None:
+                raise ValueError(f'Unknown query encoder: {query_encoder}')
+        else:
+            searcher.query_encoder = query_encoder
+        searcher.query_encoder_id = query_encoder_id or query_encoder_identity(query_encoder)
+        return searcher
+
     @staticmethod
     def _init_query_encoder_from_str(query_encoder):
         if query_encoder is None:
@@ -382,44 +467,78 @@ class LuceneImpactSearcher:
         elif 'slim' in query_encoder.lower():
             return SlimQueryEncoder(query_encoder)
 
-    @staticmethod
-    def _compute_idf(index_path):
-        index_reader = LuceneIndexReader(index_path)
-        tokens = []
-        dfs = []
-        for term in index_reader.terms():
-            dfs.append(term.df)
-            tokens.append(term.term)
-        idfs = np.log((index_reader.stats()['documents'] / (np.array(dfs))))
-        return dict(zip(tokens, idfs))
-
 
 SlimResult = namedtuple("SlimResult", "docid score")
 
 
-def maxsim(entry):
-    q_embed, d_embeds, d_lens, qid, scores, docids = entry
-    if len(d_embeds) == 0:
-        return qid, scores, docids
-    d_embeds = scipy.sparse.vstack(d_embeds).transpose() # (LD x 1000) x D
-    max_scores = (q_embed@d_embeds).todense() # LQ x (LD x 1000)
-    scores = []
-    start = 0
-    for d_len in d_lens:
-        scores.append(max_scores[:, start:start+d_len].max(1).sum())
-        start += d_len
-    scores, docids = list(zip(*sorted(list(zip(scores, docids)), key=lambda x: -x[0])))
-    return qid, scores, docids
+def maxsim(q_embed, corpus, starts: np.ndarray, ends: np.ndarray, max_block_size: Optional[int] = None) -> np.ndarray:
+    """Compute the MaxSim scores of a query against documents stored as row ranges of a sparse corpus matrix.
+
+    Each query token is matched with its most similar token of the document, and the similarities are summed over
+    the query tokens.
+
+    Parameters
+    ----------
+    q_embed : scipy.sparse.csr_matrix
+        Query token representations, one row per query token.
+    corpus : scipy.sparse.csr_matrix
+        Document token representations of the whole corpus, one row per document token.
+    starts : np.ndarray
+        First row of each document in ``corpus``.
+    ends : np.ndarray
+        End (exclusive) of each document's rows in ``corpus``.
+    max_block_size : Optional[int]
+        Maximum number of elements of the dense query-by-document-token similarity matrix. Documents are scored in
+        blocks that stay within this size (but hold at least one document each). By default, all documents are scored
+        at once.
+
+    Returns
+    -------
+    np.ndarray
+        MaxSim score of each document.
+    """
+    lengths = ends - starts
+    ends_in_block = np.cumsum(lengths)
+    block_columns = max(1, max_block_size // max(q_embed.shape[0], 1)) if max_block_size else None
+    blocks = []
+    begin = 0
+    while begin < len(starts):
+        end = len(starts)
+        if block_columns is not None:
+            offset = ends_in_block[begin - 1] if begin > 0 else 0
+            end = max(begin + 1, int(np.searchsorted(ends_in_block, offset + block_columns, side='right')))
+        blocks.append(_maxsim_block(q_embed, corpus, starts[begin:end], lengths[begin:end]))
+        begin = end
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+
+def _maxsim_block(q_embed, corpus, starts, lengths):
+    offsets = np.cumsum(lengths) - lengths
+    rows = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    similarities = (q_embed @ corpus[rows].transpose()).toarray()  # LQ x (sum of LD)
+    scores = np.zeros(len(starts), dtype=similarities.dtype)
+    non_empty = lengths > 0
+    if non_empty.any():
+        # Max over each document's columns, then sum over the query tokens of each (contiguous) document row.
+        max_similarities = np.maximum.reduceat(similarities, offsets[non_empty], axis=1)
+        scores[non_empty] = np.ascontiguousarray(max_similarities.T).sum(axis=1)
+    return scores
 
 
 class SlimSearcher(LuceneImpactSearcher):
-    def __init__(self, encoded_corpus, *args, **kwargs):
+    """SLIM searcher: retrieves with the fused impact representation and reranks with MaxSim over token vectors.
+
+    The token vectors of the corpus are kept as a single CSR matrix, and ``sparse_ranges`` holds the range of rows of
+    each document. ``maxsim_block_size`` caps the size of the dense similarity matrix built per query (see ``maxsim``).
+    """
+
+    def __init__(self, encoded_corpus, *args, maxsim_block_size: Optional[int] = 2 ** 24, **kwargs):
         super().__init__(*args, **kwargs)
         print("Loading sparse corpus vectors for fast reranking...")
         with open(os.path.join(encoded_corpus, "sparse_range.pkl"), "rb") as f:
-            self.sparse_ranges = pickle.load(f)
-        sparse_vecs = scipy.sparse.load_npz(os.path.join(encoded_corpus, "sparse_vec.npz"))
-        self.sparse_vecs = [sparse_vecs[start:end] for start, end in tqdm(self.sparse_ranges)]
+            self.sparse_ranges = np.asarray(pickle.load(f), dtype=np.int64).reshape(-1, 2)
+        self.sparse_vecs = scipy.sparse.load_npz(os.path.join(encoded_corpus, "sparse_vec.npz")).tocsr()
+        self.maxsim_block_size = maxsim_block_size
     
     @classmethod
     def from_prebuilt_index(cls, encoded_corpus:str, prebuilt_index_name: str, query_encoder: Union[QueryEncoder, str], min_idf=0):
@@ -440,10 +559,7 @@ class SlimSearcher(LuceneImpactSearcher):
             jfields.put(field, JFloat(boost))
 
         fusion_encoded_query, sparse_encoded_query = self.query_encoder.encode(q, return_sparse=True)
-        jquery = JHashMap()
-        for (token, weight) in fusion_encoded_query.items():
-            if token in self.idf and self.idf[token] > self.min_idf:
-                jquery.put(token, JInt(weight))
+        jquery = self._to_jquery(self.idf.filter([fusion_encoded_query], self.min_idf)[0])
 
         if self.sparse_vecs is not None:
             search_k = k * (self.min_idf + 1)
@@ -459,14 +575,13 @@ class SlimSearcher(LuceneImpactSearcher):
         query_lst = JArrayList()
         qid_lst = JArrayList()
         sparse_encoded_queries = {}
+        fusion_encoded_queries = []
         for qid, q in zip(qids, queries):
             fusion_encoded_query, sparse_encoded_query = self.query_encoder.encode(q, return_sparse=True)
-            jquery = JHashMap()
-            for (token, weight) in fusion_encoded_query.items():
-                if token in self.idf and self.idf[token] > self.min_idf:
-                    jquery.put(token, JInt(weight))
-            query_lst.add(jquery)
+            fusion_encoded_queries.append(fusion_encoded_query)
             sparse_encoded_queries[qid] = sparse_encoded_query
+        for fusion_encoded_query in self.idf.filter(fusion_encoded_queries, self.min_idf):
+            query_lst.add(self._to_jquery(fusion_encoded_query))
 
         for qid in qids:
             jqid = qid
@@ -482,41 +597,24 @@ class SlimSearcher(LuceneImpactSearcher):
             results = self.object.batch_search_fields(query_lst, qid_lst, k * (self.min_idf + 1), threads, jfields)
         
         results = {r.getKey(): r.getValue() for r in results.entrySet().toArray()}
-        results = self.fast_rerank(sparse_encoded_queries, results, k)
+        results = self.fast_rerank(sparse_encoded_queries, results, k, threads)
         return results
 
-    def fast_rerank(self, q_embeds, results, k):
-        all_scores = []
-        all_docids = []
-        all_q_embeds = []
-        all_d_embeds = []
-        all_d_lens = []
-        qids = []
-        for qid in results.keys():
-            all_q_embeds.append(q_embeds[qid])
-            qids.append(qid)
-            hits = results[qid]
-            docids = []
-            scores = []
-            d_embeds = []
-            d_lens = []
-            for hit in hits:
-                docids.append(hit.docid)
-                scores.append(hit.score)
-                start, end = self.sparse_ranges[int(hit.docid)]
-                d_embeds.append(self.sparse_vecs[int(hit.docid)])
-                d_lens.append(end-start)
-            all_scores.append(scores)
-            all_docids.append(docids)
-            all_d_embeds.append(d_embeds)
-            all_d_lens.append(d_lens)
-
-        entries = list(zip(all_q_embeds, all_d_embeds, all_d_lens, qids, all_scores, all_docids))
-        results = [maxsim(entry) for entry in entries]
-        anserini_results = {}
-        for qid, scores, docids in results:
-            hits = []
-            for score, docid in list(zip(scores, docids))[:k]:
-                hits.append(SlimResult(docid, score))
-            anserini_results[qid] = hits
-        return anserini_results
+    def fast_rerank(self, q_embeds, results, k, threads: int = 1):
+        """Rerank the hits of each query by MaxSim, spreading the queries over ``threads`` threads."""
+        # Hits are Java objects, so their docids are read here; the workers then only run numpy and scipy code and
+        # never call into the JVM.
+        docids_of = {qid: [hit.docid for hit in hits] for qid, hits in results.items()}
+
+        def rerank(qid):
+            docids = docids_of[qid]
+            rows = np.array([int(docid) for docid in docids], dtype=np.int64)
+            scores = maxsim(q_embeds[qid], self.sparse_vecs, self.sparse_ranges[rows, 0], self.sparse_ranges[rows, 1],
+                            self.maxsim_block_size)
+            # A stable sort keeps the retrieval order of documents with the same score.
+            order = np.argsort(-scores, kind='stable')[:k]
+            return qid, [SlimResult(docids[i], scores[i]) for i in order]
+
+        # Sparse products and numpy reductions release the GIL, so queries are reranked in parallel.
+        with ThreadPoolExecutor(max_workers=max(1, int(threads))) as executor:
+            return dict(executor.map(rerank, docids_of.keys()))
@@ -24,8 +24,8 @@ from typing import Dict, List, Optional, Union
 
 from pyserini.fusion import FusionMethod, reciprocal_rank_fusion
 from pyserini.index.lucene import Document, LuceneIndexReader
-from pyserini.pyclass import autoclass, JFloat, JArrayList, JHashMap
-from pyserini.search.lucene import JQuery, JQueryGenerator, JScoredDoc
+from pyserini.pyclass import autoclass, thread_map, JFloat, JArrayList, JHashMap
+from pyserini.search.lucene import JBagOfWordsQueryGenerator, JQuery, JQueryGenerator, JScoredDoc
 from pyserini.trectools import TrecRun
 from pyserini.util import download_prebuilt_index, get_sparse_indexes_info
 from pyserini.search.lucene.rerank.rm3_reranker import RM3Reranker
@@ -36,6 +36,12 @@ logger = logging.getLogger(__name__)
 
 # Wrappers around Anserini classes
 JSimpleSearcher = autoclass('io.anserini.search.SimpleSearcher')
+JScoredDocs = autoclass('io.anserini.search.ScoredDocs')
+JScoreTiesAdjusterReranker = autoclass('io.anserini.rerank.lib.ScoreTiesAdjusterReranker')
+JIndexSearcher = autoclass('org.apache.lucene.search.IndexSearcher')
+JSort = autoclass('org.apache.lucene.search.Sort')
+JSortField = autoclass('org.apache.lucene.search.SortField')
+JSortFieldType = autoclass('org.apache.lucene.search.SortField$Type')
 
 
 def _reader_has_term_vectors(reader) -> bool:
@@ -275,7 +281,53 @@ class LuceneSearcher:
                 docids.add(hit.docid)
 
         return filtered_hits
-    
+
+    def supports_search_with_similarity(self) -> bool:
+        """Whether :meth:`search_with_similarity` is available: the index must have been created by Lucene 9 or later
+        and relevance feedback must be off."""
+        if self.is_using_rm3() or self.is_using_rocchio():
+            return False
+        leaves = self.object.reader.leaves()
+        return leaves.size() == 0 or leaves.get(0).reader().getMetaData().getCreatedVersionMajor() >= 9
+
+    def search_with_similarity(self, q: str, similarity, k: int = 10,
+                               query_generator: JQueryGenerator = None) -> List[JScoredDoc]:
+        """Search the collection with a scoring function for this call only, e.g., ``LuceneSimilarities.bm25(k1, b)``.
+
+        Unlike :meth:`set_bm25`, this leaves the searcher's own scoring function alone, so calls with different
+        similarities can run concurrently on the same searcher, sharing its index reader. Results are those of
+        :meth:`search` after setting the similarity, including Anserini's tie breaking.
+
+        Parameters
+        ----------
+        q : str
+            Query string.
+        similarity
+            Lucene ``Similarity`` to score with.
+        k : int
+            Number of hits to return.
+        query_generator : JQueryGenerator
+            Generator to build queries. Set to ``None`` by default to use Anserini default.
+
+        Returns
+        -------
+        List[JScoredDoc]
+            List of search results.
+        """
+        if not self.supports_search_with_similarity():
+            raise NotImplementedError('Per-call similarities require a Lucene 9 index and no relevance feedback.')
+        # An IndexSearcher is a lightweight view over the (shared) index reader.
+        searcher = JIndexSearcher(self.object.reader)
+        searcher.setSimilarity(similarity)
+        query_generator = query_generator or JBagOfWordsQueryGenerator()
+        query = query_generator.buildQuery('contents', self.object.get_analyzer(), q)
+        # Sort like Anserini: by score, breaking ties by docid, then round scores and re-break ties.
+        sort = JSort(JSortField.FIELD_SCORE, JSortField('id', JSortFieldType.STRING_VAL))
+        hits = JScoreTiesAdjusterReranker().rerank(JScoredDocs.fromTopDocs(searcher.search(query, k, sort, True),
+                                                                          searcher), None)
+        return [JScoredDoc(docid, lucene_docid, score, lucene_document) for docid, lucene_docid, score, lucene_document
+                in zip(hits.docids, hits.lucene_docids, hits.scores, hits.lucene_documents)]
+
     def batch_search(self, queries: List[str], qids: List[str], k: int = 10, threads: int = 1,
                      query_generator: JQueryGenerator = None, fields = dict()) -> Dict[str, List[JScoredDoc]]:
         """Batch search with optional RM3 or Rocchio relevance feedback.
@@ -302,14 +354,7 @@ class LuceneSearcher:
             results as the values.
         """
         topic_id_to_query = dict(zip(qids, queries))
-        final_results = {}
-
-        def second_pass_search(tid: str, expanded_query):
-            final_results[tid] = self.search_raw(
-                expanded_query, k,
-                query_generator=query_generator,
-                fields=fields
-            )
+        expanded_queries = {}
 
         if self.rm3:
             # First pass: retrieve top M feedback docs for each query
@@ -317,67 +362,57 @@ class LuceneSearcher:
                 queries, qids, self.rm3.fb_docs, threads, query_generator, fields
             )
 
-            for tid, hits in results.items():
-                original_query = topic_id_to_query[tid]
-
-                # Feedback documents (docids + scores)
-                relevant_docids = [hit.docid for hit in hits]
-                scores = [hit.score for hit in hits]
-
-                # Extract term vectors
-                rel_feedback_vectors = [
-                    self.rm3.get_document_vector(docid, self.index_reader, filter_terms=True)
-                    for docid in relevant_docids
-                ]
+            # Fetch term vectors of all feedback docs in the batch at once
+            feedback_vectors = self.rm3.get_document_vectors(
+                [hit.docid for hits in results.values() for hit in hits],
+                self.index_reader, filter_terms=True, threads=threads
+            )
 
+            for tid, hits in results.items():
                 # Build RM3-expanded query
-                rm3_query = self.rm3(
-                    query=original_query,
-                    document_scores=scores,
-                    rel_vectors=rel_feedback_vectors
+                expanded_queries[tid] = self.rm3(
+                    query=topic_id_to_query[tid],
+                    document_scores=[hit.score for hit in hits],
+                    rel_vectors=[feedback_vectors[hit.docid] for hit in hits]
                 )
-
-                second_pass_search(tid, rm3_query)
-
-            return final_results
         elif self.rocchio:
             results = self.batch_search_raw(
                 queries, qids, k, threads, query_generator, fields
             )
 
-            for tid, hits in results.items():
-                original_query = topic_id_to_query[tid]
-
-                # Positive (top) and negative (bottom) feedback docs
-                top_hits = hits[:self.rocchio.top_fb_docs]
-                bottom_hits = [] if self.rocchio.bottom_fb_docs == 0 else hits[-self.rocchio.bottom_fb_docs:]
+            # Positive (top) and negative (bottom) feedback docs
+            top_hits = {tid: hits[:self.rocchio.top_fb_docs] for tid, hits in results.items()}
+            bottom_hits = {tid: [] if self.rocchio.bottom_fb_docs == 0 else hits[-self.rocchio.bottom_fb_docs:]
+                           for tid, hits in results.items()}
 
-                top_docids = [hit.docid for hit in top_hits]
-                bottom_docids = [hit.docid for hit in bottom_hits]
-
-                # Term vectors
-                top_feedback_vectors = [
-                    self.rocchio.get_document_vector(docid, self.index_reader)
-                    for docid in top_docids
-                ]
-                bottom_feedback_vectors = [
-                    self.rocchio.get_document_vector(docid, self.index_reader)
-                    for docid in bottom_docids
-                ]
+            # Fetch term vectors of all feedback docs in the batch at once
+            feedback_vectors = self.rocchio.get_document_vectors(
+                [hit.docid for hits in [*top_hits.values(), *bottom_hits.values()] for hit in hits],
+                self.index_reader, threads=threads
+            )
 
+            for tid in results:
                 # Build Rocchio-expanded query
-                rocchio_query = self.rocchio(
-                    query=original_query,
-                    rel_vectors=top_feedback_vectors,
-                    nrel_vectors=bottom_feedback_vectors
+                expanded_queries[tid] = self.rocchio(
+                    query=topic_id_to_query[tid],
+                    rel_vectors=[feedback_vectors[hit.docid] for hit in top_hits[tid]],
+                    nrel_vectors=[feedback_vectors[hit.docid] for hit in bottom_hits[tid]]
                 )
-
-                second_pass_search(tid, rocchio_query)
-
-            return final_results
         else:
             return self.batch_search_raw(queries, qids, k, threads, query_generator, fields)
-        
+
+        # Second pass: final retrieval with the expanded queries, run concurrently
+        return self._batch_search_expanded(expanded_queries, k, threads, query_generator, fields)
+
+    def _batch_search_expanded(self, expanded_queries: Dict[str, JQuery], k: int, threads: int,
+                               query_generator: JQueryGenerator = None, fields=dict()) -> Dict[str, List[JScoredDoc]]:
+        # Anserini's batch_search only accepts query strings, so we fan the Lucene queries out over our own threads
+        # instead; pyjnius releases the GIL during the call, so the searches proceed concurrently in the JVM.
+        def search(expanded_query):
+            return self.search_raw(expanded_query, k, query_generator=query_generator, fields=fields)
+
+        return dict(zip(expanded_queries.keys(), thread_map(search, expanded_queries.values(), threads)))
+
     def batch_search_raw(self, queries: List[str], qids: List[str], k: int = 10, threads: int = 1,
                      query_generator: JQueryGenerator = None, fields = dict()) -> Dict[str, List[JScoredDoc]]:
         """Search the collection concurrently for multiple queries, using multiple threads.
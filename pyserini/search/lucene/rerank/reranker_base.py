@@ -1,6 +1,10 @@
 import math
+from typing import Dict, List
+
+import numpy as np
+
 from pyserini.analysis import Analyzer, get_lucene_analyzer
-from pyserini.pyclass import autoclass
+from pyserini.pyclass import autoclass, thread_map
 
 # Java Lucene classes
 
@@ -20,18 +24,47 @@ class RelevanceFeedback:
         sorted_items = sorted(vec.items(), key=lambda x: (-x[1], x[0]))
         return dict(sorted_items[:k])
 
-    def get_document_vector(self, docid: str, index_reader, filter_terms: bool = False) -> dict:
-        num_docs = index_reader.stats()['documents']
-        raw_vector = index_reader.get_document_vector(docid)
+    def prune_top_k_arrays(self, terms: np.ndarray, weights: np.ndarray, k: int | None):
+        """Array counterpart of ``prune_top_k``: keep the ``k`` highest weights, breaking ties on the term."""
+        if k is None or len(terms) <= k:
+            return terms, weights
+
+        order = np.lexsort((terms, -weights))[:k]
+        return terms[order], weights[order]
+
+    @staticmethod
+    def to_matrix(vectors: List[dict]):
+        """Stack term vectors into a dense (documents x vocabulary) matrix over their sorted joint vocabulary."""
+        terms = np.array(sorted({term for vec in vectors for term in vec}), dtype=str)
+        matrix = np.zeros((len(vectors), len(terms)), dtype=np.float64)
+        if len(terms) == 0:
+            return terms, matrix
+
+        columns = {term: i for i, term in enumerate(terms.tolist())}
+        for row, vec in enumerate(vectors):
+            if vec:
+                matrix[row, [columns[term] for term in vec]] = list(vec.values())
+
+        return terms, matrix
+
+    @staticmethod
+    def _get_df(index_reader, term: str):
+        try:
+            df, _ = index_reader.get_term_counts(term)
+        except Exception:
+            return None
+        return df
+
+    @staticmethod
+    def _filter_vector(raw_vector: dict, dfs: dict, num_docs: int, filter_terms: bool) -> dict:
         filtered = {}
 
         for term, freq in raw_vector.items():
             if filter_terms and not term.isalnum():
                 continue
 
-            try:
-                df, _ = index_reader.get_term_counts(term)
-            except Exception:
+            df = dfs.get(term)
+            if df is None:
                 continue
 
             if 2 <= len(term) <= 20 and (df / num_docs) <= 0.1:
@@ -39,6 +72,51 @@ class RelevanceFeedback:
 
         return filtered
 
+    def get_document_vector(self, docid: str, index_reader, filter_terms: bool = False) -> dict:
+        num_docs = index_reader.stats()['documents']
+        raw_vector = index_reader.get_document_vector(docid) or {}
+        dfs = {term: self._get_df(index_reader, term) for term in raw_vector
+               if not (filter_terms and not term.isalnum())}
+
+        return self._filter_vector(raw_vector, dfs, num_docs, filter_terms)
+
+    def get_document_vectors(self, docids: List[str], index_reader, filter_terms: bool = False,
+                             threads: int = 1) -> Dict[str, dict]:
+        """Fetch the filtered vectors of many feedback documents at once.
+
+        Each distinct document vector is fetched once, and the document frequency of each distinct term is looked up
+        once across all documents, instead of once per (document, term) pair. Fetches are fanned out over ``threads``
+        worker threads that detach from the JVM when done; the JNI calls release the GIL, so the JVM does the work
+        concurrently.
+
+        Parameters
+        ----------
+        docids : List[str]
+            Collection docids of the feedback documents; duplicates are fetched once.
+        index_reader : LuceneIndexReader
+            Reader over the index being searched.
+        filter_terms : bool
+            Whether to remove non-alphanumeric terms.
+        threads : int
+            Maximum number of threads to use.
+
+        Returns
+        -------
+        Dict[str, dict]
+            Filtered document vector for each distinct docid.
+        """
+        unique_docids = list(dict.fromkeys(docids))
+        num_docs = index_reader.stats()['documents']
+
+        raw_vectors = thread_map(index_reader.get_document_vector, unique_docids, threads)
+        raw_vectors = [vector or {} for vector in raw_vectors]
+
+        terms = list({term for vector in raw_vectors for term in vector if not (filter_terms and not term.isalnum())})
+        dfs = dict(zip(terms, thread_map(lambda term: self._get_df(index_reader, term), terms, threads)))
+
+        return {docid: self._filter_vector(vector, dfs, num_docs, filter_terms)
+                for docid, vector in zip(unique_docids, raw_vectors)}
+
     def l1_normalize(self, vec: dict) -> dict:
         total = sum(abs(v) for v in vec.values())
         if total == 0:
@@ -1,4 +1,7 @@
 import math
+
+import numpy as np
+
 from pyserini.search.lucene import querybuilder
 from pyserini.pyclass import autoclass
 from .reranker_base import RelevanceFeedback
@@ -23,40 +26,27 @@ class RM3Reranker(RelevanceFeedback):
         if not vectors:
             return {}
 
-        vocab = set()
-        doc_vecs = []
-        doc_scores = []
-        norms = []
-
         # Preprocess and filter document vectors
-        for idx, vec in enumerate(vectors):
-            if fb_terms is not None:
-                vec = self.prune_top_k(vec, fb_terms)
-
-            norm = sum(abs(v) for v in vec.values())
-            if norm > 0.001:
-                vocab.update(vec.keys())
-                doc_vecs.append(vec)
-                norms.append(norm)
-                doc_scores.append(document_scores[idx])
-
-        if not doc_vecs:
+        vectors = [self.prune_top_k(vec, fb_terms) for vec in vectors]
+        terms, matrix = self.to_matrix(vectors)
+        norms = np.abs(matrix).sum(axis=1)
+        keep = norms > 0.001
+
+        if not keep.any():
             return {}
 
         # Compute feedback model
-        rm3_vec = {}
-        for term in vocab:
-            weight = 0.0
-            for i, vec in enumerate(doc_vecs):
-                if term in vec:
-                    weight += (vec[term] / norms[i]) * doc_scores[i]
-            rm3_vec[term] = weight
+        scores = np.asarray(document_scores[:len(vectors)], dtype=np.float64)[keep]
+        weights = (matrix[keep] / norms[keep, None] * scores[:, None]).sum(axis=0)
+
+        # Only terms occurring in a kept document are part of the feedback vocabulary
+        in_vocab = (matrix[keep] != 0).any(axis=0)
+        terms, weights = terms[in_vocab], weights[in_vocab]
 
         # Prune and normalize
-        if fb_terms is not None:
-            rm3_vec = super().prune_top_k(rm3_vec, fb_terms)
+        terms, weights = self.prune_top_k_arrays(terms, weights, fb_terms)
 
-        return super().l1_normalize(rm3_vec)
+        return super().l1_normalize(dict(zip(terms.tolist(), weights.tolist())))
 
     def interpolate(self, query_vector, rel_model_vector, query_weight):
         vocab = set(query_vector) | set(rel_model_vector)
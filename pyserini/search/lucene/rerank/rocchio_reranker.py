@@ -1,4 +1,5 @@
-import math
+import numpy as np
+
 from pyserini.search.lucene import querybuilder
 from pyserini.pyclass import autoclass
 from .reranker_base import RelevanceFeedback
@@ -33,33 +34,23 @@ class RocchioReranker(RelevanceFeedback):
         if not vectors:
             return {}
 
-        vocab = set()
-        normalized_docs = []
-
         # Normalize each doc vector
-        for vec in vectors:
-            norm = math.sqrt(sum(v * v for v in vec.values()))
-            if norm > 0.001:
-                normed_vec = {t: v / norm for t, v in vec.items()}
-                normalized_docs.append(normed_vec)
-                vocab.update(normed_vec)
-
-        if not normalized_docs:
+        terms, matrix = self.to_matrix(vectors)
+        norms = np.sqrt((matrix * matrix).sum(axis=1))
+        keep = norms > 0.001
+
+        if not keep.any():
             return {}
 
         # Compute mean vector
-        mean_vec = {}
-        doc_count = len(normalized_docs)
-
-        for term in vocab:
-            total = sum(doc.get(term, 0.0) for doc in normalized_docs)
-            mean_vec[term] = total / doc_count
+        normalized_docs = matrix[keep] / norms[keep, None]
+        in_vocab = (normalized_docs != 0).any(axis=0)
+        terms, mean_vec = terms[in_vocab], normalized_docs[:, in_vocab].mean(axis=0)
 
         # prune to fb_terms and normalize
-        if fb_terms is not None:
-            mean_vec = self.prune_top_k(mean_vec, fb_terms)
+        terms, mean_vec = self.prune_top_k_arrays(terms, mean_vec, fb_terms)
 
-        return self.l2_normalize(mean_vec)
+        return self.l2_normalize(dict(zip(terms.tolist(), mean_vec.tolist())))
 
     def __call__(self, query, rel_vectors, nrel_vectors=None):
         # Normalize query vector
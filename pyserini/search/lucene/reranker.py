@@ -16,11 +16,15 @@
 
 import enum
 import importlib
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
 from typing import List
 
 from sklearn.linear_model import LogisticRegression
 from sklearn.svm import SVC
 
+from pyserini.index.lucene import IdfTable
+
 
 class ClassifierType(enum.Enum):
     LR = 'lr'
@@ -55,16 +59,18 @@ class PseudoRelevanceClassifierReranker:
             raise Exception("Invalid classifier type")
 
     def _get_prf_vectors(self, doc_ids: List[str]):
-        train_docs = doc_ids[:self.r] + doc_ids[-self.n:]
+        # The training documents are among the ones to rerank: vectorize them all once and pick the training rows.
+        rows = list(range(len(doc_ids)))
+        train_rows = rows[:self.r] + rows[-self.n:]
         train_labels = [1] * self.r + [0] * self.n
 
-        train_vecs = self.vectorizer.get_vectors(train_docs)
         test_vecs = self.vectorizer.get_vectors(doc_ids)
+        train_vecs = test_vecs[train_rows]
 
         return train_vecs, train_labels, test_vecs
 
-    def _rerank_with_classifier(self, doc_ids: List[str], search_scores: List[float]):
-        train_vecs, train_labels, test_vecs = self._get_prf_vectors(doc_ids)
+    def _rerank_with_classifier(self, doc_ids: List[str], search_scores: List[float], prf_vectors):
+        train_vecs, train_labels, test_vecs = prf_vectors
 
         # classification
         self.clf.fit(train_vecs, train_labels)
@@ -78,16 +84,18 @@ class PseudoRelevanceClassifierReranker:
         return self._sort_dual_list(interpolated_scores, doc_ids)
 
     def rerank(self, doc_ids: List[str], search_scores: List[float]):
+        prf_vectors = self._get_prf_vectors(doc_ids)
+
         # one classifier
         if len(self.clf_type) == 1:
             self._set_classifier(self.clf_type[0])
-            return self._rerank_with_classifier(doc_ids, search_scores)
+            return self._rerank_with_classifier(doc_ids, search_scores, prf_vectors)
 
         # two classifier with FusionMethod.AVG
         doc_score_dict = {}
         for i in range(2):
             self._set_classifier(self.clf_type[i])
-            i_scores, i_doc_ids = self._rerank_with_classifier(doc_ids, search_scores)
+            i_scores, i_doc_ids = self._rerank_with_classifier(doc_ids, search_scores, prf_vectors)
 
             for score, doc_id in zip(i_scores, i_doc_ids):
                 if doc_id not in doc_score_dict:
@@ -120,3 +128,53 @@ class PseudoRelevanceClassifierReranker:
         list1.reverse()
         list2.reverse()
         return list1, list2
+
+
+# The reranker of a worker process of a PseudoRelevanceClassifierRerankerPool.
+_worker_ranker = None
+
+
+def _init_worker(*args):
+    global _worker_ranker
+    _worker_ranker = PseudoRelevanceClassifierReranker(*args)
+
+
+def _rerank_in_worker(doc_ids: List[str], search_scores: List[float]):
+    return _worker_ranker.rerank(doc_ids, search_scores)
+
+
+class PseudoRelevanceClassifierRerankerPool:
+    """Reranks topics in a pool of worker processes, each with its own :class:`PseudoRelevanceClassifierReranker`.
+
+    Workers are started with ``spawn``, since the JVM of the parent process does not survive a ``fork``, and open the
+    index themselves. The vectorizer's vocabulary and term statistics come from the index's memory-mapped IDF table
+    (see :class:`IdfTable`), so the workers share those pages read-only. Each topic is reranked exactly as
+    :func:`PseudoRelevanceClassifierReranker.rerank` would in the parent process.
+
+    Parameters
+    ----------
+    processes : int
+        Number of worker processes.
+    """
+
+    def __init__(self, lucene_index: str, vectorizer_class: str, clf_type: List[ClassifierType], r=10, n=100,
+                 alpha=0.5, processes: int = 2):
+        # Write the IDF table of the current index commit once, before the workers race to; they then find it up to
+        # date and only map it.
+        IdfTable.from_index(lucene_index)
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker,
+                                            initargs=(lucene_index, vectorizer_class, clf_type, r, n, alpha))
+
+    def submit(self, doc_ids: List[str], search_scores: List[float]) -> Future:
+        """Rerank a topic in a worker; the future's result is what ``rerank`` returns."""
+        return self.executor.submit(_rerank_in_worker, doc_ids, search_scores)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.shutdown()
@@ -0,0 +1,108 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Merge the runs of the shards of a set of topics, i.e., runs of ``pyserini.search.lucene`` or ``pyserini.search.faiss``
+with ``--shard-id/--shard-num``, into a single run in the original topic order.
+
+Each shard run lists its topics in topic order, so the runs are merged one topic at a time, without reading them into
+memory.
+"""
+
+import argparse
+import heapq
+import json
+from itertools import groupby
+from typing import Iterator, List, Sequence, Tuple
+
+from pyserini.output_writer import OutputFormat
+from pyserini.query_iterator import TopicsFormat, get_query_iterator
+
+
+def _read_topic_lines(path: str, output_format: OutputFormat) -> Iterator[Tuple[str, List[str]]]:
+    """Read the lines of a run, grouped by topic."""
+    if output_format == OutputFormat.KILT:
+        def get_topic(line):
+            return str(json.loads(line)['id'])
+    else:
+        def get_topic(line):
+            return line.split(None, 1)[0]
+
+    with open(path) as f:
+        for topic, lines in groupby((line for line in f if line.strip()), key=get_topic):
+            yield topic, list(lines)
+
+
+def merge_runs(paths: Sequence[str], output_path: str, topic_ids: Sequence,
+               output_format: OutputFormat = OutputFormat.TREC) -> int:
+    """Merge runs over disjoint subsets of topics into a single run, in the order of ``topic_ids``.
+
+    Parameters
+    ----------
+    paths : Sequence[str]
+        Paths to the runs to merge, in any order.
+    output_path : str
+        Path to the merged run.
+    topic_ids : Sequence
+        Topic ids, in the order of the merged run; ids are compared as strings.
+    output_format : OutputFormat
+        Format of the runs.
+
+    Returns
+    -------
+    int
+        Number of topics in the merged run.
+    """
+    positions = {str(topic_id): position for position, topic_id in enumerate(topic_ids)}
+
+    def read_run(path):
+        last_position = -1
+        for topic, lines in _read_topic_lines(path, output_format):
+            position = positions.get(topic)
+            if position is None:
+                raise ValueError(f'Topic {topic} of {path} is not in the topics.')
+            if position <= last_position:
+                raise ValueError(f'{path} is not in topic order at topic {topic}.')
+            last_position = position
+            yield position, lines
+
+    num_topics = 0
+    last_position = -1
+    with open(output_path, 'w') as out:
+        for position, lines in heapq.merge(*[read_run(path) for path in paths], key=lambda item: item[0]):
+            if position == last_position:
+                raise ValueError(f'Topic {topic_ids[position]} is in more than one run.')
+            last_position = position
+            out.writelines(lines)
+            num_topics += 1
+    return num_topics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge the runs of topic shards into a single run in topic order.')
+    parser.add_argument('--topics', type=str, metavar='topic_name', required=True,
+                        help="Name of topics, or path to the topics the shard runs were searched with.")
+    parser.add_argument('--topics-format', type=str, metavar='format', default=TopicsFormat.DEFAULT.value,
+                        help=f"Format of topics. Available: {[x.value for x in list(TopicsFormat)]}")
+    parser.add_argument('--output-format', type=str, metavar='format', default=OutputFormat.TREC.value,
+                        help=f"Format of the runs. Available: {[x.value for x in list(OutputFormat)]}")
+    parser.add_argument('--input', type=str, metavar='path', nargs='+', required=True, help="Shard runs to merge.")
+    parser.add_argument('--output', type=str, metavar='path', required=True, help="Path to the merged run.")
+    args = parser.parse_args()
+
+    query_iterator = get_query_iterator(args.topics, TopicsFormat(args.topics_format))
+    num_topics = merge_runs(args.input, args.output, query_iterator.order, OutputFormat(args.output_format))
+    print(f'Merged {num_topics} topics from {len(args.input)} runs into {args.output}')
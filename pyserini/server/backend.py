@@ -20,7 +20,10 @@ import logging
 import math
 import os
 import threading
+import time
 import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
@@ -29,13 +32,16 @@ from urllib.parse import unquote
 
 import requests
 
+from pyserini.encode import QueryEmbeddingCache
 from pyserini.prebuilt_index_info import FAISS_INDEX_INFO_M_BEIR
+from pyserini.pyclass import detaching
 from pyserini.search.faiss import FaissSearcher
-from pyserini.search.lucene import JBagOfWordsQueryGenerator, JCovid19QueryGenerator, JDisjunctionMaxQueryGenerator, JQuerySideBm25QueryGenerator, LuceneFlatDenseSearcher, LuceneHnswDenseSearcher, LuceneImpactSearcher, LuceneSearcher
+from pyserini.search.lucene import JBagOfWordsQueryGenerator, JCovid19QueryGenerator, JDisjunctionMaxQueryGenerator, JQuerySideBm25QueryGenerator, LuceneFlatDenseSearcher, LuceneHnswDenseSearcher, LuceneImpactSearcher, LuceneSearcher, LuceneSimilarities
+from pyserini.server.batching import SearchBatcher
 from pyserini.server.config import load_server_config
 from pyserini.server.utils import INDEX_TYPE, SHARDS, Bm25Config, Bm25SearcherCacheEntry, IndexConfig, create_searcher, lookup_index_type
 from pyserini.server.document_format import format_lucene_document, truncate_document_payload
-from pyserini.server.errors import BadSearchRequestError, DocumentNotFoundError, IndexNotAvailableError
+from pyserini.server.errors import BadSearchRequestError, DocumentNotFoundError, IndexLoadingError, IndexNotAvailableError
 from pyserini.util import check_downloaded, download_prebuilt_index, download_url, get_cache_home
 
 logger = logging.getLogger(__name__)
@@ -49,6 +55,23 @@ BM25_DEFAULT_K1 = 0.9
 BM25_DEFAULT_B = 0.4
 _BM25_KEY_DECIMALS = 6
 _DEFAULT_BM25_SEARCHER_CACHE_SIZE = 4
+# Query encoders requested over an index's own (faiss, impact) are loaded once and shared across indexes.
+_QUERY_ENCODER_CACHE_SIZE = 4
+
+# Indexes opened in the background (preloaded, or requested with background loading) are warmed up with a few
+# synthetic queries, so that postings, HNSW graphs and FAISS pages are in memory before the first real request.
+_INDEX_LOADER_THREADS = 4
+_DEFAULT_WARMUP_QUERIES = (
+    'what is information retrieval',
+    'how do vaccines work',
+    'history of the roman empire',
+    'best way to learn a programming language',
+    'symptoms of vitamin d deficiency',
+    'climate change effects on agriculture',
+    'who invented the telephone',
+    'how to calculate compound interest',
+)
+_WARMUP_HITS = 100
 
 # Cap for m-beir query images fetched from user-supplied URLs (DoS mitigation: bounded RAM and disk).
 _MAX_M_BEIR_QUERY_IMAGE_BYTES = 50 * 1024 * 1024
@@ -124,6 +147,16 @@ def _canonical_bm25_config(k1: float | None, b: float | None) -> Bm25Config | No
     )
 
 
+@dataclass
+class _IndexLoad:
+    # 'loading' -> 'warming' -> 'ready', or 'failed'.
+    status: str = 'loading'
+    allow_local: bool = True
+    error: str | None = None
+    load_time_ms: float | None = None
+    warmup_time_ms: float | None = None
+
+
 @dataclass(frozen=True)
 class _SearchOptions:
     hits: int = 10
@@ -148,18 +181,50 @@ class SharedSearchBackend:
         search_cache_size: int = 2048,
         document_cache_size: int = 4096,
         bm25_searcher_cache_size: int = _DEFAULT_BM25_SEARCHER_CACHE_SIZE,
+        query_embedding_cache_size: int = 4096,
+        query_embedding_cache_path: str | None = None,
+        search_batch_size: int = 0,
+        search_batch_wait_ms: float = 2.0,
+        background_index_loading: bool = False,
     ):
         self._no_prebuilt_indexes = no_prebuilt_indexes
         self._bm25_searcher_cache_size = max(1, int(bm25_searcher_cache_size))
-        self._local_indexes, _ = load_server_config(config_path)
+        self._local_indexes, _, preload, warmup_queries = load_server_config(config_path)
         if self._no_prebuilt_indexes and not self._local_indexes:
             raise ValueError('--no-prebuilt-indexes requires a non-empty index config (indexes: ...)')
         self.indexes: dict[str, IndexConfig] = {}
+        # Query encoders requested over an index's own, by (index type, encoder); kept apart from the indexes, so
+        # switching encoders does not reopen an index.
+        self._query_encoders_lock = threading.Lock()
+        self._query_encoders: OrderedDict[tuple[str, str], Any] = OrderedDict()
         # Serialize get-or-create per logical index name so different indexes can open in parallel.
         self._index_lock_registry = threading.Lock()
         self._index_locks: dict[str, threading.Lock] = {}
         self._search_cached = lru_cache(maxsize=search_cache_size)(self._search_impl)
         self._document_cached = lru_cache(maxsize=document_cache_size)(self._get_document_impl)
+        # Query encodings are shared across indexes (and survive searcher rebuilds); a size of 0 disables the cache.
+        self.query_embedding_cache: QueryEmbeddingCache | None = None
+        if query_embedding_cache_size > 0:
+            self.query_embedding_cache = QueryEmbeddingCache(query_embedding_cache_size, path=query_embedding_cache_path)
+        # Concurrent text searches of faiss and impact indexes are batched; a batch size of 0 or 1 disables batching.
+        self.search_batcher: SearchBatcher | None = None
+        if search_batch_size > 1:
+            self.search_batcher = SearchBatcher(search_batch_size, search_batch_wait_ms)
+        # Indexes being opened and warmed up in the background; requests for them fail fast with IndexLoadingError
+        # instead of queueing behind the index lock. With background loading, indexes not yet open are opened this
+        # way on their first request too.
+        if self._no_prebuilt_indexes:
+            unknown = [name for name in preload if name not in self._local_indexes]
+            if unknown:
+                raise ValueError(f'Config "preload" references indexes not configured under indexes: {unknown}')
+        self._warmup_queries = list(_DEFAULT_WARMUP_QUERIES) if warmup_queries is None else warmup_queries
+        self._background_index_loading = background_index_loading
+        self._index_loads_lock = threading.Lock()
+        self._index_loads: dict[str, _IndexLoad] = {}
+        self._index_loader: ThreadPoolExecutor | None = None
+        self._index_load_futures: list[Future] = []
+        for index_name in preload:
+            self.load_index(index_name)
 
     def _lock_for_index_name(self, index_name: str) -> threading.Lock:
         with self._index_lock_registry:
@@ -185,13 +250,138 @@ class SharedSearchBackend:
         for slot in config.bm25_searchers.values():
             self._close_searcher(slot.searcher, config.name)
         config.bm25_searchers.clear()
+        # Encoder searchers share the index of config.searcher; there is nothing else to close.
+        config.encoder_searchers.clear()
 
     def close_all(self) -> None:
+        with self._index_loads_lock:
+            index_loader, self._index_loader = self._index_loader, None
+            self._index_load_futures = []
+        if index_loader is not None:
+            index_loader.shutdown(wait=True, cancel_futures=True)
+        self._index_loads.clear()
         for config in self.indexes.values():
             self._close_index_config(config)
         self.indexes.clear()
+        with self._query_encoders_lock:
+            self._query_encoders.clear()
         self._search_cached.cache_clear()
         self._document_cached.cache_clear()
+        if self.query_embedding_cache is not None and self.query_embedding_cache.path is not None:
+            try:
+                self.query_embedding_cache.save()
+            except OSError:
+                logger.warning('Failed to save the query embedding cache.', exc_info=True)
+
+    def get_query_embedding_cache_stats(self) -> dict[str, int] | None:
+        """Hit/miss counters of the query embedding cache, or ``None`` if it is disabled."""
+        if self.query_embedding_cache is None:
+            return None
+        return self.query_embedding_cache.stats()
+
+    def get_search_batching_stats(self) -> dict[str, Any] | None:
+        """Batch size and queue time statistics of batched searches, or ``None`` if batching is disabled."""
+        if self.search_batcher is None:
+            return None
+        return self.search_batcher.stats()
+
+    def load_index(self, index_name: str, *, allow_local: bool = True) -> None:
+        """
+        Open ``index_name`` (and the base index its documents are fetched from) in the background, then warm it up.
+
+        Until it is ready, searches and document fetches of the index raise :class:`IndexLoadingError`, and
+        :meth:`get_status` reports its ``load_status``. Does nothing if the index is already open or loading.
+        """
+        with self._index_loads_lock:
+            self._start_index_load(index_name, allow_local=allow_local)
+
+    def _start_index_load(self, index_name: str, *, allow_local: bool) -> _IndexLoad | None:
+        load = self._index_loads.get(index_name)
+        if load is not None and load.status in ('loading', 'warming'):
+            return load
+        if index_name in self.indexes:
+            return None
+        load = self._index_loads[index_name] = _IndexLoad(allow_local=allow_local)
+        if self._index_loader is None:
+            self._index_loader = ThreadPoolExecutor(
+                max_workers=_INDEX_LOADER_THREADS, thread_name_prefix='pyserini-index-loader'
+            )
+        self._index_load_futures = [future for future in self._index_load_futures if not future.done()]
+        # Loader threads open and search Lucene indexes, so they detach from the JVM after each load.
+        self._index_load_futures.append(self._index_loader.submit(detaching(self._load_index), index_name, load))
+        return load
+
+    def _load_index(self, index_name: str, load: _IndexLoad) -> None:
+        started_at = time.perf_counter()
+        try:
+            config = self._ensure_index(index_name, allow_local=load.allow_local, from_loader=True)
+            if config.index_type != 'tf' and config.base_index and config.base_index != index_name:
+                self._ensure_index(config.base_index, allow_local=True, from_loader=True)
+        except Exception as e:
+            logger.warning('Failed to load index %s.', index_name, exc_info=True)
+            with self._index_loads_lock:
+                load.status = 'failed'
+                load.error = str(e) or type(e).__name__
+            return
+        warmup_started_at = time.perf_counter()
+        with self._index_loads_lock:
+            load.status = 'warming'
+            load.load_time_ms = 1000 * (warmup_started_at - started_at)
+
+        self._warm_up_index(index_name, config.searcher)
+        with self._index_loads_lock:
+            load.status = 'ready'
+            load.warmup_time_ms = 1000 * (time.perf_counter() - warmup_started_at)
+        logger.info(
+            'Loaded index %s in %.0f ms (warmup: %.0f ms).', index_name, load.load_time_ms, load.warmup_time_ms
+        )
+
+    def _warm_up_index(self, index_name: str, searcher: Any) -> None:
+        # Warmup queries are plain text; indexes whose searchers take other queries (e.g., m-BEIR) skip the rest.
+        for query in self._warmup_queries:
+            try:
+                searcher.search(query, _WARMUP_HITS)
+            except Exception:
+                logger.warning('Warmup of index %s failed; skipping the rest of its warmup.', index_name, exc_info=True)
+                return
+
+    def _check_index_load(self, index_name: str, *, allow_local: bool) -> None:
+        with self._index_loads_lock:
+            load = self._index_loads.get(index_name)
+            if load is None and self._background_index_loading:
+                load = self._start_index_load(index_name, allow_local=allow_local)
+            if load is None or load.status == 'ready':
+                return
+            if load.status == 'failed':
+                if not self._background_index_loading:
+                    # Preloading failed; open the index on request as if it had not been preloaded.
+                    del self._index_loads[index_name]
+                    return
+                # Report the failure once; the next request tries again.
+                del self._index_loads[index_name]
+                raise IndexNotAvailableError(f'Unable to open index: {index_name}')
+        raise IndexLoadingError(f'Index {index_name} is loading; retry shortly')
+
+    def wait_for_index_loads(self, timeout: float | None = None) -> bool:
+        """Block until indexes loading in the background are ready (or failed); ``False`` on timeout."""
+        with self._index_loads_lock:
+            futures = list(self._index_load_futures)
+        _, not_done = wait(futures, timeout=timeout)
+        return not not_done
+
+    def _index_load_status(self, index_name: str) -> dict[str, Any]:
+        with self._index_loads_lock:
+            load = self._index_loads.get(index_name)
+            if load is None:
+                return {'load_status': 'ready' if index_name in self.indexes else 'not_loaded'}
+            status: dict[str, Any] = {'load_status': load.status}
+            if load.error is not None:
+                status['load_error'] = load.error
+            if load.load_time_ms is not None:
+                status['load_time_ms'] = round(load.load_time_ms, 3)
+            if load.warmup_time_ms is not None:
+                status['warmup_time_ms'] = round(load.warmup_time_ms, 3)
+            return status
 
     def _acquire_bm25_searcher(
         self,
@@ -254,23 +444,57 @@ class SharedSearchBackend:
     def _params_require_searcher_rebuild(
         config: IndexConfig,
         *,
-        ef_search: int | None,
         encoder: str | None,
     ) -> bool:
-        """Whether the open searcher must be recreated because encoding / HNSW / UniIR settings changed."""
+        """Whether the open searcher must be recreated because encoding / UniIR settings changed.
+
+        ``ef_search`` is passed to each search, and faiss and impact searchers share their index with searchers for
+        other encoders (see ``_searcher_with_encoder``); only Anserini's dense searchers, which hold their encoder, and
+        UniIR searchers are recreated.
+        """
         idx = config.index_type or ''
         if not idx or config.searcher is None or idx == 'tf':
             return False
 
         enc_changed = encoder is not None and _norm_opt_str(encoder) != _norm_opt_str(config.encoder)
 
-        if idx == 'lucene_flat' or idx == 'impact' or idx == 'faiss':
+        if idx == 'lucene_flat' or idx == 'lucene_hnsw':
+            return enc_changed
+        if idx == 'faiss' and config.name in FAISS_INDEX_INFO_M_BEIR:
             return enc_changed
-        if idx == 'lucene_hnsw':
-            ef_changed = ef_search is not None and ef_search != config.ef_search
-            return enc_changed or ef_changed
         return False
 
+    def _searcher_with_encoder(self, index_name: str, config: IndexConfig, encoder: str) -> Any:
+        """Searcher over the open (faiss or impact) index of ``config`` that encodes queries with ``encoder``."""
+        with self._lock_for_index_name(index_name):
+            searcher = config.encoder_searchers.get(encoder)
+            if searcher is not None:
+                config.encoder_searchers.move_to_end(encoder)
+                return searcher
+
+        key = (config.index_type, encoder)
+        with self._query_encoders_lock:
+            query_encoder = self._query_encoders.get(key)
+            if query_encoder is not None:
+                self._query_encoders.move_to_end(key)
+        try:
+            if query_encoder is None:
+                searcher = config.searcher.with_query_encoder(encoder)
+                with self._query_encoders_lock:
+                    self._query_encoders[key] = searcher.query_encoder
+                    while len(self._query_encoders) > _QUERY_ENCODER_CACHE_SIZE:
+                        self._query_encoders.popitem(last=False)
+            else:
+                searcher = config.searcher.with_query_encoder(query_encoder, query_encoder_id=encoder)
+        except Exception as e:
+            raise BadSearchRequestError(f'Unable to load encoder {encoder} for index {index_name}') from e
+
+        with self._lock_for_index_name(index_name):
+            config.encoder_searchers[encoder] = searcher
+            while len(config.encoder_searchers) > _QUERY_ENCODER_CACHE_SIZE:
+                config.encoder_searchers.popitem(last=False)
+        return searcher
+
     def _build_searcher(self, config: IndexConfig, *, index_type: str, local_path: str | None = None):
         if index_type == 'faiss':
             if config.name in FAISS_INDEX_INFO_M_BEIR:
@@ -307,22 +531,21 @@ class SharedSearchBackend:
         allow_local: bool = False,
         ef_search: int | None = None,
         encoder: str | None = None,
+        from_loader: bool = False,
     ) -> IndexConfig:
+        if not from_loader:
+            self._check_index_load(index_name, allow_local=allow_local)
         with self._lock_for_index_name(index_name):
             config = self.indexes.get(index_name)
             if config and config.searcher is not None:
                 need_rebuild = config.index_type != 'tf' and self._params_require_searcher_rebuild(
-                    config, ef_search=ef_search, encoder=encoder
+                    config, encoder=encoder
                 )
                 if need_rebuild:
                     self._close_index_config(config)
                     del self.indexes[index_name]
                     config = None
                 else:
-                    if ef_search is not None:
-                        config.ef_search = ef_search
-                    if encoder:
-                        config.encoder = encoder
                     return config
 
             config = config or IndexConfig(
@@ -330,6 +553,7 @@ class SharedSearchBackend:
                 ef_search=ef_search,
                 encoder=encoder,
             )
+            config.query_cache = self.query_embedding_cache
             searcher: LuceneSearcher | LuceneFlatDenseSearcher | LuceneHnswDenseSearcher | LuceneImpactSearcher | FaissSearcher | None = None
             if self._no_prebuilt_indexes:
                 local_cfg = self._local_indexes.get(index_name)
@@ -402,11 +626,13 @@ class SharedSearchBackend:
                 raise BadSearchRequestError(f'Unknown index: {index_name}')
             status = {k: v for k, v in local_cfg.__dict__.items() if v is not None}
             status['no_prebuilt_indexes'] = True
+            status.update(self._index_load_status(index_name))
             return status
         status = {'downloaded': check_downloaded(index_name)}
         index_type = lookup_index_type(index_name)
         if index_type is not None:
             status.update(INDEX_TYPE[index_type].get(index_name, {}))
+        status.update(self._index_load_status(index_name))
         return status
 
     def _doc_store_lucene_searcher(self, start_index_name: str, *, allow_local_index: bool) -> LuceneSearcher:
@@ -535,7 +761,7 @@ class SharedSearchBackend:
 
     def _search_single_shard(self, shard_name: str, query: str, hits: int, ef_search: int, encoder: str) -> list[dict[str, float]]:
         index_config = self._ensure_index(shard_name, ef_search=ef_search, encoder=encoder)
-        results = index_config.searcher.search(query, hits)
+        results = index_config.searcher.search(query, hits, ef_search=ef_search)
         return [{'docid': result.docid, 'score': float(result.score)} for result in results]
 
     def sharded_search(self, query: str, hits: int, ef_search: int, encoder: str = 'ArcticEmbedL') -> list[dict[str, float]]:
@@ -601,15 +827,25 @@ class SharedSearchBackend:
             qg_k1 = bm25_config.k1 if bm25_config is not None else BM25_DEFAULT_K1
             qg_b = bm25_config.b if bm25_config is not None else BM25_DEFAULT_B
 
-            def run_tf_search(searcher: LuceneSearcher) -> list[Any]:
+            def run_tf_search(searcher: LuceneSearcher, similarity: Any = None) -> list[Any]:
+                jquery_gen = None
                 if options.query_generator:
                     jquery_gen = self._resolve_query_generator(
                         options.query_generator, searcher, k1=qg_k1, b=qg_b
                     )
+                if similarity is not None:
+                    return searcher.search_with_similarity(query, similarity, options.hits, query_generator=jquery_gen)
+                if jquery_gen is not None:
                     return searcher.search(query, options.hits, query_generator=jquery_gen)
                 return searcher.search(query, options.hits)
 
-            if bm25_config is not None:
+            if bm25_config is not None and index_config.searcher.supports_search_with_similarity():
+                # Score with the request's BM25 parameters on the shared searcher; no searcher per (k1, b) to open.
+                results = run_tf_search(
+                    index_config.searcher, LuceneSimilarities.bm25(bm25_config.k1, bm25_config.b)
+                )
+            elif bm25_config is not None:
+                # Searchers that cannot score with a per-call similarity (Lucene 8 indexes) get one per BM25 configuration.
                 searcher, bm25_key = self._acquire_bm25_searcher(index_name, index_config, bm25_config)
                 try:
                     results = run_tf_search(searcher)
@@ -618,7 +854,26 @@ class SharedSearchBackend:
             else:
                 results = run_tf_search(index_config.searcher)
         else:
-            results = index_config.searcher.search(query, options.hits)
+            searcher = index_config.searcher
+            if (
+                options.encoder
+                and index_config.index_type in ('faiss', 'impact')
+                and _norm_opt_str(options.encoder) != _norm_opt_str(index_config.encoder)
+                and index_name not in FAISS_INDEX_INFO_M_BEIR
+            ):
+                searcher = self._searcher_with_encoder(index_name, index_config, _norm_opt_str(options.encoder))
+            # ef_search applies to this search only; the HNSW index is shared across values.
+            search_kwargs: dict[str, Any] = {}
+            if options.ef_search is not None and isinstance(searcher, (FaissSearcher, LuceneHnswDenseSearcher)):
+                search_kwargs['ef_search'] = options.ef_search
+            if (
+                self.search_batcher is not None
+                and isinstance(query, str)
+                and isinstance(searcher, (FaissSearcher, LuceneImpactSearcher))
+            ):
+                results = self.search_batcher.search(searcher, query, options.hits, **search_kwargs)
+            else:
+                results = searcher.search(query, options.hits, **search_kwargs)
 
         if isinstance(query, str):
             query_payload: dict[str, Any] = {'qid': options.qid, 'query_txt': query}
@@ -0,0 +1,125 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Dynamic batching of concurrent single-query searches into ``batch_search`` calls."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any
+
+
+class _PendingSearch:
+    __slots__ = ('query', 'enqueued_at', 'done', 'results', 'error')
+
+    def __init__(self, query: str):
+        self.query = query
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.results: list[Any] | None = None
+        self.error: BaseException | None = None
+
+
+class SearchBatcher:
+    """
+    Collects concurrent searches of the same searcher into batches, so that a dense or learned sparse searcher encodes
+    and searches the queries of a batch together.
+
+    Searches are called from worker threads (e.g., ``asyncio.to_thread``). The first search of a batch waits until the
+    batch has ``max_batch_size`` queries or ``max_wait_ms`` has passed, then runs ``searcher.batch_search`` for the
+    whole batch on its own thread and hands each waiting search its results. Only searches of the same searcher with
+    the same number of hits and search arguments (e.g., ``ef_search``) are batched together, so results are those of
+    ``searcher.search``.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 2.0) -> None:
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_sec = max(0.0, float(max_wait_ms)) / 1000
+        self._condition = threading.Condition()
+        # Batches still accepting searches, keyed by (searcher, hits, search arguments).
+        self._open_batches: dict[tuple[Any, ...], list[_PendingSearch]] = {}
+        self._batches = 0
+        self._queries = 0
+        self._batch_size_counts: dict[int, int] = {}
+        self._queue_time_sec = 0.0
+        self._max_queue_time_sec = 0.0
+
+    def search(self, searcher: Any, query: str, hits: int, **search_kwargs: Any) -> list[Any]:
+        """Search ``query`` as part of a batch; blocks until the batch has been searched."""
+        key = (id(searcher), hits, tuple(sorted(search_kwargs.items())))
+        pending = _PendingSearch(query)
+        with self._condition:
+            batch = self._open_batches.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = self._open_batches[key] = []
+            batch.append(pending)
+            if len(batch) >= self.max_batch_size:
+                del self._open_batches[key]
+                self._condition.notify_all()
+            if is_leader:
+                deadline = pending.enqueued_at + self.max_wait_sec
+                while self._open_batches.get(key) is batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        del self._open_batches[key]
+                        break
+                    self._condition.wait(remaining)
+
+        if is_leader:
+            self._search_batch(searcher, batch, hits, search_kwargs)
+        else:
+            pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.results
+
+    def _search_batch(
+        self, searcher: Any, batch: list[_PendingSearch], hits: int, search_kwargs: dict[str, Any]
+    ) -> None:
+        started_at = time.perf_counter()
+        queue_times = [started_at - pending.enqueued_at for pending in batch]
+        with self._condition:
+            self._batches += 1
+            self._queries += len(batch)
+            self._batch_size_counts[len(batch)] = self._batch_size_counts.get(len(batch), 0) + 1
+            self._queue_time_sec += sum(queue_times)
+            self._max_queue_time_sec = max(self._max_queue_time_sec, max(queue_times))
+
+        try:
+            qids = [str(i) for i in range(len(batch))]
+            results = searcher.batch_search([pending.query for pending in batch], qids, k=hits, **search_kwargs)
+            for qid, pending in zip(qids, batch):
+                pending.results = results[qid]
+        except BaseException as e:
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self) -> dict[str, Any]:
+        """Number of batches and queries, batch size histogram, and time queries waited for their batch (ms)."""
+        with self._condition:
+            return {
+                'batches': self._batches,
+                'queries': self._queries,
+                'mean_batch_size': self._queries / self._batches if self._batches else 0.0,
+                'batch_sizes': dict(sorted(self._batch_size_counts.items())),
+                'mean_queue_time_ms': 1000 * self._queue_time_sec / self._queries if self._queries else 0.0,
+                'max_queue_time_ms': 1000 * self._max_queue_time_sec,
+            }
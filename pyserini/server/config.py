@@ -14,7 +14,7 @@
 # limitations under the License.
 #
 
-"""YAML server config (indexes, API keys) and in-memory accepted API tokens."""
+"""YAML server config (indexes, API keys, preloading) and in-memory accepted API tokens."""
 
 from __future__ import annotations
 
@@ -114,10 +114,24 @@ def _parse_indexes(raw_indexes: object, config_parent: Path) -> OrderedDict[str,
     return parsed_indexes
 
 
-def load_server_config(config_path: str | None) -> tuple[Mapping[str, IndexConfig], list[str] | None]:
-    """Load ``indexes`` and optional ``api_keys`` (list of secret strings)."""
+def _parse_string_list(raw: object, name: str) -> list[str]:
+    if not isinstance(raw, list):
+        raise ValueError(f'Config "{name}" must be a list of strings')
+    parsed: list[str] = []
+    for i, item in enumerate(raw):
+        if not isinstance(item, str) or not item.strip():
+            raise ValueError(f'Config {name} entry #{i} must be a non-empty string')
+        parsed.append(item.strip())
+    return parsed
+
+
+def load_server_config(
+    config_path: str | None,
+) -> tuple[Mapping[str, IndexConfig], list[str] | None, list[str], list[str] | None]:
+    """Load ``indexes``, optional ``api_keys`` (list of secret strings), optional ``preload`` (index names to open at
+    startup), and optional ``warmup_queries`` (``None`` if unset)."""
     if not config_path or not str(config_path).strip():
-        return {}, None
+        return {}, None, [], None
     path = Path(config_path)
     if not path.is_file():
         raise ValueError(f'Config file not found: {path}')
@@ -126,27 +140,26 @@ def load_server_config(config_path: str | None) -> tuple[Mapping[str, IndexConfi
         payload = yaml.safe_load(f)
 
     if not payload:
-        return {}, None
+        return {}, None, [], None
     if not isinstance(payload, dict):
         raise ValueError('Config root must be a mapping/object')
 
     api_keys_out: list[str] | None = None
-    api_keys_raw = payload.get('api_keys')
-    if api_keys_raw is not None:
-        if not isinstance(api_keys_raw, list):
-            raise ValueError('Config "api_keys" must be a list of strings')
-        parsed: list[str] = []
-        for i, item in enumerate(api_keys_raw):
-            if not isinstance(item, str) or not item.strip():
-                raise ValueError(f'Config api_keys entry #{i} must be a non-empty string')
-            parsed.append(item.strip())
-        api_keys_out = parsed or None
+    if payload.get('api_keys') is not None:
+        api_keys_out = _parse_string_list(payload['api_keys'], 'api_keys') or None
+
+    preload: list[str] = []
+    if payload.get('preload') is not None:
+        preload = list(dict.fromkeys(_parse_string_list(payload['preload'], 'preload')))
+    warmup_queries: list[str] | None = None
+    if payload.get('warmup_queries') is not None:
+        warmup_queries = _parse_string_list(payload['warmup_queries'], 'warmup_queries')
 
     if 'indexes' not in payload:
-        return {}, api_keys_out
+        return {}, api_keys_out, preload, warmup_queries
 
     parsed_indexes = _parse_indexes(payload['indexes'], path.resolve().parent)
-    return parsed_indexes, api_keys_out
+    return parsed_indexes, api_keys_out, preload, warmup_queries
 
 
 def _normalize_token_strings(raw: Iterable[str]) -> frozenset[str]:
@@ -27,5 +27,9 @@ class IndexNotAvailableError(BackendError):
     """Index name unknown, not supported, or path could not be opened."""
 
 
+class IndexLoadingError(BackendError):
+    """Index is being opened (or warmed up) in the background; retry later."""
+
+
 class DocumentNotFoundError(BackendError):
     """Requested document id is not in the index."""
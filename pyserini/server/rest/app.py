@@ -21,6 +21,8 @@ Usage:
     python -m pyserini.server.rest [--host HOST] [--port PORT] [--config PATH] [--no-prebuilt-indexes] 
                                    [--log-file PATH] [--keep-uvicorn-logs] [--load-shedding-threshold MS]
                                    [--search-cache-size N] [--document-cache-size N]
+                                   [--search-batch-size N] [--search-batch-wait MS]
+                                   [--background-index-loading]
 
 Endpoints:
     GET /openapi.yaml     : OpenAPI specification (same document as Anserini).
@@ -296,13 +298,16 @@ def create_app(
     load_shedding_threshold_ms: float = 3000.0,
     search_cache_size: int = 2048,
     document_cache_size: int = 4096,
+    search_batch_size: int = 0,
+    search_batch_wait_ms: float = 2.0,
+    background_index_loading: bool = False,
 ) -> FastAPI:
     if no_prebuilt_indexes and not config_path:
         raise ValueError('--no-prebuilt-indexes requires a config file path')
 
     token_strings = None
     if config_path:
-        _configured_indexes, token_strings = load_server_config(config_path)
+        _configured_indexes, token_strings, _, _ = load_server_config(config_path)
         if no_prebuilt_indexes and not _configured_indexes:
             raise ValueError('--no-prebuilt-indexes requires at least one entry under indexes: in the config file')
 
@@ -328,8 +333,14 @@ def create_app(
             no_prebuilt_indexes=no_prebuilt_indexes,
             search_cache_size=search_cache_size,
             document_cache_size=document_cache_size,
+            search_batch_size=search_batch_size,
+            search_batch_wait_ms=search_batch_wait_ms,
+            background_index_loading=background_index_loading,
         )
         yield
+        batching_stats = app.state.search_backend.get_search_batching_stats()
+        if batching_stats is not None:
+            logger.info('Search batching: %s', json.dumps(batching_stats))
         app.state.search_backend.close_all()
 
     app = FastAPI(
@@ -449,6 +460,15 @@ def create_app(
             'description': DESCRIPTION,
             'openapi': '/openapi.yaml',
             'documentation': '/docs',
+            'metrics': '/metrics',
+        }
+
+    @app.get('/metrics')
+    async def metrics(request: Request):
+        backend: SharedSearchBackend = request.app.state.search_backend
+        return {
+            'search_batching': backend.get_search_batching_stats(),
+            'query_embedding_cache': backend.get_query_embedding_cache_stats(),
         }
 
     app.include_router(v1.router, prefix=f'/{API_VERSION}')
@@ -513,6 +533,30 @@ def main():
         default=4096,
         help='LRU cache size for document fetches (default: 4096).',
     )
+    parser.add_argument(
+        '--search-batch-size',
+        type=int,
+        default=0,
+        help=(
+            'Batch concurrent searches of faiss and impact indexes into batches of up to N queries '
+            '(default: 0, i.e., no batching).'
+        ),
+    )
+    parser.add_argument(
+        '--search-batch-wait',
+        type=float,
+        default=2.0,
+        metavar='MS',
+        help='With --search-batch-size, how long a batch waits for more queries, in ms (default: 2).',
+    )
+    parser.add_argument(
+        '--background-index-loading',
+        action='store_true',
+        help=(
+            'Open indexes that are not yet open in the background on their first request, answering 503 '
+            'until they are ready, instead of holding requests while they download and open.'
+        ),
+    )
     args = parser.parse_args()
 
     if args.port <= 0 or args.port > 65535:
@@ -531,6 +575,12 @@ def main():
     if args.document_cache_size < 0:
         raise SystemExit('Error: --document-cache-size must be >= 0')
 
+    if args.search_batch_size < 0:
+        raise SystemExit('Error: --search-batch-size must be >= 0')
+
+    if args.search_batch_wait < 0:
+        raise SystemExit('Error: --search-batch-wait must be >= 0')
+
     uvicorn.run(
         create_app(
             args.config,
@@ -538,6 +588,9 @@ def main():
             load_shedding_threshold_ms=args.load_shedding_threshold,
             search_cache_size=args.search_cache_size,
             document_cache_size=args.document_cache_size,
+            search_batch_size=args.search_batch_size,
+            search_batch_wait_ms=args.search_batch_wait,
+            background_index_loading=args.background_index_loading,
         ),
         host=args.host,
         port=args.port,
@@ -29,17 +29,27 @@ from fastapi import APIRouter, Query, Request
 from fastapi.responses import JSONResponse
 
 from pyserini.server.backend import SharedSearchBackend
-from pyserini.server.errors import BadSearchRequestError, DocumentNotFoundError, IndexNotAvailableError
+from pyserini.server.errors import BadSearchRequestError, DocumentNotFoundError, IndexLoadingError, IndexNotAvailableError
 
 router = APIRouter(tags=['v1'])
 
 DEFAULT_HITS = 10
+# Sent as ``Retry-After`` while an index is loading in the background.
+INDEX_LOADING_RETRY_AFTER_SEC = 5
 
 
 def _error(status_code: int, message: str) -> JSONResponse:
     return JSONResponse(status_code=status_code, content={'error': message})
 
 
+def _index_loading_error(e: IndexLoadingError) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={'error': str(e)},
+        headers={'Retry-After': str(INDEX_LOADING_RETRY_AFTER_SEC)},
+    )
+
+
 def _parse_bool(raw: str | None, default: bool, name: str) -> tuple[bool | None, JSONResponse | None]:
     if raw is None:
         return default, None
@@ -143,6 +153,8 @@ async def search_v1(
             b=b_val,
             max_doc_length=max_doc_length_val,
         )
+    except IndexLoadingError as e:
+        return _index_loading_error(e)
     except IndexNotAvailableError as e:
         return _error(400, str(e))
     except BadSearchRequestError as e:
@@ -207,6 +219,8 @@ async def get_document_v1(
             'docid': docid_token,
             'doc': doc,
         }
+    except IndexLoadingError as e:
+        return _index_loading_error(e)
     except IndexNotAvailableError as e:
         return _error(400, str(e))
     except DocumentNotFoundError:
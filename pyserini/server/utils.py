@@ -27,6 +27,7 @@ from pyserini.prebuilt_index_info import (
     LUCENE_HNSW_INDEX_INFO,
     TF_INDEX_INFO,
 )
+from pyserini.encode import QueryEmbeddingCache
 from pyserini.search.faiss import FaissSearcher
 from pyserini.search.lucene import (
     LuceneFlatDenseSearcher,
@@ -65,6 +66,10 @@ class IndexConfig:
     index_type: str | None = ''
     # Custom BM25 searchers are immutable after creation; the default searcher remains at open-time defaults.
     bm25_searchers: OrderedDict[Bm25Config, Bm25SearcherCacheEntry] = field(default_factory=OrderedDict)
+    # Query embedding cache shared by the backend's faiss and impact searchers.
+    query_cache: QueryEmbeddingCache | None = None
+    # Searchers sharing this index that encode queries with a requested encoder other than ``encoder`` (faiss, impact).
+    encoder_searchers: OrderedDict[str, Any] = field(default_factory=OrderedDict)
 
 
 SHARDS = {
@@ -100,12 +105,12 @@ SEARCHER_FACTORIES: dict[str, tuple[Any, Any, Any]] = {
     'impact': (
         LuceneImpactSearcher,
         LuceneImpactSearcher.from_prebuilt_index,
-        lambda cfg: {'query_encoder': cfg.encoder},
+        lambda cfg: {'query_encoder': cfg.encoder, 'query_cache': cfg.query_cache},
     ),
     'faiss': (
         FaissSearcher,
         FaissSearcher.from_prebuilt_index,
-        lambda cfg: {'query_encoder': cfg.encoder},
+        lambda cfg: {'query_encoder': cfg.encoder, 'query_cache': cfg.query_cache},
     ),
 }
 
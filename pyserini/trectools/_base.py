@@ -22,6 +22,9 @@ from typing import List, Set, Tuple
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+from pyarrow import csv as pa_csv
 
 
 class AggregationMethod(Enum):
@@ -84,9 +87,56 @@ class Qrels:
         return filtered_df['docid'].tolist()
 
 
+def _as_categorical(column: pd.Series) -> pd.Categorical:
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.array
+    return pd.Categorical(column)
+
+
+def _format_column(column: pd.Series):
+    """Return the values of a column as strings, formatted like ``DataFrame.to_csv`` does."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        categories = np.array([str(value) for value in column.cat.categories.tolist()], dtype=object)
+        return categories[column.cat.codes.to_numpy()]
+    return [str(value) for value in column.tolist()]
+
+
+def _grouped_sum(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum the values with equal keys, returning the sorted distinct keys and their sums.
+
+    Values are added up in their order with Kahan summation, skipping NaNs, exactly like pandas' grouped ``sum``, so that
+    sums do not depend on how they are computed.
+    """
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], values[order]
+    is_start = np.ones(len(keys), dtype=bool)
+    np.not_equal(keys[1:], keys[:-1], out=is_start[1:])
+    starts = np.flatnonzero(is_start)
+    groups = np.cumsum(is_start) - 1
+    positions = np.arange(len(keys)) - starts[groups]
+
+    sums = np.zeros(len(starts))
+    compensations = np.zeros(len(starts))
+    valid = ~np.isnan(values)
+    for position in range(positions.max() + 1 if len(positions) else 0):
+        rows = np.flatnonzero((positions == position) & valid)
+        group = groups[rows]
+        y = values[rows] - compensations[group]
+        t = sums[group] + y
+        compensation = (t - sums[group]) - y
+        # The compensation of infinite sums is NaN.
+        compensation[np.isnan(compensation)] = 0
+        compensations[group] = compensation
+        sums[group] = t
+    return keys[starts], sums
+
+
 class TrecRun:
     """Wrapper class for a TREC run.
 
+    Runs are stored column by column, with topics and docids as categoricals, i.e., integer codes into tables of the
+    distinct topics and docids.
+
     Parameters
     ----------
     filepath : str
@@ -95,6 +145,9 @@ class TrecRun:
 
     columns = ['topic', 'q0', 'docid', 'rank', 'score', 'tag']
 
+    # Rows are written this many at a time.
+    write_batch_size = 1_000_000
+
     def __init__(self, filepath: str = None, resort: bool = False):
         self.reset_data()
         self.filepath = filepath
@@ -107,10 +160,35 @@ class TrecRun:
         self.run_data = pd.DataFrame(columns=TrecRun.columns)
 
     def read_run(self, filepath: str, resort: bool = False) -> None:
-        self.run_data = pd.read_csv(filepath, sep='\s+', names=TrecRun.columns, dtype={'docid': 'str', 'score': 'float'})
+        try:
+            self.run_data = TrecRun._read_columns(filepath)
+        except pa.ArrowInvalid:
+            # For example, runs with several spaces between columns, or lines with missing columns.
+            self.run_data = pd.read_csv(filepath, sep='\s+', names=TrecRun.columns,
+                                        dtype={'docid': 'str', 'score': 'float'}, float_precision='round_trip')
+        for column in ['topic', 'docid']:
+            if not isinstance(self.run_data[column].dtype, pd.CategoricalDtype):
+                self.run_data[column] = self.run_data[column].astype('category')
         if resort:
             self.run_data.sort_values(["topic", "score"], inplace=True, ascending=[True, False])
-            self.run_data["rank"] = self.run_data.groupby("topic")["score"].rank(ascending=False,method='first')
+            self.run_data["rank"] = self.run_data.groupby("topic", observed=True)["score"].rank(ascending=False,method='first')
+
+    @staticmethod
+    def _read_columns(filepath: str) -> pd.DataFrame:
+        """Parse a run with a single space or a tab between columns."""
+        dictionary = pa.dictionary(pa.int32(), pa.string())
+        convert_options = pa_csv.ConvertOptions(column_types={'q0': dictionary, 'docid': dictionary,
+                                                              'score': pa.float64(), 'tag': dictionary})
+
+        def read(delimiter):
+            return pa_csv.read_csv(filepath, read_options=pa_csv.ReadOptions(column_names=TrecRun.columns),
+                                   parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+                                   convert_options=convert_options).to_pandas()
+
+        try:
+            return read(' ')
+        except pa.ArrowInvalid:
+            return read('\t')
 
     def topics(self) -> Set[str]:
         """Return a set with all topics."""
@@ -128,7 +206,30 @@ class TrecRun:
             self.run_data['tag'] = tag
 
         self.run_data = self.run_data.sort_values(by=['topic', 'score'], ascending=[True, False])
-        self.run_data.to_csv(output_path, sep=' ', header=False, index=False)
+        if not self._is_plain():
+            self.run_data.to_csv(output_path, sep=' ', header=False, index=False)
+            return
+
+        with open(output_path, 'w') as f:
+            for start in range(0, len(self.run_data), TrecRun.write_batch_size):
+                batch = self.run_data.iloc[start:start + TrecRun.write_batch_size]
+                columns = [_format_column(batch[column]) for column in batch.columns]
+                f.write('\n'.join(map(' '.join, zip(*columns))))
+                f.write('\n')
+
+    def _is_plain(self) -> bool:
+        """Whether the run has no missing values nor values that ``DataFrame.to_csv`` would quote, so that it can be
+        written line by line."""
+        for column in self.run_data.columns:
+            values = self.run_data[column]
+            if values.isna().any():
+                return False
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.cat.categories.to_series()
+            if not pd.api.types.is_numeric_dtype(values.dtype) and \
+                    values.astype(str).str.contains('[ "\n\r]', regex=True).any():
+                return False
+        return True
 
     def get_docs_by_topic(self, topic: str, max_docs: int = None):
         docs = self.run_data[self.run_data['topic'] == topic]
@@ -139,29 +240,29 @@ class TrecRun:
         return docs
 
     def rescore(self, method: RescoreMethod, rrf_k: int = None, scale: float = None):
+        self.run_data['score'] = self.get_rescored_scores(method, rrf_k=rrf_k, scale=scale)
+        return self
+
+    def get_rescored_scores(self, method: RescoreMethod, rrf_k: int = None, scale: float = None) -> np.ndarray:
+        """Return the scores of the run rescored with ``method``, leaving the run unchanged."""
         # Refer to this guide on how to efficiently manipulate dataframes: https://engineering.upside.com/a-beginners-guide-to-optimizing-pandas-code-for-speed-c09ef2c6a4d6
         if method == RescoreMethod.RRF:
             assert rrf_k is not None, 'Parameter "rrf_k" must be a valid integer.'
-            self.run_data['score'] = 1 / (rrf_k + self.run_data['rank'].values)
+            return 1 / (rrf_k + self.run_data['rank'].values)
         elif method == RescoreMethod.SCALE:
             assert scale is not None, 'Parameter "scale" must not be none.'
-            self.run_data['score'] = self.run_data['score'].values * scale
+            return self.run_data['score'].values * scale
         elif method == RescoreMethod.NORMALIZE:
             # Vectorized min-max normalization per topic
-            def normalize_scores(group):
-                scores = group.values
-                low = scores.min()
-                high = scores.max()
-                if high - low == 0:
-                    return np.ones_like(scores)
-                else:
-                    return (scores - low) / (high - low)
-            self.run_data['score'] = self.run_data.groupby('topic')['score'].transform(normalize_scores)
+            grouped = self.run_data['score'].groupby(self.run_data['topic'], sort=False, observed=True)
+            low = grouped.transform('min').to_numpy()
+            high = grouped.transform('max').to_numpy()
+            scores = self.run_data['score'].to_numpy()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(high - low == 0, 1.0, (scores - low) / (high - low))
         else:
             raise NotImplementedError()
 
-        return self
-
     def to_numpy(self) -> np.ndarray:
         return self.run_data.to_numpy(copy=True)
 
@@ -231,7 +332,8 @@ class TrecRun:
         return all_topics
 
     @staticmethod
-    def merge(runs, aggregation: AggregationMethod, depth: int = None, k: int = None):
+    def merge(runs, aggregation: AggregationMethod, depth: int = None, k: int = None, scores: List[np.ndarray] = None,
+              threads: int = 1):
         """Return a TrecRun by aggregating docid in various ways such as summing scores
         Parameters
         ----------
@@ -245,50 +347,87 @@ class TrecRun:
         k : int
             Length of final results list.  Set to ``None`` by default, which indicates that the union of all input documents
             are ranked.
+        scores : List[np.ndarray]
+            Scores to aggregate for each run instead of its ``score`` column, e.g., from ``get_rescored_scores``, so that
+            runs need not be cloned to be rescored.
+        threads : int
+            Number of threads to aggregate disjoint sets of topics in.
         """
         if len(runs) < 2:
             raise Exception('Merge requires at least 2 runs.')
 
-        if aggregation == AggregationMethod.SUM:
-            # Step 1: Collect all dataframes from all runs
-            all_dfs = []
-            for run in runs:
-                if depth is not None:
-                    # Apply depth limit per topic per run using vectorized groupby
-                    df = run.run_data.groupby('topic', sort=False).head(depth)[['topic', 'docid', 'score']].copy()
-                else:
-                    df = run.run_data[['topic', 'docid', 'score']].copy()
-                all_dfs.append(df)
-
-            # Step 2: Concatenate all dataframes at once (vectorized)
-            combined_df = pd.concat(all_dfs, ignore_index=True)
-
-            # Step 3: Group by topic and docid, sum scores (vectorized aggregation)
-            merged_df = combined_df.groupby(['topic', 'docid'], as_index=False, sort=False)['score'].sum()
-
-            # Step 4: Sort by topic (ascending), score (descending), docid (ascending for tie-breaking)
-            merged_df = merged_df.sort_values(['topic', 'score', 'docid'], 
-                                             ascending=[True, False, True],
-                                             ignore_index=True)
-
-            # Step 5: Apply k limit per topic if specified (vectorized)
-            if k is not None:
-                merged_df = merged_df.groupby('topic', sort=False).head(k)
-
-            # Step 6: Add required columns and assign ranks (vectorized)
-            merged_df.insert(1, 'q0', 'Q0')
-            merged_df['tag'] = 'merge_sum'
-            merged_df.insert(3, 'rank', merged_df.groupby('topic', sort=False).cumcount() + 1)
+        if aggregation != AggregationMethod.SUM:
+            raise NotImplementedError()
 
-            # Reorder columns to match TrecRun format: ['topic', 'q0', 'docid', 'rank', 'score', 'tag']
-            merged_df = merged_df[['topic', 'q0', 'docid', 'rank', 'score', 'tag']]
+        if scores is None:
+            scores = [run.run_data['score'].to_numpy() for run in runs]
+
+        # Map the topics and docids of all runs to shared codes, which sort like the topics and docids themselves.
+        topics = union_categoricals([_as_categorical(run.run_data['topic']) for run in runs], sort_categories=True)
+        docids = union_categoricals([_as_categorical(run.run_data['docid']) for run in runs], sort_categories=True)
+        topic_codes = topics.codes.astype(np.int64)
+        docid_codes = docids.codes.astype(np.int64)
+        scores = np.concatenate(scores)
+
+        if depth is not None:
+            # Keep the first depth results of each topic in each run.
+            offsets = np.cumsum([0] + [len(run.run_data) for run in runs])
+            keep = np.concatenate([
+                pd.Series(topic_codes[start:end]).groupby(topic_codes[start:end], sort=False).cumcount().to_numpy() < depth
+                for start, end in zip(offsets[:-1], offsets[1:])])
+            topic_codes, docid_codes, scores = topic_codes[keep], docid_codes[keep], scores[keep]
+
+        num_docids = max(len(docids.categories), 1)
+        # Stable sorts of small integers are radix sorts.
+        topic_dtype = np.min_scalar_type(len(topics.categories))
+
+        def merge_topics(rows):
+            # Sum the scores of each (topic, docid), in the order of the runs.
+            keys, merged_scores = _grouped_sum(topic_codes[rows] * num_docids + docid_codes[rows], scores[rows])
+            merged_topics, merged_docids = np.divmod(keys, num_docids)
+
+            # Sort by topic (ascending), score (descending), docid (ascending for tie-breaking): the sums are in topic
+            # and docid order, so two stable sorts suffice.
+            order = np.argsort(-merged_scores, kind='stable')
+            order = order[np.argsort(merged_topics[order].astype(topic_dtype), kind='stable')]
+            merged_topics, merged_docids, merged_scores = merged_topics[order], merged_docids[order], merged_scores[order]
+
+            starts = np.flatnonzero(np.diff(merged_topics, prepend=-1))
+            ranks = np.arange(len(merged_topics)) - np.repeat(starts, np.diff(np.append(starts, len(merged_topics)))) + 1
+            if k is not None:
+                top = ranks <= k
+                merged_topics, merged_docids, merged_scores, ranks = \
+                    merged_topics[top], merged_docids[top], merged_scores[top], ranks[top]
+            return merged_topics, merged_docids, merged_scores, ranks
 
-            result = TrecRun()
-            result.run_data = merged_df
-            return result
+        if threads <= 1:
+            results = [merge_topics(slice(None))]
         else:
-            raise NotImplementedError()
-
+            # Split the topics into contiguous blocks with about the same number of rows.
+            num_topics = len(topics.categories)
+            rows_up_to_topic = np.cumsum(np.bincount(topic_codes, minlength=num_topics))
+            cuts = np.searchsorted(rows_up_to_topic, np.arange(1, threads) * len(topic_codes) / threads) + 1
+            edges = np.unique(np.concatenate([[0], cuts, [num_topics]]))
+            blocks = [np.flatnonzero((topic_codes >= low) & (topic_codes < high))
+                      for low, high in zip(edges[:-1], edges[1:])]
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = list(executor.map(merge_topics, blocks))
+        merged_topics, merged_docids, merged_scores, ranks = (np.concatenate(arrays) for arrays in zip(*results))
+
+        # Assemble the columns of the TrecRun format: ['topic', 'q0', 'docid', 'rank', 'score', 'tag']
+        num_rows = len(merged_topics)
+        merged_df = pd.DataFrame({
+            'topic': pd.Categorical.from_codes(merged_topics, dtype=topics.dtype),
+            'q0': pd.Categorical.from_codes(np.zeros(num_rows, dtype=np.int8), categories=['Q0']),
+            'docid': pd.Categorical.from_codes(merged_docids, dtype=docids.dtype),
+            'rank': ranks.astype(np.int64),
+            'score': merged_scores,
+            'tag': pd.Categorical.from_codes(np.zeros(num_rows, dtype=np.int8), categories=['merge_sum']),
+        })
+
+        result = TrecRun()
+        result.run_data = merged_df
+        return result
 
     @staticmethod
     def from_dataframes(dfs, run=None):
@@ -15,14 +15,19 @@
 #
 
 import hashlib
+import http.client
 import importlib
+import io
+import json
 import logging
 import os
 import re
 import shutil
 import tarfile
+import threading
 import urllib.request
 from collections.abc import Iterator
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from contextlib import contextmanager
 from urllib.error import HTTPError, URLError
 
@@ -42,6 +47,14 @@ from pyserini.prebuilt_index_info import (
 
 logger = logging.getLogger(__name__)
 
+# Downloads fetch files in chunks of DOWNLOAD_CHUNK_SIZE bytes over up to DOWNLOAD_CONNECTIONS parallel HTTP range
+# requests, reading responses DOWNLOAD_BUFFER_SIZE bytes at a time; a dropped connection is retried DOWNLOAD_RETRIES
+# times from where it stopped.
+DOWNLOAD_CONNECTIONS = 8
+DOWNLOAD_CHUNK_SIZE = 2**26
+DOWNLOAD_BUFFER_SIZE = 2**20
+DOWNLOAD_RETRIES = 3
+
 
 @contextmanager
 def temporary_env(**env_vars: str | None) -> Iterator[None]:
@@ -221,7 +234,280 @@ def compare_trec_files_with_tolerance(file1_path, file2_path, tolerance=1e-4):
     return compare_trec_strings_with_tolerance(lines1, lines2, tolerance)
 
 
-def download_url(url, save_dir, local_filename=None, md5=None, force=False, verbose=True, expected_size=None):
+def _open_url(url, start=None, end=None):
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    if start is not None:
+        headers['Range'] = f'bytes={start}-{end}'
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+
+
+class _DownloadCancelled(Exception):
+    pass
+
+
+class _Download:
+    """Download of a URL into a ``.part`` file on a background thread.
+
+    If the server supports HTTP range requests, the file is fetched in fixed-size chunks over parallel connections,
+    and the completed chunks are recorded in a ``.part.json`` state file, so that an interrupted download resumes
+    where it stopped. Otherwise, the file is fetched over a single connection. Bytes become readable, through
+    ``_DownloadReader``, as soon as all the bytes before them are on disk.
+
+    Parameters
+    ----------
+    url : str
+        URL to download.
+    part_path : str
+        Path to the partial download.
+    md5 : str
+        Expected MD5 checksum, used to check that a partial download is of the same file.
+    expected_size : int
+        Expected size in bytes; ``None`` or ``-1`` skips the check.
+    connections : int
+        Maximum number of parallel connections.
+    chunk_size : int
+        Size of the chunks fetched by each range request.
+    verbose : bool
+        Whether to show a progress bar.
+    desc : str
+        Description of the progress bar.
+    """
+
+    def __init__(self, url, part_path, md5=None, expected_size=None, connections=DOWNLOAD_CONNECTIONS,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE, verbose=True, desc=None):
+        self.url = url
+        self.part_path = part_path
+        self.state_path = f'{part_path}.json'
+        self.md5 = md5
+        self.expected_size = expected_size if expected_size != -1 else None
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.size = None
+        self._progress = TqdmUpTo(unit='B', unit_scale=True, unit_divisor=1024, miniters=1, desc=desc,
+                                  disable=not verbose)
+        self._condition = threading.Condition()
+        self._done_chunks = set()
+        self._available = 0
+        self._finished = False
+        self._cancelled = False
+        self._error = None
+        self._thread = None
+
+    def start(self):
+        """Start downloading; errors of the first request, e.g., ``HTTPError``, are raised here."""
+        response = _open_url(self.url, 0, 0)
+        content_range = response.headers.get('Content-Range', '')
+        if response.status == 206 and re.fullmatch(r'bytes 0-0/\d+', content_range):
+            response.close()
+            self.size = int(content_range.split('/')[1])
+            self._check_size(self.size)
+            self._progress.total = self.size
+            target, args = self._download_ranges, (self._prepare_ranges(),)
+        else:
+            # The server ignored the range and is sending the whole file.
+            content_length = response.headers.get('Content-Length')
+            self.size = int(content_length) if content_length is not None else None
+            self._check_size(self.size)
+            self._progress.total = self.size
+            self.remove()
+            open(self.part_path, 'wb').close()
+            target, args = self._download_stream, (response,)
+        self._thread = threading.Thread(target=self._run, args=(target, *args), name='Download', daemon=True)
+        self._thread.start()
+        return self
+
+    def _check_size(self, actual_size):
+        if actual_size is not None and self.expected_size is not None:
+            assert actual_size == self.expected_size, \
+                f'{self.url} does not match expected file size! Expecting {self.expected_size} bytes, got {actual_size} bytes.'
+
+    def _run(self, target, *args):
+        try:
+            target(*args)
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+            self._progress.close()
+
+    def _load_state(self):
+        """Return the chunks of a partial download of the same file, if any."""
+        if not os.path.exists(self.part_path) or not os.path.exists(self.state_path):
+            return set()
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except ValueError:
+            return set()
+        if (state.get('size') != self.size or state.get('chunk_size') != self.chunk_size
+                or (state.get('md5') or state.get('url')) != (self.md5 or self.url)):
+            return set()
+        return set(state['chunks'])
+
+    def _save_state(self):
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'url': self.url, 'md5': self.md5, 'size': self.size, 'chunk_size': self.chunk_size,
+                       'chunks': sorted(self._done_chunks)}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _chunk_range(self, chunk):
+        return chunk * self.chunk_size, min((chunk + 1) * self.chunk_size, self.size)
+
+    def _prepare_ranges(self):
+        """Resume a partial download of the same file, if any, or allocate the partial download; return the chunks
+        left to download."""
+        done_chunks = self._load_state()
+        if done_chunks:
+            logger.info(f'Resuming download of {self.url} from {self.part_path}.')
+        else:
+            with open(self.part_path, 'wb') as f:
+                f.truncate(self.size)
+        with self._condition:
+            self._done_chunks = done_chunks
+            self._save_state()
+            self._update_available()
+        self._progress.update(sum(end - start for start, end in map(self._chunk_range, done_chunks)))
+        return [chunk for chunk in range(-(-self.size // self.chunk_size)) if chunk not in done_chunks]
+
+    def _download_ranges(self, pending_chunks):
+        # Chunks are submitted in order, so the readable prefix of the file grows steadily.
+        with ThreadPoolExecutor(self.connections) as executor:
+            futures = [executor.submit(self._download_chunk, chunk) for chunk in pending_chunks]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    self._cancelled = True
+                    for pending in futures:
+                        pending.cancel()
+                    raise future.exception()
+
+    def _download_chunk(self, chunk):
+        start, end = self._chunk_range(chunk)
+        position = start
+        attempts = 0
+        with open(self.part_path, 'r+b') as f:
+            while position < end:
+                if self._cancelled:
+                    raise _DownloadCancelled()
+                try:
+                    with _open_url(self.url, position, end - 1) as response:
+                        if response.status != 206:
+                            raise http.client.HTTPException(f'Range request to {self.url} returned {response.status}.')
+                        f.seek(position)
+                        while position < end:
+                            if self._cancelled:
+                                raise _DownloadCancelled()
+                            buffer = response.read(min(DOWNLOAD_BUFFER_SIZE, end - position))
+                            if not buffer:
+                                raise http.client.IncompleteRead(b'', end - position)
+                            f.write(buffer)
+                            position += len(buffer)
+                            self._progress.update(len(buffer))
+                except (OSError, http.client.HTTPException) as e:
+                    attempts += 1
+                    if attempts > DOWNLOAD_RETRIES:
+                        raise
+                    logger.warning(f'Retrying bytes {position}-{end - 1} of {self.url} after error: {e}')
+            f.flush()
+        with self._condition:
+            self._done_chunks.add(chunk)
+            self._save_state()
+            self._update_available()
+
+    def _update_available(self):
+        available = self._available
+        while available < self.size and available // self.chunk_size in self._done_chunks:
+            available = self._chunk_range(available // self.chunk_size)[1]
+        if available != self._available:
+            self._available = available
+            self._condition.notify_all()
+
+    def _download_stream(self, response):
+        with response, open(self.part_path, 'wb') as f:
+            while True:
+                if self._cancelled:
+                    raise _DownloadCancelled()
+                buffer = response.read(DOWNLOAD_BUFFER_SIZE)
+                if not buffer:
+                    break
+                f.write(buffer)
+                f.flush()
+                self._progress.update(len(buffer))
+                with self._condition:
+                    self._available += len(buffer)
+                    self._condition.notify_all()
+        if self.size is None:
+            self.size = self._available
+
+    def wait_available(self, position):
+        """Block until more than ``position`` bytes are readable or the download ends, and return the number of
+        readable bytes."""
+        with self._condition:
+            while self._available <= position and not self._finished:
+                self._condition.wait()
+        self.raise_error()
+        return self._available
+
+    def raise_error(self):
+        """Raise the error that stopped the download, if any."""
+        if self._error is not None and not isinstance(self._error, _DownloadCancelled):
+            raise self._error
+
+    def cancel(self):
+        """Stop downloading, keeping the partial download for resuming."""
+        self._cancelled = True
+        if self._thread is not None:
+            self._thread.join()
+
+    def finish(self):
+        """Wait for the download to complete, and check its size."""
+        self._thread.join()
+        self.raise_error()
+        self._check_size(os.path.getsize(self.part_path))
+
+    def remove(self):
+        """Remove the partial download and its state."""
+        for path in [self.part_path, self.state_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class _DownloadReader(io.RawIOBase):
+    """Reads a ``_Download`` sequentially while it is in progress, computing the MD5 checksum of the bytes read."""
+
+    def __init__(self, download):
+        super().__init__()
+        self._download = download
+        self._file = open(download.part_path, 'rb')
+        self._position = 0
+        self.md5 = hashlib.md5()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        available = self._download.wait_available(self._position)
+        data = self._file.read(min(len(b), available - self._position))
+        b[:len(data)] = data
+        self.md5.update(data)
+        self._position += len(data)
+        return len(data)
+
+    def drain(self):
+        """Read to the end of the download, so that the checksum covers all of it."""
+        while self.read(DOWNLOAD_BUFFER_SIZE):
+            pass
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def download_url(url, save_dir, local_filename=None, md5=None, force=False, verbose=True, expected_size=None,
+                 connections=DOWNLOAD_CONNECTIONS, chunk_size=DOWNLOAD_CHUNK_SIZE):
     # If caller does not specify local filename, figure it out from the download URL:
     if not local_filename:
         filename = url.split('/')[-1]
@@ -248,35 +534,26 @@ def download_url(url, save_dir, local_filename=None, md5=None, force=False, verb
             print(f'force=True, removing {destination_path}; fetching fresh copy...')
         os.remove(destination_path)
 
-    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-
-    # Note: urlretrieve doesn't directly support headers.
+    # The file is downloaded to destination_path.part, which is kept on failure for resuming, unless force=True.
+    download = _Download(url, f'{destination_path}.part', md5=md5, expected_size=expected_size,
+                         connections=connections, chunk_size=chunk_size, verbose=verbose, desc=filename)
+    if force:
+        download.remove()
     try:
-        with TqdmUpTo(unit='B', unit_scale=True, unit_divisor=1024, miniters=1, desc=filename, disable=not verbose) as t:
-            with urllib.request.urlopen(req) as response:
-                # Get file size from headers if available
-                file_size = int(response.headers.get('Content-Length', -1))
-                t.total = file_size
-
-                with open(destination_path, 'wb') as f:
-                    while True:
-                        chunk = response.read(4096)  # 4KB chunks
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        t.update(len(chunk))
+        download.start()
+        download.finish()
     except HTTPError as e:
         print(f'HTTP Error {e.code}: {e.reason}')
-
-    # Don't do the size check if the size is -1 or None.
-    if expected_size != -1 and expected_size is not None:
-        actual_size = os.path.getsize(destination_path)
-        assert actual_size == expected_size, f'{destination_path} does not match expected file size! Expecting {expected_size} bytes, got {actual_size} bytes.'
+        raise
 
     if md5:
-        md5_computed = compute_md5(destination_path)
+        md5_computed = compute_md5(download.part_path)
+        if md5_computed != md5:
+            download.remove()
         assert md5_computed == md5, f'{destination_path} does not match checksum! Expecting {md5} got {md5_computed}.'
 
+    os.replace(download.part_path, destination_path)
+    download.remove()
     return destination_path
 
 
@@ -301,7 +578,8 @@ def get_cache_home():
 
 
 def download_and_unpack_archive(url, output_dir='indexes', local_filename=False, md5=None,
-                                force=False, verbose=True, append_md5_to_dir_name=False, expected_size=None):
+                                force=False, verbose=True, append_md5_to_dir_name=False, expected_size=None,
+                                connections=DOWNLOAD_CONNECTIONS, chunk_size=DOWNLOAD_CHUNK_SIZE):
     archive_name = _download_archive_name(url, local_filename)
     dir_name = _archive_name_to_dir_name(archive_name)
 
@@ -322,8 +600,9 @@ def download_and_unpack_archive(url, output_dir='indexes', local_filename=False,
         output_path = os.path.join(output_dir, f'{dir_name}')
 
     # Check to see if the extracted directory already exists. If so, return it unless force=True, in which case we
-    # remove it and download a fresh copy.
-    if os.path.exists(output_path):
+    # remove it and download a fresh copy. A partial download left next to it means that its extraction was interrupted.
+    part_path = f'{local_tarball}.part'
+    if os.path.exists(output_path) and (force or not os.path.exists(part_path)):
         if not force:
             if verbose:
                 print(f'{output_path} already exists, skipping download.')
@@ -333,18 +612,44 @@ def download_and_unpack_archive(url, output_dir='indexes', local_filename=False,
         shutil.rmtree(output_path)
 
     if verbose:
-        print(f'Downloading archive at {url}...')
-    local_tarball = download_url(url, output_dir, local_filename=local_filename, verbose=False, md5=md5, expected_size=expected_size)
+        print(f'Downloading archive at {url} and extracting it into {output_path}...')
+
+    # The archive is extracted while it downloads, from the partial download, which is kept on failure for resuming.
+    download = _Download(url, part_path, md5=md5, expected_size=expected_size,
+                         connections=connections, chunk_size=chunk_size, verbose=False)
+    if force:
+        download.remove()
+    download.start()
+    reader = _DownloadReader(download)
+    dirs_in_tarball = []
+
+    def members(tarball):
+        for member in tarball:
+            if member.isdir():
+                dirs_in_tarball.append(member.name)
+            yield member
 
-    if verbose:
-        print(f'Extracting {local_tarball} into {output_path}...')
+    try:
+        with tarfile.open(fileobj=io.BufferedReader(reader, DOWNLOAD_BUFFER_SIZE), mode='r|*') as tarball:
+            tarball.extractall(output_dir, members=members(tarball), filter='data')
+        reader.drain()
+        download.finish()
+    except BaseException:
+        download.cancel()
+        # Errors of the download itself, e.g., HTTPError, take precedence over the resulting extraction errors.
+        download.raise_error()
+        raise
+    finally:
+        reader.close()
 
-    tarball = tarfile.open(local_tarball)
-    dirs_in_tarball = [member.name for member in tarball if member.isdir()]
     assert len(dirs_in_tarball), f"Detect multiple members ({', '.join(dirs_in_tarball)}) under the tarball {local_tarball}."
-    tarball.extractall(output_dir, filter='data')
-    tarball.close()
-    os.remove(local_tarball)
+    if md5:
+        md5_computed = reader.md5.hexdigest()
+        if md5_computed != md5:
+            download.remove()
+            shutil.rmtree(os.path.join(output_dir, dirs_in_tarball[0]), ignore_errors=True)
+        assert md5_computed == md5, f'{local_tarball} does not match checksum! Expecting {md5} got {md5_computed}.'
+    download.remove()
 
     if append_md5_to_dir_name:
         dir_in_tarball = dirs_in_tarball[0]
@@ -407,7 +712,7 @@ def get_dense_indexes_info():
         print(df)
 
 
-def download_prebuilt_index(index_name, force=False, verbose=True, mirror=None):
+def download_prebuilt_index(index_name, force=False, verbose=True, mirror=None, connections=DOWNLOAD_CONNECTIONS):
     if (index_name not in TF_INDEX_INFO and
             index_name not in IMPACT_INDEX_INFO and
             index_name not in LUCENE_HNSW_INDEX_INFO and
@@ -431,7 +736,7 @@ def download_prebuilt_index(index_name, force=False, verbose=True, mirror=None):
     for url in target_index['urls']:
         local_filename = target_index['filename'] if 'filename' in target_index else None
         try:
-            return download_and_unpack_archive(url, local_filename=local_filename, append_md5_to_dir_name=True, md5=index_md5, verbose=verbose, expected_size=expected_size)
+            return download_and_unpack_archive(url, local_filename=local_filename, append_md5_to_dir_name=True, md5=index_md5, verbose=verbose, expected_size=expected_size, connections=connections)
         except (HTTPError, URLError):
             print(f'Unable to download prebuilt index at {url}, trying next URL...')
     raise ValueError('Unable to download prebuilt index at any known URLs.')
@@ -14,21 +14,78 @@
 # limitations under the License.
 #
 
-import math
-from typing import List, Optional
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 from scipy.sparse import csr_matrix
 from sklearn.preprocessing import normalize
 from tqdm import tqdm
 
 from pyserini.analysis import Analyzer, get_lucene_analyzer
-from pyserini.index.lucene import LuceneIndexReader
+from pyserini.index.lucene import IdfTable, LuceneIndexReader
 from pyserini.search.lucene import LuceneSearcher
 
 
+def _int4_to_long(i: int) -> int:
+    bits = i & 0x07
+    shift = (i >> 3) - 1
+    return bits if shift == -1 else (bits | 0x08) << shift
+
+
+# Field lengths as Lucene decodes them from the one-byte norms, i.e., ``SmallFloat.byte4ToInt``; the first 24 lengths
+# are stored exactly.
+_NUM_FREE_VALUES = 24
+_LENGTH_TABLE = np.array([i if i < _NUM_FREE_VALUES else _NUM_FREE_VALUES + _int4_to_long(i - _NUM_FREE_VALUES)
+                          for i in range(256)], dtype=np.float32)
+
+
+def lucene_bm25_weights(tfs: np.ndarray, dfs: np.ndarray, doc_lengths: np.ndarray, doc_count: int,
+                        total_terms: int, k1: float = 0.9, b: float = 0.4) -> np.ndarray:
+    """Compute BM25 term weights with the same single-precision arithmetic as Lucene's ``BM25Similarity``, so that the
+    weights are identical to :func:`LuceneIndexReader.compute_bm25_term_weight`.
+
+    Parameters
+    ----------
+    tfs : np.ndarray
+        Term frequency of each (term, document) pair.
+    dfs : np.ndarray
+        Document frequency of the term of each pair.
+    doc_lengths : np.ndarray
+        Length of the document of each pair, in tokens.
+    doc_count : int
+        Number of documents with the field.
+    total_terms : int
+        Total number of tokens in the field.
+    k1 : float
+        BM25 k1 parameter.
+    b : float
+        BM25 b parameter.
+
+    Returns
+    -------
+    np.ndarray
+        BM25 weight of each pair, as ``float32``.
+    """
+    one = np.float32(1)
+    k1, b = np.float32(k1), np.float32(b)
+    dfs = np.asarray(dfs, dtype=np.float64)
+    idfs = np.log(1 + (doc_count - dfs + 0.5) / (dfs + 0.5)).astype(np.float32)
+    avgdl = np.float32(total_terms / doc_count)
+    # Norms truncate lengths to the nearest smaller value in the length table.
+    lengths = _LENGTH_TABLE[np.searchsorted(_LENGTH_TABLE, doc_lengths, side='right') - 1]
+    norm_inverses = one / (k1 * ((one - b) + b * lengths / avgdl))
+    weights = idfs - idfs / (one + np.asarray(tfs, dtype=np.float32) * norm_inverses)
+    # Anserini scores the term together with a constant-score docid filter, and then takes the filter's 1 back off.
+    return (weights + one) - one
+
+
 class Vectorizer:
     """Base class for vectorizer implemented on top of Pyserini.
 
+    Term statistics are read from the index's memory-mapped IDF table (see :class:`IdfTable`), which is computed and
+    written next to the index the first time it is opened.
+
     Parameters
     ----------
     lucene_index_path : str
@@ -47,32 +104,67 @@ class Vectorizer:
         self.num_docs: int = self.searcher.num_docs
         self.stats = self.index_reader.stats()
         self.analyzer = Analyzer(get_lucene_analyzer())
+        self.term_stats = IdfTable.from_index(lucene_index_path, stats=self.stats)
 
-        # build vocabulary
-        self.vocabulary_ = set()
-        for term in self.index_reader.terms():
-            if term.df > self.min_df:
-                self.vocabulary_.add(term.term)
-        self.vocabulary_ = sorted(self.vocabulary_)
-
-        # build term to index mapping
-        self.term_to_index = {}
-        for i, term in enumerate(self.vocabulary_):
-            self.term_to_index[term] = i
-        self.vocabulary_size = len(self.vocabulary_)
+        # build vocabulary: the column of each index term, or -1 for terms at or below min_df
+        eligible = np.asarray(self.term_stats.dfs) > self.min_df
+        self.term_columns = np.where(eligible, np.cumsum(eligible) - 1, -1)
+        self.vocabulary_size = int(eligible.sum())
 
         if self.verbose:
             print(f'Found {self.vocabulary_size} terms with min_df={self.min_df}')
 
+    @cached_property
+    def vocabulary_(self) -> List[str]:
+        """Sorted vocabulary; the byte order of UTF-8 encoded terms is also their code point order."""
+        return self.term_stats.terms(np.flatnonzero(self.term_columns >= 0))
+
+    @cached_property
+    def term_to_index(self) -> Dict[str, int]:
+        return {term: i for i, term in enumerate(self.vocabulary_)}
+
     def get_query_vector(self, query: str):
-        matrix_row, matrix_col, matrix_data = [], [], []
         tokens = self.analyzer.analyze(query)
-        for term in tokens:
-            if term in self.vocabulary_:
-                matrix_row.append(0)
-                matrix_col.append(self.term_to_index[term])
-                matrix_data.append(1)
-        vectors = csr_matrix((matrix_data, (matrix_row, matrix_col)), shape=(1, self.vocabulary_size))
+        positions = self.term_stats.positions(tokens)
+        columns = self.term_columns[positions[positions >= 0]]
+        columns = columns[columns >= 0]
+        vectors = csr_matrix((np.ones(len(columns), dtype=np.int64), (np.zeros(len(columns), dtype=np.int64), columns)),
+                             shape=(1, self.vocabulary_size))
+        return vectors
+
+    def _get_term_frequencies(self, docids: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Fetch the document vectors of ``docids`` and flatten them into arrays.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+            Row, position in the term table and term frequency of each (document, term) pair, and the length of each
+            document. Documents not in the index have no pairs.
+        """
+        rows, terms, tfs = [], [], []
+        for index, doc_id in enumerate(tqdm(docids, disable=not self.verbose)):
+            tf = self.index_reader.get_document_vector(doc_id)
+            if tf is None:
+                continue
+            rows.extend([index] * len(tf))
+            terms.extend(tf)
+            tfs.extend(tf.values())
+
+        rows = np.array(rows, dtype=np.int64)
+        tfs = np.array(tfs, dtype=np.int64)
+        # The field length Lucene records in the norms is the number of indexed tokens, i.e., the sum of the document
+        # vector, including terms below min_df.
+        doc_lengths = np.bincount(rows, weights=tfs, minlength=len(docids)).astype(np.int64)
+        return rows, self.term_stats.positions(terms), tfs, doc_lengths
+
+    def _to_csr(self, rows: np.ndarray, positions: np.ndarray, data: np.ndarray, num_docs: int):
+        """Assemble the CSR matrix of the (document, term) pairs whose term is in the vocabulary."""
+        columns = self.term_columns[positions]
+        keep = (positions >= 0) & (columns >= 0)
+        indptr = np.zeros(num_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[keep], minlength=num_docs), out=indptr[1:])
+        vectors = csr_matrix((data[keep], columns[keep], indptr), shape=(num_docs, self.vocabulary_size))
+        vectors.sort_indices()
         return vectors
 
 
@@ -92,9 +184,9 @@ class TfidfVectorizer(Vectorizer):
     def __init__(self, lucene_index_path: str, min_df: int = 1, verbose: bool = False):
         super().__init__(lucene_index_path, min_df, verbose)
 
-        self.idf_ = {}
-        for term in self.index_reader.terms():
-            self.idf_[term.term] = math.log(self.num_docs / term.df)
+    @cached_property
+    def idf_(self) -> Dict[str, float]:
+        return {term: float(idf) for term, idf in zip(self.term_stats.terms(), self.term_stats.idfs)}
 
     def get_vectors(self, docids: List[str], norm: Optional[str] = 'l2'):
         """Get the tf-idf vectors given a list of docids
@@ -111,26 +203,9 @@ class TfidfVectorizer(Vectorizer):
         csr_matrix
             Sparse matrix representation of tf-idf vectors
         """
-        matrix_row, matrix_col, matrix_data = [], [], []
-        num_docs = len(docids)
-
-        for index, doc_id in enumerate(tqdm(docids)):
-            # Term Frequency
-            tf = self.index_reader.get_document_vector(doc_id)
-            if tf is None:
-                continue
-
-            # Filter out in-eligible terms
-            tf = {t: tf[t] for t in tf if t in self.term_to_index}
-
-            # Convert from dict to sparse matrix
-            for term in tf:
-                tfidf = tf[term] * self.idf_[term]
-                matrix_row.append(index)
-                matrix_col.append(self.term_to_index[term])
-                matrix_data.append(tfidf)
-
-        vectors = csr_matrix((matrix_data, (matrix_row, matrix_col)), shape=(num_docs, self.vocabulary_size))
+        rows, positions, tfs, _ = self._get_term_frequencies(docids)
+        tfidfs = tfs * np.asarray(self.term_stats.idfs)[np.maximum(positions, 0)]
+        vectors = self._to_csr(rows, positions, tfidfs, len(docids))
 
         if norm:
             return normalize(vectors, norm=norm)
@@ -168,27 +243,11 @@ class BM25Vectorizer(Vectorizer):
         csr_matrix
             Sparse matrix representation of BM25 vectors
         """
-        matrix_row, matrix_col, matrix_data = [], [], []
-        num_docs = len(docids)
-
-        for index, doc_id in enumerate(tqdm(docids)):
-
-            # Term Frequency
-            tf = self.index_reader.get_document_vector(doc_id)
-            if tf is None:
-                continue
-
-            # Filter out in-eligible terms
-            tf = {t: tf[t] for t in tf if t in self.term_to_index}
-
-            # Convert from dict to sparse matrix
-            for term in tf:
-                bm25_weight = self.index_reader.compute_bm25_term_weight(doc_id, term, analyzer=None)
-                matrix_row.append(index)
-                matrix_col.append(self.term_to_index[term])
-                matrix_data.append(bm25_weight)
-
-        vectors = csr_matrix((matrix_data, (matrix_row, matrix_col)), shape=(num_docs, self.vocabulary_size))
+        rows, positions, tfs, doc_lengths = self._get_term_frequencies(docids)
+        dfs = np.asarray(self.term_stats.dfs)[np.maximum(positions, 0)]
+        bm25_weights = lucene_bm25_weights(tfs, dfs, doc_lengths[rows], self.stats['non_empty_documents'],
+                                           self.stats['total_terms']).astype(np.float64)
+        vectors = self._to_csr(rows, positions, bm25_weights, len(docids))
 
         if norm:
             return normalize(vectors, norm=norm)
@@ -181,6 +181,28 @@ class TestJsonlCollectionIterator(unittest.TestCase):
             self.assertEqual(expected_info[2], info['did'][0])
             self.assertEqual(expected_info[3], info['txt'][0])
 
+    def test_streaming(self):
+        for corpus_path, fields, delimiter in [('simple_mrtydi_corpus.json', ['title', 'text'], '\n\n'),
+                                               ('sample_collection_dense', ['title', 'text'], '\n')]:
+            corpus_path = os.path.join(self.resource_dir, corpus_path)
+            expected = JsonlCollectionIterator(corpus_path, fields, delimiter=delimiter)
+            expected = list(zip(expected.all_info['id'], expected.all_info['title'], expected.all_info['text']))
+
+            for batch_size in [1, 3]:
+                for shard_num in [1, 2, 5]:
+                    collection_iterator = JsonlCollectionIterator(corpus_path, fields, delimiter=delimiter,
+                                                                  streaming=True)
+                    self.assertIsNone(collection_iterator.all_info)
+
+                    streamed = []
+                    for shard_id in range(shard_num):
+                        for info in collection_iterator(batch_size, shard_id, shard_num):
+                            self.assertLessEqual(len(info['id']), batch_size)
+                            streamed.extend(zip(info['id'], info['title'], info['text']))
+
+                    # Shards are contiguous byte ranges, so concatenating them preserves corpus order.
+                    self.assertEqual(streamed, expected)
+
 
 if __name__ == '__main__':
     unittest.main()
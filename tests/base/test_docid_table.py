@@ -0,0 +1,71 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import tempfile
+import unittest
+
+from pyserini.docid_table import DOCID_OFFSETS_SUFFIX, DocidTable, write_docid_offsets, write_docids
+
+
+class TestDocidTable(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.docid_path = os.path.join(self.tmp_dir.name, 'docid')
+        self.docids = ['doc1', 'CACM-2636', 'msmarco_passage_00_0', 'dóc-ünïcode', 'last']
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_and_read(self):
+        write_docids(self.docid_path, self.docids)
+        self.assertTrue(os.path.exists(self.docid_path + DOCID_OFFSETS_SUFFIX))
+
+        table = DocidTable(self.docid_path)
+        self.assertEqual(len(table), len(self.docids))
+        self.assertEqual(list(table), self.docids)
+        self.assertEqual(table[3], 'dóc-ünïcode')
+        self.assertEqual(table[-1], 'last')
+        self.assertEqual(table[1:3], self.docids[1:3])
+        self.assertEqual(table.take([4, 0]), ['last', 'doc1'])
+        with self.assertRaises(IndexError):
+            table[len(self.docids)]
+        table.close()
+
+    def test_plain_text_fallback(self):
+        # Legacy indexes only have the plain-text file, possibly with CRLF line endings and no trailing newline.
+        with open(self.docid_path, 'w', newline='') as f:
+            f.write('\r\n'.join(self.docids))
+
+        table = DocidTable(self.docid_path)
+        self.assertEqual(list(table), self.docids)
+
+    def test_stale_offsets_are_ignored(self):
+        write_docids(self.docid_path, self.docids)
+        with open(self.docid_path, 'a') as f:
+            f.write('appended\n')
+
+        self.assertEqual(list(DocidTable(self.docid_path)), self.docids + ['appended'])
+        write_docid_offsets(self.docid_path)
+        self.assertEqual(list(DocidTable(self.docid_path)), self.docids + ['appended'])
+
+    def test_empty(self):
+        write_docids(self.docid_path, [])
+        self.assertEqual(len(DocidTable(self.docid_path)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
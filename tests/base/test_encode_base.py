@@ -14,13 +14,44 @@
 # limitations under the License.
 #
 
+import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 
-from pyserini.encode._base import load_head_weights
+import numpy as np
+
+from pyserini.docid_table import DocidTable
+from pyserini.encode._base import DocumentEncoder, EncodingPipeline, JsonlRepresentationWriter, NumpyRepresentationWriter, \
+    QueryEncoder, load_head_weights
 import torch
 
 
+class LengthEncoder(DocumentEncoder):
+    def tokenize(self, texts, **kwargs):
+        return {'lengths': [len(text) for text in texts]}
+
+    def encode_tokenized(self, inputs):
+        if 0 in inputs['lengths']:
+            raise ValueError('empty document')
+        return np.array(inputs['lengths'], dtype=np.float32).reshape(-1, 1)
+
+
+class LengthQueryEncoder(QueryEncoder):
+    def __init__(self):
+        super().__init__()
+        self.has_model = True
+        self.batches = []
+
+    def encode(self, query: str):
+        return self._encode_batch([query])[0]
+
+    def _encode_batch(self, queries):
+        self.batches.append(queries)
+        return np.array([[len(query), torch.is_inference_mode_enabled()] for query in queries], dtype=np.float32)
+
+
 class TestEncodeBase(unittest.TestCase):
     def test_load_head_weights_uses_fallback_prefixes(self):
         model = torch.nn.Module()
@@ -64,6 +95,64 @@ class TestEncodeBase(unittest.TestCase):
         self.assertTrue(torch.equal(model.norm.weight, checkpoint['ance_encoder.norm.weight']))
         self.assertTrue(torch.equal(model.norm.bias, checkpoint['ance_encoder.norm.bias']))
 
+    def test_encoding_pipeline(self):
+        docs = [f'doc{i}' + 'x' * (i % 7) for i in range(103)]
+        batches = [{'id': [f'd{j}' for j in range(i, min(i + 10, len(docs)))], 'text': docs[i:i + 10]}
+                   for i in range(0, len(docs), 10)]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = JsonlRepresentationWriter(tmp_dir)
+            with writer:
+                EncodingPipeline(LengthEncoder(), writer, num_workers=3, queue_size=2).run(
+                    iter(batches), lambda batch_info: {'texts': batch_info['text']}, ['text'])
+            with open(os.path.join(tmp_dir, 'embeddings.jsonl')) as f:
+                embeddings = [json.loads(line) for line in f]
+
+        self.assertEqual([entry['id'] for entry in embeddings], [f'd{i}' for i in range(len(docs))])
+        self.assertEqual([entry['contents'] for entry in embeddings], docs)
+        self.assertEqual([entry['vector'] for entry in embeddings], [[float(len(doc))] for doc in docs])
+
+    def test_encoding_pipeline_propagates_errors(self):
+        batches = [{'id': [str(i)], 'text': ['' if i == 5 else 'text']} for i in range(100)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = JsonlRepresentationWriter(tmp_dir)
+            with writer, self.assertRaises(ValueError):
+                EncodingPipeline(LengthEncoder(), writer, queue_size=1).run(
+                    iter(batches), lambda batch_info: {'texts': batch_info['text']}, ['text'])
+
+    def test_query_encoder_encode_batch(self):
+        queries = ['ccc', 'a', 'dddd', 'bb', 'eeeee']
+        encoder = LengthQueryEncoder()
+        embeddings = encoder.encode_batch(queries, batch_size=2)
+        np.testing.assert_array_equal(embeddings, [[len(query), 1] for query in queries])
+        # Mini-batches are formed from queries sorted by length.
+        self.assertEqual(encoder.batches, [['a', 'bb'], ['ccc', 'dddd'], ['eeeee']])
+
+        # Encoders without a model encode one query at a time.
+        encoder.has_model = False
+        encoder.batches = []
+        self.assertEqual(len(encoder.encode_batch(queries)), len(queries))
+        self.assertEqual(encoder.batches, [[query] for query in queries])
+
+    def test_numpy_representation_writer(self):
+        vectors = np.random.default_rng(0).standard_normal((25, 8)).astype(np.float32)
+        docids = [f'doc{i}' for i in range(len(vectors))]
+
+        for dtype in ['float32', 'float16']:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                writer = NumpyRepresentationWriter(tmp_dir, dtype=dtype, shard_size=10)
+                with writer:
+                    for start in range(0, len(vectors), 7):
+                        writer.write({'id': docids[start:start + 7], 'vector': vectors[start:start + 7]})
+
+                shard_files = sorted(f for f in os.listdir(tmp_dir) if f.startswith('embeddings-'))
+                self.assertEqual(shard_files, ['embeddings-00000.npy', 'embeddings-00001.npy', 'embeddings-00002.npy'])
+                shards = [np.load(os.path.join(tmp_dir, f), mmap_mode='r') for f in shard_files]
+                self.assertEqual([shard.shape for shard in shards], [(10, 8), (10, 8), (5, 8)])
+                self.assertEqual(shards[0].dtype, np.dtype(dtype))
+                np.testing.assert_array_equal(np.concatenate(shards), vectors.astype(dtype))
+                self.assertEqual(list(DocidTable(os.path.join(tmp_dir, 'docid'))), docids)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,123 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyserini.eval.evaluator import TrecEvaluator, evaluate_trec_eval_args, load_qrels
+
+QRELS = '''1 0 d1 2
+1 0 d2 0
+1 0 d3 1
+1 0 d7 1
+2 0 d2 1
+2 0 d4 -1
+2 0 d5 0
+3 0 d9 1
+'''
+
+# Ties on the scores of topic 1 are broken by docid in reverse order; topic 4 has no qrels.
+RUN = '''1 Q0 d3 1 9.5 test
+1 Q0 d4 2 8.0 test
+1 Q0 d2 3 8.0 test
+1 Q0 d1 4 7.25 test
+1 Q0 d8 5 1.0 test
+2 Q0 d4 1 3.0 test
+2 Q0 d6 2 2.0 test
+2 Q0 d2 3 1.0 test
+4 Q0 d1 1 5.0 test
+'''
+
+
+class TestTrecEvaluator(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.qrels_path = os.path.join(self.tmp_dir, 'qrels.txt')
+        self.run_path = os.path.join(self.tmp_dir, 'run.txt')
+        with open(self.qrels_path, 'w') as f:
+            f.write(QRELS)
+        with open(self.run_path, 'w') as f:
+            f.write(RUN)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_evaluate(self):
+        # Expected values are those of trec_eval -c -m map -m ndcg_cut.3,10 ...
+        evaluator = TrecEvaluator(self.qrels_path)
+        results = evaluator.evaluate(self.run_path, ['map', 'ndcg_cut.3,10', 'recall.2', 'recip_rank', 'P.2',
+                                                     'num_rel_ret', 'judged.2'], complete=True)
+        expected = {'num_rel_ret': 3, 'map': 0.2778, 'recip_rank': 0.4444, 'P_2': 0.1667, 'recall_2': 0.1111,
+                    'ndcg_cut_3': 0.2731, 'ndcg_cut_10': 0.3648, 'judged_2': 0.4}
+        self.assertEqual(list(results), list(expected))
+        for name, value in expected.items():
+            self.assertAlmostEqual(results[name], value, places=4)
+
+        results = evaluator.evaluate(self.run_path, ['map', 'ndcg_cut.3'], relevance_level=2, max_hits=2,
+                                     per_query=True)
+        self.assertEqual(results['map'], {'1': 0.0, '2': 0.0, 'all': 0.0})
+        self.assertAlmostEqual(results['ndcg_cut_3']['1'], 0.3194, places=4)
+        self.assertAlmostEqual(results['ndcg_cut_3']['all'], 0.1597, places=4)
+
+        results = evaluator.evaluate(self.run_path, ['map', 'judged.2'], remove_unjudged=True)
+        self.assertAlmostEqual(results['map'], 0.5278, places=4)
+        self.assertEqual(results['judged_2'], 1.0)
+
+    def test_msmarco_run(self):
+        msmarco_run_path = os.path.join(self.tmp_dir, 'run.msmarco.txt')
+        with open(msmarco_run_path, 'w') as f:
+            f.write('1\td3\t1\n1\td2\t2\n1\td1\t3\n2\td2\t1\n')
+        trec_run_path = os.path.join(self.tmp_dir, 'run.trec.txt')
+        with open(trec_run_path, 'w') as f:
+            f.write(f'1 Q0 d3 1 1.0 test\n1 Q0 d2 2 {1 / 2} test\n1 Q0 d1 3 {1 / 3} test\n2 Q0 d2 1 1.0 test\n')
+
+        evaluator = TrecEvaluator(self.qrels_path)
+        measures = ['map', 'ndcg_cut.10', 'recall.1000']
+        self.assertEqual(evaluator.evaluate(msmarco_run_path, measures), evaluator.evaluate(trec_run_path, measures))
+
+    def test_trec_eval_args(self):
+        lines, judged_lines = evaluate_trec_eval_args(['-q', '-M', '2', '-l', '2', '-m', 'map', '-m', 'ndcg_cut.3',
+                                                       '-m', 'judged.1', self.qrels_path, self.run_path])
+        self.assertEqual(lines, ['map                   \t1\t0.0000',
+                                 'ndcg_cut_3            \t1\t0.3194',
+                                 'map                   \t2\t0.0000',
+                                 'ndcg_cut_3            \t2\t0.0000',
+                                 'map                   \tall\t0.0000',
+                                 'ndcg_cut_3            \tall\t0.1597'])
+        self.assertEqual(judged_lines, ['judged_1              \tall\t0.6667'])
+
+        # Left to trec_eval: unsupported measures and options, its default measures, and runs it rejects.
+        self.assertIsNone(evaluate_trec_eval_args(['-m', 'bpref', self.qrels_path, self.run_path]))
+        self.assertIsNone(evaluate_trec_eval_args(['-J', '-m', 'map', self.qrels_path, self.run_path]))
+        self.assertIsNone(evaluate_trec_eval_args(['-c', self.qrels_path, self.run_path]))
+        with open(self.run_path, 'a') as f:
+            f.write('2 Q0 d6 4 0.5 test\n')
+        self.assertIsNone(evaluate_trec_eval_args(['-m', 'map', self.qrels_path, self.run_path]))
+
+    def test_qrels_cache(self):
+        qrels = load_qrels(self.qrels_path)
+        self.assertIs(load_qrels(self.qrels_path), qrels)
+
+        # Qrels are reloaded when they change.
+        with open(self.qrels_path, 'a') as f:
+            f.write('3 0 d8 1\n')
+        self.assertEqual(len(load_qrels(self.qrels_path)), len(qrels) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import scipy
+
+from pyserini import pyclass
+from pyserini.encode import QueryEncoder
+from pyserini.index.lucene import IdfTable, LuceneIndexReader
+from pyserini.search.lucene import LuceneImpactSearcher
+from pyserini.search.lucene._impact_searcher import SlimSearcher, maxsim
+
+
+class TermCountQueryEncoder(QueryEncoder):
+    """Weights each whitespace-separated term by its count in the query; records the size of each batch."""
+
+    def __init__(self):
+        super().__init__()
+        self.has_model = True
+        self.batches = []
+
+    def encode(self, query: str):
+        return self._encode_batch([query])[0]
+
+    def _encode_batch(self, queries):
+        self.batches.append(len(queries))
+        encoded = []
+        for query in queries:
+            weights = {}
+            for term in query.split():
+                weights[term] = weights.get(term, 0) + 10
+            encoded.append(weights)
+        return encoded
+
+
+class TestImpactSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.index_dir = os.path.join(cls.tmp_dir, 'index')
+        corpus_dir = os.path.join(cls.tmp_dir, 'corpus')
+        os.makedirs(corpus_dir)
+
+        rng = random.Random(42)
+        terms = [f't{i}' for i in range(100)]
+        with open(os.path.join(corpus_dir, 'docs.jsonl'), 'w') as f:
+            for i in range(500):
+                vector = {term: rng.randint(1, 50) for term in rng.sample(terms, 10)}
+                f.write(json.dumps({'id': f'doc{i}', 'contents': '', 'vector': vector}) + '\n')
+        os.system(f'python -m pyserini.index.lucene -collection JsonVectorCollection -input {corpus_dir} '
+                  f'-index {cls.index_dir} -generator DefaultLuceneDocumentGenerator -threads 1 '
+                  f'-impact -pretokenized')
+
+        # Include terms that are not in the index.
+        cls.queries = [' '.join(rng.choices(terms + ['unseen'], k=rng.randint(1, 5))) for _ in range(50)]
+        cls.qids = [f'q{i}' for i in range(len(cls.queries))]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_batch_search(self):
+        encoder = TermCountQueryEncoder()
+        searcher = LuceneImpactSearcher(self.index_dir, encoder)
+        expected = {qid: [(hit.docid, hit.score) for hit in searcher.search(query, 10)]
+                    for qid, query in zip(self.qids, self.queries)}
+
+        for encode_batch_size in [None, 8]:
+            encoder.batches = []
+            with patch.object(pyclass, 'detach', wraps=pyclass.detach) as detach:
+                results = searcher.batch_search(self.queries, self.qids, k=10, threads=2,
+                                                encode_batch_size=encode_batch_size)
+            # Batches searched on the overlap thread detach it from the JVM afterwards.
+            self.assertEqual(detach.call_count, 0 if encode_batch_size is None else len(encoder.batches))
+            self.assertEqual({qid: [(hit.docid, hit.score) for hit in hits] for qid, hits in results.items()},
+                             expected)
+            # Queries are encoded in mini-batches, not one at a time.
+            self.assertEqual(sum(encoder.batches), len(self.queries))
+            self.assertLess(len(encoder.batches), len(self.queries))
+
+    def test_idf_table(self):
+        index_reader = LuceneIndexReader(self.index_dir)
+        documents = index_reader.stats()['documents']
+        dfs = {term.term: term.df for term in index_reader.terms()}
+        expected = {term: np.log(documents / df) for term, df in dfs.items()}
+
+        searcher = LuceneImpactSearcher(self.index_dir, TermCountQueryEncoder())
+        self.assertTrue(os.path.exists(os.path.join(self.index_dir, 'idf.terms.npy')))
+        table = IdfTable.from_index(self.index_dir)
+        self.assertIsInstance(table.data, np.memmap)
+        self.assertEqual(len(table), len(expected))
+        for idf_table in [searcher.idf, table]:
+            for term, idf in expected.items():
+                self.assertIn(term, idf_table)
+                self.assertAlmostEqual(idf_table[term], idf, places=12)
+        self.assertEqual(dict(zip(table.terms(), table.dfs.tolist())), dfs)
+        self.assertEqual(table.terms(), sorted(expected))
+        self.assertNotIn('unseen', table)
+        self.assertNotIn('t1' * 100, table)
+        # Prefixes and extensions of terms, and terms before the first and after the last.
+        self.assertEqual(table.positions(['t', 't10', 't100', 't10a', '', 'a', 'z', 't99']).tolist(),
+                         [-1, table.positions(['t10'])[0], -1, -1, -1, -1, -1, len(table) - 1])
+
+        min_idf = float(np.median(list(expected.values())))
+        encoded_queries = [{'t1': 10, 'unseen': 20, 't2': 30}, {}, {term: 1 for term in expected}]
+        self.assertEqual(table.filter(encoded_queries, min_idf),
+                         [{term: weight for term, weight in encoded_query.items()
+                           if term in expected and expected[term] > min_idf} for encoded_query in encoded_queries])
+
+    def test_idf_table_of_index_rebuilt_in_place(self):
+        index_dir = os.path.join(self.tmp_dir, 'rebuilt')
+        corpus_dir = os.path.join(self.tmp_dir, 'rebuilt-corpus')
+        os.makedirs(corpus_dir)
+        for vocabulary in [['a', 'b', 'c'], ['x', 'y' * 255, 'z']]:
+            # Same number of documents in both builds.
+            with open(os.path.join(corpus_dir, 'docs.jsonl'), 'w') as f:
+                for i in range(10):
+                    vector = {vocabulary[i % 3]: 1, vocabulary[(i + 1) % 3]: 2}
+                    f.write(json.dumps({'id': f'doc{i}', 'contents': '', 'vector': vector}) + '\n')
+            os.system(f'python -m pyserini.index.lucene -collection JsonVectorCollection -input {corpus_dir} '
+                      f'-index {index_dir} -generator DefaultLuceneDocumentGenerator -threads 1 '
+                      f'-impact -pretokenized')
+            self.assertEqual(IdfTable.from_index(index_dir).terms(), vocabulary)
+            self.assertEqual(IdfTable.from_index(index_dir).positions(vocabulary).tolist(), [0, 1, 2])
+
+        # Terms are stored without padding to the longest one.
+        self.assertEqual(len(IdfTable.from_index(index_dir).data), 1 + 255 + 1)
+
+    def test_maxsim(self):
+        rng = np.random.default_rng(0)
+        lengths = np.array([3, 0, 5, 1, 7, 2])
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        corpus = scipy.sparse.random(int(lengths.sum()), 50, density=0.2, format='csr', dtype=np.float32, random_state=0)
+        q_embed = scipy.sparse.random(4, 50, density=0.3, format='csr', dtype=np.float32, random_state=1)
+
+        similarities = q_embed.toarray() @ corpus.toarray().T
+        expected = [similarities[:, start:end].max(axis=1).sum() if end > start else 0 for start, end in zip(starts, ends)]
+        order = rng.permutation(len(lengths))
+        for max_block_size in [None, 1, 20]:
+            scores = maxsim(q_embed, corpus, starts[order], ends[order], max_block_size)
+            np.testing.assert_allclose(scores, np.array(expected)[order], rtol=1e-6)
+
+    def test_slim_fast_rerank(self):
+        class Hit:
+            """Stand-in for a Java hit, whose fields may only be read on the calling thread."""
+
+            def __init__(self, docid):
+                self._docid = docid
+
+            @property
+            def docid(self):
+                assert threading.current_thread() is threading.main_thread()
+                return self._docid
+
+        lengths = np.array([3, 0, 5, 1, 7, 2])
+        ends = np.cumsum(lengths)
+        searcher = SlimSearcher.__new__(SlimSearcher)
+        searcher.sparse_vecs = scipy.sparse.random(int(lengths.sum()), 50, density=0.2, format='csr', dtype=np.float32,
+                                                   random_state=0)
+        searcher.sparse_ranges = np.stack([ends - lengths, ends], axis=1)
+        searcher.maxsim_block_size = None
+        q_embeds = {f'q{i}': scipy.sparse.random(4, 50, density=0.3, format='csr', dtype=np.float32, random_state=i)
+                    for i in range(3)}
+        results = {qid: [Hit(str(row)) for row in range(len(lengths))] for qid in q_embeds}
+
+        reranked = searcher.fast_rerank(q_embeds, results, 4, threads=2)
+        for qid, q_embed in q_embeds.items():
+            similarities = q_embed.toarray() @ searcher.sparse_vecs.toarray().T
+            expected = [similarities[:, start:end].max(axis=1).sum() if end > start else 0
+                        for start, end in searcher.sparse_ranges]
+            self.assertEqual([hit.docid for hit in reranked[qid]],
+                             [str(row) for row in np.argsort(-np.array(expected), kind='stable')[:4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,7 @@ from typing import List
 
 from pyserini.analysis import JWhiteSpaceAnalyzer
 from pyserini.index.lucene import LuceneIndexer, LuceneIndexReader, JacksonObjectMapper
-from pyserini.search.lucene import JScoredDoc, LuceneSearcher
+from pyserini.search.lucene import JScoredDoc, LuceneSearcher, LuceneSimilarities
 
 
 class TestIndexOTF(unittest.TestCase):
@@ -304,6 +304,33 @@ class TestIndexOTF(unittest.TestCase):
         self.assertIsNotNone(reader.doc('doc0'))
         self.assertIsNotNone(reader.doc('doc1'))
 
+    def test_search_with_similarity(self):
+        # Repeated documents make for score ties, which must be broken as in search().
+        words = ['information', 'retrieval', 'semantic', 'networks', 'systems', 'language']
+        docs = [{'id': f'doc{i}', 'contents': ' '.join(words[j % len(words)] for j in range(i % 7, i % 7 + i % 5 + 1))}
+                for i in range(40)]
+        indexer = LuceneIndexer(self.tmp_dir)
+        indexer.add_batch_dict(docs)
+        indexer.close()
+
+        searcher = LuceneSearcher(self.tmp_dir)
+        bm25_searcher = LuceneSearcher(self.tmp_dir)
+        self.assertTrue(searcher.supports_search_with_similarity())
+        for k1, b in [(0.9, 0.4), (1.2, 0.75), (0.5, 0.0)]:
+            bm25_searcher.set_bm25(k1, b)
+            for query in ['information retrieval', 'semantic networks systems', 'language']:
+                hits = searcher.search_with_similarity(query, LuceneSimilarities.bm25(k1, b), k=20)
+                expected = bm25_searcher.search(query, k=20)
+                self.assertTrue(isinstance(hits[0], JScoredDoc))
+                self.assertEqual([hit.docid for hit in expected], [hit.docid for hit in hits])
+                self.assertEqual([hit.score for hit in expected], [hit.score for hit in hits])
+
+        # The searcher's own scoring is left alone.
+        default_hits = searcher.search('information retrieval', k=20)
+        bm25_searcher.set_bm25(0.9, 0.4)
+        self.assertEqual([(hit.docid, hit.score) for hit in bm25_searcher.search('information retrieval', k=20)],
+                         [(hit.docid, hit.score) for hit in default_hits])
+
     def tearDown(self):
         shutil.rmtree(self.tmp_dir)
 
@@ -132,6 +132,18 @@ class TestIndexUtils(unittest.TestCase):
         self.assertAlmostEqual(result[0, 190], 1.7513844966888428, places=8)
         self.assertAlmostEqual(result[1, 391], 0.03765463829040527, places=8)
 
+    def test_bm25_vectorizer_term_weights(self):
+        vectorizer = BM25Vectorizer(self.index_path, min_df=5)
+        docids = ['CACM-0239', 'CACM-0440', 'CACM-3168', 'CACM-9999']
+        result = vectorizer.get_vectors(docids, norm=None)
+        self.assertEqual(result[3].nnz, 0)
+        for row, docid in enumerate(docids[:3]):
+            expected = {vectorizer.term_to_index[term]: self.index_reader.compute_bm25_term_weight(docid, term,
+                                                                                                   analyzer=None)
+                        for term in self.index_reader.get_document_vector(docid) if term in vectorizer.term_to_index}
+            vector = result[row]
+            self.assertEqual(dict(zip(vector.indices.tolist(), vector.data.tolist())), expected)
+
     def test_vectorizer_query(self):
         vectorizer = BM25Vectorizer(self.index_path, min_df=5)
         result = vectorizer.get_query_vector('this is a query to test query vector')
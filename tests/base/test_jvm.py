@@ -180,5 +180,23 @@ class TestJvmStartupIntegration(unittest.TestCase):
         self.assertIn('started', result.stdout)
 
 
+class TestThreadMap(unittest.TestCase):
+    def test_thread_map_keeps_order_and_detaches_workers(self):
+        pyclass = importlib.import_module('pyserini.pyclass')
+        JInteger = pyclass.autoclass('java.lang.Integer')
+        numbers = [str(i * 7) for i in range(10)]
+        with patch.object(pyclass, 'detach', wraps=pyclass.detach) as detach:
+            values = pyclass.thread_map(JInteger.parseInt, numbers, threads=4)
+        self.assertEqual(values, [int(number) for number in numbers])
+        # One detach per worker thread, each after its chunk of items.
+        self.assertEqual(detach.call_count, 4)
+
+        with patch.object(pyclass, 'detach') as detach:
+            self.assertEqual(pyclass.thread_map(int, numbers, threads=1), [int(number) for number in numbers])
+            self.assertEqual(pyclass.thread_map(int, [], threads=4), [])
+        # Work run on the calling thread never detaches it.
+        detach.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -15,9 +15,15 @@
 #
 
 import glob
+import json
 import os
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
+
+from pyserini.pyclass import autoclass
 from pyserini.search import get_topics
 from pyserini.search.lucene import LuceneHnswDenseSearcher, LuceneFlatDenseSearcher
 from pyserini.util import get_cache_home
@@ -211,5 +217,46 @@ class TestLuceneDenseSearch(unittest.TestCase):
         self.assertAlmostEqual(hits[4].score, 0.876068, places=5)
 
 
+class TestLuceneHnswDenseSearcherEfSearch(unittest.TestCase):
+    """Per-search ``ef_search`` reaches into ``HnswDenseSearcher`` internals, so it is checked against the bundled jar
+    on a small index of random vectors; queries are vectors, so no encoder is needed."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        corpus_dir = os.path.join(cls.tmp_dir, 'corpus')
+        cls.index_dir = os.path.join(cls.tmp_dir, 'index')
+        os.makedirs(corpus_dir)
+
+        vectors = np.random.default_rng(42).normal(size=(200, 8)).astype(np.float32)
+        with open(os.path.join(corpus_dir, 'docs.jsonl'), 'w') as f:
+            for i, vector in enumerate(vectors):
+                f.write(json.dumps({'docid': f'doc{i}', 'vector': vector.tolist()}) + '\n')
+        autoclass('io.anserini.index.IndexHnswDenseVectors').main([
+            '-collection', 'JsonDenseVectorCollection', '-input', corpus_dir, '-index', cls.index_dir,
+            '-generator', 'DenseVectorDocumentGenerator', '-threads', '1', '-M', '8', '-efC', '100'])
+        cls.queries = [json.dumps(vector.tolist()) for vector in vectors[:5]]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_per_search_ef_search(self):
+        searcher = LuceneHnswDenseSearcher(self.index_dir, ef_search=3)
+        wide_searcher = LuceneHnswDenseSearcher(self.index_dir, ef_search=50)
+        try:
+            for query in self.queries:
+                # An HNSW search returns at most ef_search hits.
+                self.assertEqual(len(searcher.search(query, 10)), 3)
+                self.assertEqual(len(searcher.search(query, 10, ef_search=3)), 3)
+                hits = searcher.search(query, 10, ef_search=50)
+                self.assertEqual([(hit.docid, hit.score) for hit in hits],
+                                 [(hit.docid, hit.score) for hit in wide_searcher.search(query, 10)])
+                self.assertEqual(len(hits), 10)
+        finally:
+            searcher.close()
+            wide_searcher.close()
+
+
 if __name__ == '__main__':
     unittest.main()
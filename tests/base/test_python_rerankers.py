@@ -1,3 +1,4 @@
+import json
 import os
 import shutil
 import tarfile
@@ -5,7 +6,10 @@ import unittest
 from random import randint
 from urllib.request import urlretrieve
 
+from pyserini.index.lucene import index_fingerprint
 from pyserini.search.lucene import LuceneSearcher
+from pyserini.search.lucene.reranker import (ClassifierType, PseudoRelevanceClassifierReranker,
+                                             PseudoRelevanceClassifierRerankerPool)
 
 
 class TestPythonRerankers(unittest.TestCase):
@@ -137,6 +141,46 @@ class TestPythonRerankers(unittest.TestCase):
         with self.assertRaises(TypeError):
             self.no_vec_searcher.set_rocchio(use_python=True)
 
+    def test_batch_search_matches_search(self):
+        queries = ['information retrieval', 'compiler optimization', 'parallel sorting algorithms']
+        qids = ['q1', 'q2', 'q3']
+
+        for configure in [lambda: self.searcher.set_rm3(fb_docs=4, fb_terms=6, use_python=True),
+                          lambda: self.searcher.set_rocchio(bottom_fb_docs=3, gamma=0.1, use_python=True)]:
+            configure()
+            results = self.searcher.batch_search(queries, qids, k=20, threads=4)
+            self.assertEqual(set(results.keys()), set(qids))
+
+            for query, qid in zip(queries, qids):
+                hits = self.searcher.search(query, k=20)
+                self.assertEqual([hit.docid for hit in results[qid]], [hit.docid for hit in hits])
+                for batch_hit, hit in zip(results[qid], hits):
+                    self.assertAlmostEqual(batch_hit.score, hit.score, places=5)
+
+            self.searcher.unset_rm3()
+            self.searcher.unset_rocchio()
+
+    def test_prcl_pool_matches_rerank(self):
+        index_dir = f'{self.searcher_index_dir}lucene9-index.cacm'
+        topics = []
+        for query in ['information retrieval', 'compiler optimization', 'parallel sorting algorithms']:
+            hits = self.searcher.search(query, k=50)
+            topics.append(([hit.docid for hit in hits], [hit.score for hit in hits]))
+
+        for vectorizer in ['TfidfVectorizer', 'BM25Vectorizer']:
+            clf_type = [ClassifierType.LR, ClassifierType.SVM]
+            ranker = PseudoRelevanceClassifierReranker(index_dir, vectorizer, clf_type, r=5, n=20)
+            # A sidecar left over from another build of the index is replaced before the workers start.
+            with open(os.path.join(index_dir, 'idf.json'), 'w') as f:
+                json.dump({'fingerprint': {'documents': 3204}, 'terms': 0}, f)
+            with PseudoRelevanceClassifierRerankerPool(index_dir, vectorizer, clf_type, r=5, n=20,
+                                                       processes=2) as pool:
+                with open(os.path.join(index_dir, 'idf.json')) as f:
+                    self.assertEqual(json.load(f)['fingerprint'], index_fingerprint(index_dir))
+                futures = [pool.submit(docids, scores) for docids, scores in topics]
+                for (docids, scores), future in zip(topics, futures):
+                    self.assertEqual(future.result(), ranker.rerank(docids, scores))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,115 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from pyserini.encode import AutoQueryEncoder, QueryEmbeddingCache, QueryEncoder, query_encoder_identity
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    def test_lru(self):
+        cache = QueryEmbeddingCache(max_size=2)
+        calls = []
+
+        def encode(query):
+            calls.append(query)
+            return np.full(4, len(query), dtype=np.float32)
+
+        cache.get_or_encode('enc', 'a query', encode)
+        cache.get_or_encode('enc', '  a   query ', encode)
+        cache.get_or_encode('other-enc', 'a query', encode)
+        self.assertEqual(calls, ['a query', 'a query'])
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 2, 'max_size': 2})
+
+        # Touch ('enc', 'a query') so that ('other-enc', 'a query') is evicted next.
+        cache.get('enc', 'a query')
+        cache.get_or_encode('enc', 'b', encode)
+        self.assertIsNone(cache.get('other-enc', 'a query'))
+        self.assertIsNotNone(cache.get('enc', 'a query'))
+
+    def test_batch(self):
+        cache = QueryEmbeddingCache()
+        batches = []
+
+        def encode_batch(queries):
+            batches.append(list(queries))
+            return np.stack([np.full(4, len(query), dtype=np.float32) for query in queries])
+
+        cache.get_or_encode_batch('enc', ['x', 'yy'], encode_batch)
+        values = cache.get_or_encode_batch('enc', ['yy', 'zzz', 'x'], encode_batch)
+        self.assertEqual(batches, [['x', 'yy'], ['zzz']])
+        self.assertEqual([value[0] for value in values], [2, 3, 1])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = QueryEmbeddingCache(path=tmp_dir)
+            cache.put('dense', 'q1', np.arange(4, dtype=np.float32))
+            cache.put('dense', 'q2', np.arange(8, dtype=np.float32).reshape(1, 8))
+            cache.put('sparse', 'q1', {'term': np.float32(1.5), 'other': 2})
+            cache.save()
+
+            loaded = QueryEmbeddingCache(path=tmp_dir)
+            self.assertEqual(len(loaded), 3)
+            np.testing.assert_array_equal(loaded.get('dense', 'q1'), np.arange(4))
+            self.assertEqual(loaded.get('dense', 'q2').shape, (1, 8))
+            self.assertIsInstance(loaded.get('dense', 'q2'), np.memmap)
+            self.assertEqual(loaded.get('sparse', 'q1'), {'term': 1.5, 'other': 2})
+
+            # Saving over the files that back the loaded entries must not corrupt them.
+            loaded.put('dense', 'q3', np.ones(4, dtype=np.float32))
+            loaded.save()
+            np.testing.assert_array_equal(loaded.get('dense', 'q1'), np.arange(4))
+            self.assertEqual(len(QueryEmbeddingCache(path=tmp_dir)), 4)
+
+    def test_query_encoder_identity(self):
+        def auto_query_encoder(**settings):
+            # Stand-in for an AutoQueryEncoder on a loaded checkpoint, without downloading one.
+            encoder = AutoQueryEncoder.__new__(AutoQueryEncoder)
+            encoder.model = SimpleNamespace(name_or_path='org/model')
+            encoder.tokenizer = SimpleNamespace(name_or_path='org/model', model_max_length=512)
+            encoder.pooling, encoder.l2_norm, encoder.prefix = 'cls', False, None
+            for key, value in settings.items():
+                setattr(encoder, key, value)
+            return encoder
+
+        identities = [query_encoder_identity(auto_query_encoder(**settings)) for settings in
+                      [{}, {'pooling': 'mean'}, {'l2_norm': True}, {'prefix': 'query:'},
+                       {'tokenizer': SimpleNamespace(name_or_path='org/model', model_max_length=128)}]]
+        self.assertEqual(len(set(identities)), len(identities))
+        self.assertEqual(identities[0], query_encoder_identity(auto_query_encoder()))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            encoders = []
+            for name in ['a', 'b']:
+                os.mkdir(os.path.join(tmp_dir, name))
+                pd.DataFrame({'text': ['q'], 'embedding': [np.ones(4)]}).to_pickle(
+                    os.path.join(tmp_dir, name, 'embedding.pkl'))
+                encoders.append(QueryEncoder(encoded_queries_dir=os.path.join(tmp_dir, name)))
+            self.assertNotEqual(query_encoder_identity(encoders[0]), query_encoder_identity(encoders[1]))
+            self.assertEqual(query_encoder_identity(encoders[0]),
+                             query_encoder_identity(QueryEncoder(encoded_queries_dir=os.path.join(tmp_dir, 'a'))))
+
+        self.assertEqual(query_encoder_identity('enc'), 'enc')
+
+
+if __name__ == '__main__':
+    unittest.main()
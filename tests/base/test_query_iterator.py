@@ -1,7 +1,9 @@
 import os
 import unittest
 import tempfile
+from pyserini.output_writer import ArrayHit, OutputFormat, RunCheckpoint, get_output_writer
 from pyserini.query_iterator import MBEIRQueryIterator, DefaultQueryIterator, KiltQueryIterator, MultimodalQueryIterator
+from pyserini.search.merge_runs import merge_runs
 
 class TestQueryIterators(unittest.TestCase):
     def test_mbeir_query_iterator(self):
@@ -153,3 +155,66 @@ class TestQueryIterators(unittest.TestCase):
             topics["2"] = {"path": "missing.txt"}
             with self.assertRaises(FileNotFoundError):
                 iterator.get_query("2")
+
+    def test_shard_and_skip(self):
+        topics = {i: {"title": f"query {i}"} for i in range(10)}
+        shards = [[id_ for id_, _ in DefaultQueryIterator(topics).shard(shard_id, 3)] for shard_id in range(3)]
+        self.assertEqual(shards, [[0, 1, 2], [3, 4, 5], [6, 7, 8, 9]])
+
+        iterator = DefaultQueryIterator(topics).shard(2, 3).skip(["6", 8])
+        self.assertEqual(len(iterator), 2)
+        self.assertEqual(list(iterator), [(7, "query 7"), (9, "query 9")])
+
+        with self.assertRaises(ValueError):
+            DefaultQueryIterator(topics).shard(3, 3)
+
+    def test_checkpoint_and_merge_runs(self):
+        topics = {f"q{i}": {"title": f"query {i}"} for i in range(10)}
+        order = DefaultQueryIterator(topics).order
+
+        def write_run(path, iterator, checkpoint=None, mode='w'):
+            with get_output_writer(path, OutputFormat.TREC, mode, tag='test') as writer:
+                for topic, _ in iterator:
+                    writer.write(topic, [ArrayHit(f'{topic}-d{rank}', 1.0 / rank) for rank in range(1, 4)])
+                    if checkpoint is not None:
+                        checkpoint.record(writer, [topic])
+                if checkpoint is not None:
+                    checkpoint.flush(writer)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            expected_path = os.path.join(temp_dir, 'run.txt')
+            write_run(expected_path, DefaultQueryIterator(topics))
+            with open(expected_path) as f:
+                expected = f.read()
+
+            # Resume from a checkpoint of the first 4 topics, followed by a partial entry; the results written after
+            # the checkpoint are dropped.
+            path = os.path.join(temp_dir, 'run.resumed.txt')
+            checkpoint = RunCheckpoint(path, interval=2)
+            checkpoint.start()
+            write_run(path, DefaultQueryIterator(topics), checkpoint)
+            with open(checkpoint.path) as f:
+                entries = f.readlines()
+            self.assertEqual(len(entries), 5)
+            with open(checkpoint.path, 'w') as f:
+                f.write(''.join(entries[:2]) + entries[2][:10])
+
+            finished = RunCheckpoint(path, interval=2).resume()
+            self.assertEqual(finished, {'q0', 'q1', 'q2', 'q3'})
+            with open(path) as f:
+                self.assertEqual(f.read(), ''.join(expected.splitlines(keepends=True)[:12]))
+            write_run(path, DefaultQueryIterator(topics).skip(finished), RunCheckpoint(path, interval=2), 'a')
+            with open(path) as f:
+                self.assertEqual(f.read(), expected)
+
+            shard_paths = []
+            for shard_id in range(3):
+                shard_paths.append(os.path.join(temp_dir, f'run.shard{shard_id}.txt'))
+                write_run(shard_paths[-1], DefaultQueryIterator(topics).shard(shard_id, 3))
+            merged_path = os.path.join(temp_dir, 'run.merged.txt')
+            self.assertEqual(merge_runs(shard_paths[::-1], merged_path, order), len(topics))
+            with open(merged_path) as f:
+                self.assertEqual(f.read(), expected)
+
+            with self.assertRaises(ValueError):
+                merge_runs([shard_paths[0], shard_paths[0]], merged_path, order)
@@ -16,9 +16,13 @@
 
 import filecmp
 import os
+import random
 import subprocess
 import unittest
 
+import pandas as pd
+
+from pyserini.fusion import average, normalize, reciprocal_rank_fusion
 from pyserini.trectools import TrecRun, Qrels, RescoreMethod
 
 
@@ -78,6 +82,54 @@ class TestTrecTools(unittest.TestCase):
         self.assertTrue(filecmp.cmp(os.path.join(self.root, 'tests/resources/simple_trec_run_normalize_verify.txt'),
                                     self.output_path))
 
+    def test_merge(self):
+        rng = random.Random(42)
+        runs = []
+        for r, topics in enumerate([range(1, 40), range(1, 40, 2), range(20, 60)]):
+            with open(self.output_path, 'w') as f:
+                for topic in topics:
+                    for rank, docid in enumerate(rng.sample(range(200), 50), start=1):
+                        score = rng.choice([1.0, 0.5, rng.uniform(-5, 30)])
+                        f.write('\t'.join([str(topic), 'Q0', f'doc{docid}', str(rank), str(score), f'run{r}']) + '\n')
+            runs.append(TrecRun(self.output_path))
+        originals = [run.run_data.copy() for run in runs]
+
+        def expected_merge(scores, depth, k):
+            # Reference: aggregate with pandas, like merge did before aggregating over codes.
+            dfs = []
+            for run, run_scores in zip(runs, scores):
+                df = run.run_data[['topic', 'docid']].astype({'topic': int, 'docid': str}).assign(score=run_scores)
+                dfs.append(df.groupby('topic', sort=False).head(depth))
+            merged = pd.concat(dfs).groupby(['topic', 'docid'], as_index=False, sort=False)['score'].sum()
+            merged = merged.sort_values(['topic', 'score', 'docid'], ascending=[True, False, True])
+            merged = merged.groupby('topic', sort=False).head(k)
+            return list(merged.itertuples(index=False, name=None))
+
+        for fusion, method, kwargs in [(reciprocal_rank_fusion, RescoreMethod.RRF, {'rrf_k': 60}),
+                                       (average, RescoreMethod.SCALE, {'scale': 1 / 3}),
+                                       (normalize, RescoreMethod.NORMALIZE, {})]:
+            scores = [run.get_rescored_scores(method, **kwargs) for run in runs]
+            for depth, k, threads in [(None, None, 1), (20, 10, 1), (20, 10, 3), (1000, 1000, 8)]:
+                fused = fusion(runs, depth=depth, k=k, threads=threads)
+                expected = expected_merge(scores, depth or 1000, k or 1000)
+                self.assertEqual(list(zip(fused.run_data['topic'].astype(int), fused.run_data['docid'].astype(str),
+                                          fused.run_data['score'])), expected)
+                ranks = pd.Series(range(len(expected))).groupby([topic for topic, _, _ in expected]).cumcount() + 1
+                self.assertEqual(fused.run_data['rank'].tolist(), ranks.tolist())
+
+                # Runs are written exactly like DataFrame.to_csv would, and read back unchanged.
+                fused.save_to_txt(self.output_path, tag='fused')
+                with open(self.output_path) as f:
+                    self.assertEqual(f.read(), fused.run_data.to_csv(sep=' ', header=False, index=False))
+                self.assertEqual(TrecRun(self.output_path).run_data['score'].tolist(), fused.run_data['score'].tolist())
+
+        # Fusion leaves the runs unchanged.
+        for run, original in zip(runs, originals):
+            pd.testing.assert_frame_equal(run.run_data, original)
+
+        with self.assertRaises(NotImplementedError):
+            TrecRun.merge(runs, 'max')
+
     # This and the next test case go together - to keep and to remove unjudged docs.
     def test_unjudged_keep(self):
         qrels_path = os.path.join(self.root, 'tools/topics-and-qrels/qrels.covid-round1.txt')
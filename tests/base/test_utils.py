@@ -14,17 +14,24 @@
 # limitations under the License.
 #
 
+import hashlib
+import http.server
 import os
+import re
 import shutil
 import tarfile
 import tempfile
+import threading
 import unittest
+from functools import partial
 from unittest.mock import patch
+from urllib.error import HTTPError
 
 from pyserini.prebuilt_index_info import TF_INDEX_INFO
 from pyserini.util import (
     compare_trec_files_with_tolerance,
     compare_trec_strings_with_tolerance,
+    compute_md5,
     download_and_unpack_archive,
     download_url,
     get_cache_home,
@@ -91,32 +98,185 @@ class TestIterateCollection(unittest.TestCase):
             with open(os.path.join(payload_dir, 'marker.txt'), 'w') as f:
                 f.write('ok')
 
-            source_tar = os.path.join(directory, 'plain-index.tar')
+            served_dir = os.path.join(directory, 'served')
+            os.makedirs(served_dir)
+            source_tar = os.path.join(served_dir, 'plain-index.tar')
             with tarfile.open(source_tar, 'w') as tar:
                 tar.add(payload_dir, arcname='plain-index')
 
             cache_dir = os.path.join(directory, 'cache')
 
-            def fake_download_url(url, save_dir, local_filename=None, **kwargs):
-                filename = local_filename if local_filename else url.split('/')[-1]
-                destination_path = os.path.join(save_dir, filename)
-                shutil.copyfile(source_tar, destination_path)
-                return destination_path
-
-            with patch.dict(os.environ, {'PYSERINI_CACHE': cache_dir}), \
-                    patch('pyserini.util.download_url', side_effect=fake_download_url):
+            with patch.dict(os.environ, {'PYSERINI_CACHE': cache_dir}), LocalHttpServer(served_dir) as server:
                 index_path = download_and_unpack_archive(
-                    'https://example.com/plain-index.tar',
+                    f'{server.url}/plain-index.tar',
                     append_md5_to_dir_name=True,
-                    md5='abc123',
+                    md5=compute_md5(source_tar),
                     verbose=False)
 
-            self.assertEqual(index_path, os.path.join(cache_dir, 'indexes', 'plain-index.abc123'))
+            self.assertEqual(index_path, os.path.join(cache_dir, 'indexes', f'plain-index.{compute_md5(source_tar)}'))
             self.assertTrue(os.path.isdir(index_path), f"Index path missing: {index_path}")
             self.assertTrue(os.path.exists(os.path.join(index_path, 'marker.txt')))
             self.assertFalse(os.path.exists(os.path.join(cache_dir, 'indexes', 'plain-index.tar')))
 
 
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files with support for single HTTP range requests, with failures injected by the tests."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with open(self.translate_path(self.path), 'rb') as f:
+            data = f.read()
+        range_header = self.headers.get('Range')
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', range_header or '')
+        if not server.support_ranges or match is None:
+            server.requests.append((0, len(data)))
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        start, end = int(match.group(1)), min(int(match.group(2)), len(data) - 1)
+        if start in server.failing_offsets:
+            self.send_error(503)
+            return
+        server.requests.append((start, end + 1))
+        body = data[start:end + 1]
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if start in server.dropping_offsets:
+            # Drop the connection halfway through the response, once.
+            server.dropping_offsets.remove(start)
+            self.wfile.write(body[:len(body) // 2])
+            return
+        self.wfile.write(body)
+
+
+class LocalHttpServer:
+    def __init__(self, directory):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), partial(RangeRequestHandler, directory=directory))
+        self.server.support_ranges = True
+        self.server.failing_offsets = set()
+        self.server.dropping_offsets = set()
+        self.server.requests = []
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.served_dir = os.path.join(self.tmp_dir, 'served')
+        os.makedirs(self.served_dir)
+        self.data = os.urandom(300_000)
+        with open(os.path.join(self.served_dir, 'data.bin'), 'wb') as f:
+            f.write(self.data)
+        self.md5 = hashlib.md5(self.data).hexdigest()
+        self.save_dir = os.path.join(self.tmp_dir, 'downloads')
+        os.makedirs(self.save_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertDownloaded(self, path):
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(sorted(os.listdir(self.save_dir)), [os.path.basename(path)])
+
+    def test_parallel_ranges(self):
+        with LocalHttpServer(self.served_dir) as server:
+            path = download_url(f'{server.url}/data.bin', self.save_dir, md5=self.md5, expected_size=len(self.data),
+                                verbose=False, connections=4, chunk_size=2**15)
+        self.assertDownloaded(path)
+        # One probe, and one request per chunk.
+        self.assertEqual(len(server.server.requests), 1 + 10)
+
+    def test_dropped_connections_are_retried(self):
+        with LocalHttpServer(self.served_dir) as server:
+            server.server.dropping_offsets.update([0, 2**15, 5 * 2**15])
+            path = download_url(f'{server.url}/data.bin', self.save_dir, md5=self.md5, verbose=False,
+                                connections=2, chunk_size=2**15)
+        self.assertDownloaded(path)
+
+    def test_resume(self):
+        with LocalHttpServer(self.served_dir) as server:
+            url = f'{server.url}/data.bin'
+            server.server.failing_offsets.add(3 * 2**15)
+            with self.assertRaises(HTTPError):
+                download_url(url, self.save_dir, md5=self.md5, verbose=False, connections=1, chunk_size=2**15)
+            self.assertTrue(os.path.exists(os.path.join(self.save_dir, 'data.bin.part')))
+
+            server.server.failing_offsets.clear()
+            server.server.requests.clear()
+            path = download_url(url, self.save_dir, md5=self.md5, verbose=False, connections=1, chunk_size=2**15)
+        self.assertDownloaded(path)
+        # The first 3 chunks are not downloaded again.
+        self.assertEqual(min(start for start, end in server.server.requests[1:]), 3 * 2**15)
+
+    def test_without_range_support(self):
+        with LocalHttpServer(self.served_dir) as server:
+            server.server.support_ranges = False
+            path = download_url(f'{server.url}/data.bin', self.save_dir, md5=self.md5, expected_size=len(self.data),
+                                verbose=False, chunk_size=2**15)
+        self.assertDownloaded(path)
+
+    def test_size_and_md5_mismatch_raise(self):
+        with LocalHttpServer(self.served_dir) as server:
+            with self.assertRaises(AssertionError):
+                download_url(f'{server.url}/data.bin', self.save_dir, expected_size=1, verbose=False)
+            with self.assertRaises(AssertionError):
+                download_url(f'{server.url}/data.bin', self.save_dir, md5='0' * 32, verbose=False)
+        self.assertEqual(os.listdir(self.save_dir), [])
+
+    def test_streaming_unpack(self):
+        source_dir = os.path.join(self.tmp_dir, 'index')
+        os.makedirs(source_dir)
+        for i in range(20):
+            with open(os.path.join(source_dir, f'part{i}.bin'), 'wb') as f:
+                f.write(os.urandom(20_000))
+        tarball = os.path.join(self.served_dir, 'index.tar.gz')
+        with tarfile.open(tarball, 'w:gz') as tar:
+            tar.add(source_dir, arcname='index')
+
+        with LocalHttpServer(self.served_dir) as server:
+            url = f'{server.url}/index.tar.gz'
+            with self.assertRaises(AssertionError):
+                download_and_unpack_archive(url, output_dir=self.save_dir, md5='0' * 32, verbose=False,
+                                            chunk_size=2**15)
+            self.assertEqual(os.listdir(self.save_dir), [])
+
+            # An interrupted download fails with its own error, and the next attempt resumes it.
+            server.server.failing_offsets.add(4 * 2**15)
+            with self.assertRaises(HTTPError):
+                download_and_unpack_archive(url, output_dir=self.save_dir, md5=compute_md5(tarball), verbose=False,
+                                            connections=1, chunk_size=2**15)
+            self.assertIn('index.tar.gz.part', os.listdir(self.save_dir))
+
+            server.server.failing_offsets.clear()
+            server.server.requests.clear()
+            index_path = download_and_unpack_archive(url, output_dir=self.save_dir, md5=compute_md5(tarball),
+                                                     expected_size=os.path.getsize(tarball), verbose=False,
+                                                     connections=3, chunk_size=2**15)
+            self.assertEqual(min(start for start, end in server.server.requests[1:]), 4 * 2**15)
+        self.assertEqual(os.listdir(self.save_dir), ['index'])
+        for i in range(20):
+            with open(os.path.join(source_dir, f'part{i}.bin'), 'rb') as f_source, \
+                    open(os.path.join(index_path, f'part{i}.bin'), 'rb') as f_index:
+                self.assertEqual(f_source.read(), f_index.read())
+
+
 class TestCacheHome(unittest.TestCase):
     def test_cache_home_uses_environment_override(self):
         with tempfile.TemporaryDirectory(prefix="cache-home-") as directory:
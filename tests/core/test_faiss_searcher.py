@@ -0,0 +1,160 @@
+#
+# Pyserini: Reproducible IR research with sparse and dense representations
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import faiss
+import numpy as np
+
+from pyserini.encode import QueryEmbeddingCache, QueryEncoder
+from pyserini.encode.optional import FaissRepresentationWriter
+from pyserini.output_writer import OutputFormat, PipelinedWriter, get_output_writer
+from pyserini.search.faiss import FaissSearcher
+
+
+class CountingQueryEncoder(QueryEncoder):
+    def __init__(self, embeddings):
+        super().__init__()
+        self.embeddings = embeddings
+        self.encoded = []
+
+    def encode(self, query: str):
+        self.encoded.append(query)
+        return self.embeddings[query]
+
+
+class TestFaissSearcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.index_dir = os.path.join(cls.tmp_dir, 'flat')
+        cls.dimension = 16
+
+        rng = np.random.default_rng(42)
+        cls.vectors = rng.standard_normal((500, cls.dimension)).astype('float32')
+        cls.queries = rng.standard_normal((8, cls.dimension)).astype('float32')
+        cls.qids = [f'q{i}' for i in range(len(cls.queries))]
+
+        writer = FaissRepresentationWriter(cls.index_dir, dimension=cls.dimension)
+        with writer:
+            for start in range(0, len(cls.vectors), 100):
+                writer.write({'id': [f'doc{i}' for i in range(start, start + 100)],
+                              'vector': cls.vectors[start:start + 100]})
+
+        cls.hnsw_index_dir = os.path.join(cls.tmp_dir, 'hnsw')
+        os.makedirs(cls.hnsw_index_dir)
+        shutil.copy(os.path.join(cls.index_dir, 'docid'), cls.hnsw_index_dir)
+        index = faiss.IndexHNSWFlat(cls.dimension, 8, faiss.METRIC_INNER_PRODUCT)
+        index.add(cls.vectors)
+        faiss.write_index(index, os.path.join(cls.hnsw_index_dir, 'index'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_docids(self):
+        searcher = FaissSearcher(self.index_dir, QueryEncoder())
+        self.assertEqual(len(searcher.docids), len(self.vectors))
+        self.assertEqual(searcher.docids[123], 'doc123')
+
+        hits = searcher.search(self.queries[:1], k=1)
+        self.assertEqual(hits[0].docid, f'doc{np.argmax(self.vectors @ self.queries[0])}')
+
+    def test_mmap(self):
+        searcher = FaissSearcher(self.index_dir, QueryEncoder())
+        mmap_searcher = FaissSearcher(self.index_dir, QueryEncoder(), mmap=True)
+        self.assertEqual(mmap_searcher.mmap_fallbacks, [])
+
+        results = searcher.batch_search(self.queries, self.qids, k=10)
+        mmap_results = mmap_searcher.batch_search(self.queries, self.qids, k=10)
+        for qid in self.qids:
+            self.assertEqual([hit.docid for hit in results[qid]], [hit.docid for hit in mmap_results[qid]])
+
+    def test_mmap_hnsw_reports_graph(self):
+        searcher = FaissSearcher(self.hnsw_index_dir, QueryEncoder(), mmap=True)
+        self.assertEqual(searcher.mmap_fallbacks, ['IndexHNSWFlat (graph)'])
+        self.assertEqual(len(searcher.search(self.queries[:1], k=5)), 5)
+
+    def test_batch_search_arrays(self):
+        searcher = FaissSearcher(self.index_dir, QueryEncoder())
+        results = searcher.batch_search(self.queries, self.qids, k=20)
+        arrays = searcher.batch_search_arrays(self.queries, k=20)
+        self.assertEqual(arrays.scores.shape, (len(self.qids), 20))
+        for row, qid in enumerate(self.qids):
+            self.assertEqual(arrays.row_docids(row), [hit.docid for hit in results[qid]])
+            self.assertEqual(arrays.row_hits(row), results[qid])
+
+        for output_format, kwargs in [(OutputFormat.TREC, {}), (OutputFormat.MSMARCO, {}),
+                                      (OutputFormat.TREC, dict(use_max_passage=True, max_passage_delimiter='c',
+                                                               max_passage_hits=5))]:
+            paths = [os.path.join(self.tmp_dir, f'run.{name}.txt') for name in ['hits', 'arrays']]
+            with get_output_writer(paths[0], output_format, max_hits=15, tag='Faiss', **kwargs) as writer:
+                for qid in self.qids:
+                    writer.write(qid, results[qid])
+            with get_output_writer(paths[1], output_format, max_hits=15, tag='Faiss', **kwargs) as writer:
+                writer.write_arrays(self.qids, *arrays)
+            with open(paths[0]) as f_hits, open(paths[1]) as f_arrays:
+                self.assertEqual(f_hits.read(), f_arrays.read())
+
+    def test_pipelined_writer(self):
+        searcher = FaissSearcher(self.index_dir, QueryEncoder())
+        batches = [(self.qids[start:start + 3], self.queries[start:start + 3]) for start in range(0, len(self.qids), 3)]
+
+        outputs = []
+        for max_pending in [0, 1, 4]:
+            path = os.path.join(self.tmp_dir, f'run.pipelined.{max_pending}.txt')
+            with get_output_writer(path, OutputFormat.TREC, max_hits=10, tag='Faiss') as writer, \
+                    PipelinedWriter(max_pending) as pipeline:
+                for i, (qids, queries) in enumerate(batches):
+                    if i % 2:
+                        pipeline.submit(writer.write_arrays, qids, *searcher.batch_search_arrays(queries, k=10))
+                    else:
+                        results = searcher.batch_search(queries, qids, k=10)
+                        pipeline.submit(lambda results: [writer.write(qid, hits) for qid, hits in results.items()],
+                                        results)
+            with open(path) as f:
+                outputs.append(f.read())
+        self.assertEqual(len(outputs[0].splitlines()), 10 * len(self.qids))
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[2], outputs[0])
+
+        # Errors on the writer thread surface in the submitting thread, and later tasks are skipped.
+        written = []
+        with self.assertRaises(ZeroDivisionError):
+            with PipelinedWriter(2) as pipeline:
+                pipeline.submit(lambda: 1 / 0)
+                pipeline.submit(written.append, 1)
+        self.assertEqual(written, [])
+
+    def test_query_cache(self):
+        encoder = CountingQueryEncoder(dict(zip(self.qids, self.queries)))
+        cache = QueryEmbeddingCache()
+        searcher = FaissSearcher(self.index_dir, encoder, query_cache=cache)
+        uncached = FaissSearcher(self.index_dir, CountingQueryEncoder(encoder.embeddings))
+
+        self.assertEqual(searcher.search('q0', k=5), uncached.search('q0', k=5))
+        results = searcher.batch_search(self.qids, self.qids, k=5)
+        self.assertEqual(results, uncached.batch_search(self.qids, self.qids, k=5))
+        self.assertEqual(searcher.search('q1', k=5), results['q1'])
+        self.assertEqual(encoder.encoded, self.qids)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,8 +17,10 @@
 import unittest
 from typing import List, Dict
 
+import numpy as np
+
 from pyserini.encode import AutoQueryEncoder
-from pyserini.search.faiss import FaissSearcher
+from pyserini.search.faiss import DenseSearchResult, FaissSearcher
 from pyserini.search.hybrid import HybridSearcher
 from pyserini.search.lucene import LuceneSearcher
 
@@ -54,5 +56,52 @@ class TestHybridSearch(unittest.TestCase):
         self.assertAlmostEqual(hits['q2'][0].score, 1.4042499542236329, places=5)
 
 
+class TestHybridFusion(unittest.TestCase):
+    def setUp(self):
+        self.dense_hits = [DenseSearchResult('d1', np.float32(0.9)), DenseSearchResult('d2', np.float32(0.5)),
+                           DenseSearchResult('d3', np.float32(0.1))]
+        self.sparse_hits = [DenseSearchResult('d3', 12.0), DenseSearchResult('d4', 8.0),
+                            DenseSearchResult('d1', 2.0)]
+
+    def test_fusion(self):
+        hits = HybridSearcher._hybrid_results(self.dense_hits, self.sparse_hits, 0.1, 10)
+        # d2 is missing from the sparse leg and d4 from the dense leg: they get that leg's min score.
+        expected = {'d1': 0.1 * 2.0 + 0.9, 'd2': 0.1 * 2.0 + 0.5, 'd3': 0.1 * 12.0 + 0.1, 'd4': 0.1 * 8.0 + 0.1}
+        self.assertEqual([hit.docid for hit in hits], ['d3', 'd1', 'd4', 'd2'])
+        for hit in hits:
+            self.assertAlmostEqual(hit.score, expected[hit.docid], places=6)
+
+        hits = HybridSearcher._hybrid_results(self.dense_hits, self.sparse_hits, 0.1, 2, normalization=True,
+                                              weight_on_dense=True)
+        self.assertEqual([hit.docid for hit in hits], ['d3', 'd4'])
+        self.assertAlmostEqual(hits[0].score, 0.5 + 0.1 * -0.5, places=6)
+
+    def test_ties_and_empty_legs(self):
+        dense_hits = [DenseSearchResult(f'd{i}', np.float32(1.0)) for i in range(5)]
+        hits = HybridSearcher._hybrid_results(dense_hits, [], 0.1, 3)
+        self.assertEqual([hit.docid for hit in hits], ['d0', 'd1', 'd2'])
+        self.assertEqual(HybridSearcher._hybrid_results([], [], 0.1, 3), [])
+
+    def test_batch_search(self):
+        class _FakeSearcher:
+            def __init__(self, scores):
+                self.scores = scores
+
+            def search(self, query, k=10):
+                return [DenseSearchResult(docid, score) for docid, score in self.scores[query]][:k]
+
+            def batch_search(self, queries, q_ids, k=10, threads=1):
+                return {qid: self.search(query, k) for query, qid in zip(queries, q_ids)}
+
+        dense_searcher = _FakeSearcher({'a': [('d1', np.float32(0.9)), ('d2', np.float32(0.5))],
+                                        'b': [('d2', np.float32(0.7))]})
+        sparse_searcher = _FakeSearcher({'a': [('d2', 10.0), ('d3', 5.0)], 'b': [('d1', 3.0)]})
+        searcher = HybridSearcher(dense_searcher, sparse_searcher)
+        hits = searcher.batch_search(['a', 'b'], ['q1', 'q2'], k=2)
+        for query, qid in [('a', 'q1'), ('b', 'q2')]:
+            self.assertEqual([(hit.docid, hit.score) for hit in hits[qid]],
+                             [(hit.docid, hit.score) for hit in searcher.search(query, k=2)])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -22,6 +22,7 @@ import shutil
 import unittest
 
 import faiss
+import numpy as np
 
 
 class TestIndexFaiss(unittest.TestCase):
@@ -94,6 +95,46 @@ class TestIndexFaiss(unittest.TestCase):
         self.assertAlmostEqual(vectors[2][0], 0.03678430616855621, places=4)
         self.assertAlmostEqual(vectors[2][-1], 0.13209162652492523, places=4)
 
+    def test_faiss_ivf_from_npy_shards(self):
+        encoded_corpus_dir = f'{self.tmp_dir}/temp_npy'
+        index_dir = f'{self.tmp_dir}/temp_ivf'
+        os.makedirs(encoded_corpus_dir)
+        vectors = np.random.default_rng(0).standard_normal((2000, 16)).astype('float32')
+        np.save(os.path.join(encoded_corpus_dir, 'embeddings-00000.npy'), vectors[:1500])
+        np.save(os.path.join(encoded_corpus_dir, 'embeddings-00001.npy'), vectors[1500:].astype('float16'))
+        with open(os.path.join(encoded_corpus_dir, 'docid'), 'w') as f:
+            f.writelines(f'doc{i}\n' for i in range(len(vectors)))
+
+        cmd = f'python -m pyserini.index.faiss \
+            --input {encoded_corpus_dir} \
+            --output {index_dir} \
+            --dim 16 \
+            --ivf \
+            --nlist 16 \
+            --train-sample 500 \
+            --add-batch-size 300 \
+            --checkpoint-every 2'
+        status = os.system(cmd)
+        self.assertEqual(status, 0)
+
+        self.assertEqual(sorted(os.listdir(index_dir)), ['docid', 'docid.offsets.npy', 'index'])
+        index = faiss.read_index(os.path.join(index_dir, 'index'))
+        self.assertEqual(index.ntotal, len(vectors))
+        self.assertEqual(index.nlist, 16)
+        self.assertTrue(np.allclose(index.reconstruct_n(0, 3), vectors[:3]))
+        self.assertTrue(np.allclose(index.reconstruct_n(1999, 1)[0], vectors[1999], atol=1e-2))
+
+    def test_faiss_rejects_hnsw_with_ivf(self):
+        encoded_corpus_dir = f'{self.tmp_dir}/temp_npy'
+        index_dir = f'{self.tmp_dir}/temp_hnsw_ivf'
+        os.makedirs(encoded_corpus_dir)
+        np.save(os.path.join(encoded_corpus_dir, 'embeddings-00000.npy'), np.zeros((10, 16), dtype='float32'))
+
+        status = os.system(f'python -m pyserini.index.faiss --input {encoded_corpus_dir} --output {index_dir} '
+                           f'--dim 16 --hnsw --ivf 2> /dev/null')
+        self.assertNotEqual(status, 0)
+        self.assertFalse(os.path.exists(index_dir))
+
     def tearDown(self):
         shutil.rmtree(self.tmp_dir)
 
@@ -14,20 +14,27 @@
 # limitations under the License.
 #
 
+import copy
 import os
+import shutil
 import tempfile
 import time
 import unittest
 import unittest.mock
 import hashlib
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 from fastapi.testclient import TestClient
 
 # Keep this test in tests/core: the REST server imports search backends including Faiss.
+from pyserini import pyclass
+from pyserini.search.faiss import DenseSearchResult, FaissSearcher
 from pyserini.server.backend import SharedSearchBackend
-from pyserini.server.errors import BadSearchRequestError
+from pyserini.server.batching import SearchBatcher
+from pyserini.server.errors import BadSearchRequestError, IndexLoadingError
 from pyserini.server.rest.app import API_VERSION, ROUTE_ERROR, app, create_app, _build_uvicorn_log_config
 from pyserini.server.utils import Bm25Config, IndexConfig
 
@@ -817,5 +824,242 @@ class TestRestBackpressure(unittest.TestCase):
             os.unlink(path)
 
 
+class _FakeFaissSearcher(FaissSearcher):
+    """Returns the query as the docid of every hit, and records the size and search arguments of each batch."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+        self.batch_kwargs = []
+        self.search_kwargs = []
+        self.query_encoder = None
+        self.encoders_loaded = []
+
+    def search(self, query, k=10, **kwargs):
+        self.search_kwargs.append(kwargs)
+        return [DenseSearchResult(query, float(k - i)) for i in range(k)]
+
+    def batch_search(self, queries, q_ids, k=10, **kwargs):
+        self.batches.append(len(queries))
+        self.batch_kwargs.append(kwargs)
+        if self.fail:
+            raise RuntimeError('batch failed')
+        return {qid: self.search(query, k) for qid, query in zip(q_ids, queries)}
+
+    def with_query_encoder(self, query_encoder, query_encoder_id=None):
+        if isinstance(query_encoder, str):
+            self.encoders_loaded.append(query_encoder)
+            query_encoder = object()
+        searcher = copy.copy(self)
+        searcher.query_encoder = query_encoder
+        return searcher
+
+
+class TestSearchBatching(unittest.TestCase):
+    def test_concurrent_searches_are_batched(self):
+        batcher = SearchBatcher(max_batch_size=8, max_wait_ms=50)
+        searcher = _FakeFaissSearcher()
+        queries = [f'q{i}' for i in range(32)]
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            results = list(executor.map(lambda query: batcher.search(searcher, query, 3), queries))
+
+        for query, hits in zip(queries, results):
+            self.assertEqual(hits, searcher.search(query, 3))
+        self.assertEqual(sum(searcher.batches), len(queries))
+        self.assertLess(len(searcher.batches), len(queries))
+        self.assertLessEqual(max(searcher.batches), 8)
+
+        stats = batcher.stats()
+        self.assertEqual(stats['queries'], len(queries))
+        self.assertEqual(stats['batches'], len(searcher.batches))
+        self.assertEqual(sum(size * count for size, count in stats['batch_sizes'].items()), len(queries))
+        self.assertGreaterEqual(stats['max_queue_time_ms'], stats['mean_queue_time_ms'])
+
+    def test_searches_with_different_hits_are_not_batched_together(self):
+        batcher = SearchBatcher(max_batch_size=4, max_wait_ms=20)
+        searcher = _FakeFaissSearcher()
+        requests = [('q0', 1), ('q1', 2), ('q2', 1), ('q3', 2)]
+        with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            results = list(executor.map(lambda request: batcher.search(searcher, *request), requests))
+        self.assertEqual([len(hits) for hits in results], [1, 2, 1, 2])
+        self.assertGreaterEqual(len(searcher.batches), 2)
+
+    def test_searches_with_different_ef_search_are_not_batched_together(self):
+        batcher = SearchBatcher(max_batch_size=4, max_wait_ms=20)
+        searcher = _FakeFaissSearcher()
+        requests = [('q0', 64), ('q1', 256), ('q2', 64), ('q3', 256)]
+        with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            list(executor.map(lambda request: batcher.search(searcher, request[0], 2, ef_search=request[1]), requests))
+        self.assertGreaterEqual(len(searcher.batches), 2)
+        self.assertEqual({kwargs['ef_search'] for kwargs in searcher.batch_kwargs}, {64, 256})
+
+    def test_batch_errors_reach_every_search(self):
+        batcher = SearchBatcher(max_batch_size=4, max_wait_ms=20)
+        searcher = _FakeFaissSearcher(fail=True)
+
+        def search(query):
+            with self.assertRaises(RuntimeError):
+                batcher.search(searcher, query, 3)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(search, ['a', 'b', 'c', 'd']))
+
+    def test_backend_batches_faiss_searches(self):
+        backend = SharedSearchBackend(search_batch_size=4, search_batch_wait_ms=20)
+        searcher = _FakeFaissSearcher()
+        config = IndexConfig(name='fake-faiss', index_type='faiss', searcher=searcher)
+        with unittest.mock.patch.object(backend, '_ensure_index', return_value=config), \
+                unittest.mock.patch.object(backend, '_bulk_fetch_and_format_documents',
+                                           side_effect=lambda docids, *args, **kwargs: {d: d for d in docids}):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                payloads = list(executor.map(lambda query: backend.search(query, 'fake-faiss', hits=2, parse=False),
+                                             ['a', 'b', 'c', 'd']))
+        self.assertEqual([payload['candidates'][0]['docid'] for payload in payloads], ['a', 'b', 'c', 'd'])
+        self.assertEqual(backend.get_search_batching_stats()['queries'], 4)
+        self.assertIsNone(SharedSearchBackend().get_search_batching_stats())
+
+    def test_metrics_report_batching_while_serving(self):
+        with TestClient(create_app(search_batch_size=4, search_batch_wait_ms=20)) as client:
+            self.assertEqual(client.get('/metrics').json()['search_batching']['queries'], 0)
+            backend = client.app.state.search_backend
+            config = IndexConfig(name='fake-faiss', index_type='faiss', searcher=_FakeFaissSearcher())
+            with unittest.mock.patch.object(backend, '_ensure_index', return_value=config), \
+                    unittest.mock.patch.object(backend, '_bulk_fetch_and_format_documents',
+                                               side_effect=lambda docids, *args, **kwargs: {d: d for d in docids}):
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    list(executor.map(lambda query: backend.search(query, 'fake-faiss', hits=2, parse=False),
+                                      ['a', 'b', 'c', 'd']))
+            response = client.get('/metrics')
+            self.assertEqual(response.status_code, 200, msg=response.text)
+            stats = response.json()['search_batching']
+            self.assertEqual(stats['queries'], 4)
+            self.assertEqual(sum(int(size) * count for size, count in stats['batch_sizes'].items()), 4)
+
+        with TestClient(create_app()) as client:
+            self.assertIsNone(client.get('/metrics').json()['search_batching'])
+
+    def test_backend_searches_with_ef_search_and_encoder_without_reopening_index(self):
+        backend = SharedSearchBackend()
+        searcher = _FakeFaissSearcher()
+        backend.indexes['fake-faiss'] = IndexConfig(name='fake-faiss', index_type='faiss', searcher=searcher,
+                                                    encoder='fake-encoder', ef_search=100)
+        backend.indexes['fake-faiss-2'] = IndexConfig(name='fake-faiss-2', index_type='faiss', searcher=searcher,
+                                                      encoder='fake-encoder')
+        for name in ('fake-faiss', 'fake-faiss-2'):
+            self.assertFalse(backend._params_require_searcher_rebuild(backend.indexes[name], encoder='other-encoder'))
+
+        with unittest.mock.patch.object(backend, '_bulk_fetch_and_format_documents',
+                                        side_effect=lambda docids, *args, **kwargs: {d: d for d in docids}):
+            backend.search('a', 'fake-faiss', hits=2, parse=False, ef_search=512)
+            self.assertEqual(searcher.search_kwargs[-1], {'ef_search': 512})
+            for name in ('fake-faiss', 'fake-faiss-2', 'fake-faiss'):
+                backend.search('b', name, hits=2, parse=False, encoder='other-encoder')
+
+        # Both indexes stay open with their own encoder; the other encoder is loaded once and shared.
+        self.assertIs(backend.indexes['fake-faiss'].searcher, searcher)
+        self.assertEqual(backend.indexes['fake-faiss'].encoder, 'fake-encoder')
+        self.assertEqual(backend.indexes['fake-faiss'].ef_search, 100)
+        self.assertEqual(searcher.encoders_loaded, ['other-encoder'])
+        encoder_searchers = [backend.indexes[name].encoder_searchers['other-encoder']
+                             for name in ('fake-faiss', 'fake-faiss-2')]
+        self.assertIs(encoder_searchers[0].query_encoder, encoder_searchers[1].query_encoder)
+        self.assertIsNone(searcher.query_encoder)
+
+
+class _FakeLoadingSearcher:
+    """Records the queries it is searched with; the docid of every hit is the query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def search(self, query, k=10, **kwargs):
+        self.queries.append(query)
+        return [DenseSearchResult(query, 1.0)]
+
+    def close(self):
+        pass
+
+
+class TestIndexPreloading(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmp_dir, 'index')
+        os.mkdir(self.index_dir)
+        self.searcher = _FakeLoadingSearcher()
+        # Opening an index blocks until the test lets it finish.
+        self.opened = threading.Event()
+
+        def build_searcher(*args, **kwargs):
+            self.opened.wait(5)
+            return self.searcher
+
+        self.build_patch = unittest.mock.patch.object(SharedSearchBackend, '_build_searcher', side_effect=build_searcher)
+        self.build_patch.start()
+
+    def tearDown(self):
+        self.opened.set()
+        self.build_patch.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_config(self, cfg):
+        path = os.path.join(self.tmp_dir, 'server.yaml')
+        with open(path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(cfg, f)
+        return path
+
+    def test_preload_and_warmup(self):
+        path = self._write_config({
+            'indexes': {'tf_alias': self.index_dir},
+            'preload': ['tf_alias'],
+            'warmup_queries': ['warm a', 'warm b'],
+        })
+        backend = SharedSearchBackend(path, no_prebuilt_indexes=True)
+        try:
+            self.assertEqual(backend.get_status('tf_alias')['load_status'], 'loading')
+            with self.assertRaises(IndexLoadingError):
+                backend.search('query', 'tf_alias', parse=False)
+
+            with unittest.mock.patch.object(pyclass, 'detach', wraps=pyclass.detach) as detach:
+                self.opened.set()
+                self.assertTrue(backend.wait_for_index_loads(timeout=5))
+            # The loader thread detaches from the JVM once the index is loaded and warmed up.
+            detach.assert_called_once()
+            status = backend.get_status('tf_alias')
+            self.assertEqual(status['load_status'], 'ready')
+            self.assertIn('warmup_time_ms', status)
+            self.assertEqual(self.searcher.queries, ['warm a', 'warm b'])
+            with unittest.mock.patch.object(backend, '_bulk_fetch_and_format_documents',
+                                            side_effect=lambda docids, *args, **kwargs: {d: d for d in docids}):
+                payload = backend.search('query', 'tf_alias', parse=False)
+            self.assertEqual(payload['candidates'][0]['docid'], 'query')
+        finally:
+            backend.close_all()
+
+    def test_preload_rejects_unconfigured_index(self):
+        path = self._write_config({'indexes': {'tf_alias': self.index_dir}, 'preload': ['other']})
+        with self.assertRaises(ValueError):
+            SharedSearchBackend(path, no_prebuilt_indexes=True)
+
+    def test_background_index_loading_returns_503(self):
+        path = self._write_config({'indexes': {'tf_alias': self.index_dir}, 'warmup_queries': []})
+        with TestClient(create_app(path, no_prebuilt_indexes=True, background_index_loading=True)) as client:
+            loading = client.get(f'/{API_VERSION}/tf_alias/search', params={'query': _REST_QUERY})
+            self.assertEqual(loading.status_code, 503, msg=loading.text)
+            self.assertIn('Retry-After', loading.headers)
+            loading = client.get(f'/{API_VERSION}/tf_alias/doc/some-docid')
+            self.assertEqual(loading.status_code, 503, msg=loading.text)
+
+            backend = client.app.state.search_backend
+            self.assertEqual(backend.get_status('tf_alias')['load_status'], 'loading')
+            self.opened.set()
+            self.assertTrue(backend.wait_for_index_loads(timeout=5))
+            self.assertEqual(backend.get_status('tf_alias')['load_status'], 'ready')
+            self.assertEqual(self.searcher.queries, [])
+            with unittest.mock.patch.object(backend, '_bulk_fetch_and_format_documents',
+                                            side_effect=lambda docids, *args, **kwargs: {d: d for d in docids}):
+                ok = client.get(f'/{API_VERSION}/tf_alias/search', params={'query': _REST_QUERY})
+            self.assertEqual(ok.status_code, 200, msg=ok.text)
+
+
 if __name__ == '__main__':
     unittest.main()
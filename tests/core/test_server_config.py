@@ -63,7 +63,7 @@ class TestServerConfigParsing(unittest.TestCase):
             }
             cfg_path.write_text(yaml.safe_dump(cfg), encoding='utf-8')
 
-            indexes, api_keys = load_server_config(str(cfg_path))
+            indexes, api_keys, _, _ = load_server_config(str(cfg_path))
 
             self.assertEqual(api_keys, ['k1'])
             self.assertIn('tf_alias', indexes)
@@ -118,6 +118,21 @@ class TestServerConfigParsing(unittest.TestCase):
             with self.assertRaises(ValueError):
                 load_server_config(str(cfg_path))
 
+    def test_parses_preload_and_warmup_queries(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg_path = Path(tmp) / 'server.yaml'
+            cfg_path.write_text(yaml.safe_dump({'preload': ['cacm', ' msmarco-v1-passage ', 'cacm']}), encoding='utf-8')
+            self.assertEqual(load_server_config(str(cfg_path))[2:], (['cacm', 'msmarco-v1-passage'], None))
+
+            cfg_path.write_text(yaml.safe_dump({'preload': ['cacm'], 'warmup_queries': []}), encoding='utf-8')
+            self.assertEqual(load_server_config(str(cfg_path))[2:], (['cacm'], []))
+            self.assertEqual(load_server_config(None), ({}, None, [], None))
+
+            for cfg in [{'preload': 'cacm'}, {'preload': ['']}, {'warmup_queries': [1]}]:
+                cfg_path.write_text(yaml.safe_dump(cfg), encoding='utf-8')
+                with self.assertRaises(ValueError):
+                    load_server_config(str(cfg_path))
+
 
 if __name__ == '__main__':
     unittest.main()